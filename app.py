@@ -1,38 +1,93 @@
+import hmac
 import json
+import mimetypes
+import click
 from os import environ as env
 from urllib.parse import quote_plus, urlencode
 from authlib.integrations.flask_client import OAuth
 from dotenv import find_dotenv, load_dotenv
-from flask import Flask, redirect, render_template, session, url_for, request, flash, jsonify
+from flask import Flask, redirect, render_template, session, url_for, request, flash, jsonify, Response, stream_with_context
 from functools import wraps
+import database
+from config import Config
+from database import use_replica
 from extensions import db
+from cache import cache, NullBackend
+from query_plans import query_log, index_report
+from monitoring import monitor, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from storage import store as document_store
+from serving import assets, send_private_file, IMMUTABLE_MAX_AGE
+from sequences import sequences
+import loadtest
+import synthetic_data
+from models import Customer, Loan, Job
+from services import finance
+from services.accrual_service import AccrualService, AccrualError
+from services.batch_emi import (prepare_inputs, invalid_scenarios, batch_emi, batch_amortization, round2,
+                                BatchTooLarge, MAX_BATCH_SCENARIOS, MAX_SCHEDULE_ROWS)
+from services.biometric_service import BiometricService, BiometricError
+from services.dashboard_service import DashboardService
+from services.job_service import job_queue
+from services.document_service import DocumentService, DocumentError, UPLOAD_CHUNK_SIZE
+from services.import_service import IMPORTERS, ImportService
+from services.loan_service import LoanService, LoanQueryError
+from services.loan_status_service import LoanStatusService
+from services.payment_service import PaymentService, PaymentError
+from services.report_service import ReportService, ReportError, date_bounds
+from services.repository import CustomerRepository, LoanRepository
+# Also keeps the dashboard rollup tables updated on every customer/loan/payment flush
+from services.rollup_service import RollupService
+from services.search_service import CustomerSearchService
+from services.serialization import dumps, stream_document
 import os
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from datetime import datetime, timedelta
 import base64
+import itertools
+import time
 import uuid
-import random
-import string
-from sqlalchemy import or_
-from dateutil.relativedelta import relativedelta
 
 # Load environment variables
 ENV_FILE = find_dotenv()
 if ENV_FILE:
     load_dotenv(ENV_FILE)
 
-app = Flask(__name__)
-app.secret_key = env.get("APP_SECRET_KEY", "dev-secret-key-for-testing")
 
-# --- DATABASE CONFIGURATION ---
-# Simple SQLite configuration for testing
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+def create_app(config_class=Config):
+    """Build the Flask application: configuration, database engines and extensions.
 
-# --- INITIALIZE DATABASE ---
-# Initialize the db object with the app
-db.init_app(app)
-# ----------------------------
+    All settings come from ``config_class`` (see config.py, which reads the
+    environment); the database engine, pool and replicas follow from
+    DATABASE_URL and DATABASE_REPLICA_URLS (see database.py).
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    if not app.config.get('ASSETS_BUILD_PATH'):
+        app.config['ASSETS_BUILD_PATH'] = os.path.join(app.instance_path, 'assets')
+
+    # --- DATABASE ---
+    database.configure(app)
+    db.init_app(app)
+    database.init_app(app, db)
+    # Slow statement log for `flask index-report`; off unless QUERY_LOG_PATH is set
+    query_log.init_app(app)
+    # Request and SQL metrics for /metrics, JSON logs, slow statement plans and the profiler
+    monitor.init_app(app)
+
+    # --- EXTENSIONS ---
+    cache.init_app(app)
+    monitor.add_collector(cache.metrics)
+    assets.init_app(app)
+    document_store.init_app(app)
+    job_queue.init_app(app)
+    sequences.init_app(app)
+
+    # Ensure upload directory exists
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    return app
+
+
+app = create_app()
 
 oauth = OAuth(app)
 
@@ -59,12 +114,59 @@ def requires_auth(f):
     return decorated
 
 
-# Add this configuration for file uploads
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+def _pagination_info(page, per_page, total):
+    """Pagination block shared by the paged customer list endpoints"""
+    pages = -(-total // per_page) if per_page > 0 else 0
+    return {
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": pages,
+        "has_next": page < pages,
+        "has_prev": page > 1
+    }
+
+
+def _customer_summary(customer):
+    """JSON fields shared by the customer lists, from a CUSTOMER_LIST_COLUMNS row"""
+    return {
+        "id": customer.id,
+        "name": customer.name,
+        "father_name": customer.father_name or "Not provided",
+        "mobile": customer.mobile,
+        "address": customer.address or "Not provided",
+    }
+
+
+def _customer_detail(customer):
+    """JSON fields of the customer search API, from a CUSTOMER_LIST_COLUMNS row"""
+    return dict(_customer_summary(customer),
+                additional_mobile=customer.additional_mobile,
+                aadhar_number=customer.aadhar_number or "Not provided",
+                pan_number=customer.pan_number or "Not provided",
+                created_at=customer.created_at)
 
-# Ensure upload directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+def _json_stream(chunks):
+    """Response streaming JSON chunks from services.serialization"""
+    return Response(stream_with_context(chunks), mimetype='application/json')
+
+
+def _server_error(e):
+    """Log an unexpected error with its traceback and return it as a JSON 500"""
+    app.logger.exception("%s %s failed", request.method, request.path)
+    return jsonify({"error": str(e)}), 500
+
+
+def _document_from_request(field, prefix):
+    """Store the document posted in ``field``, either as a file or as a finished chunked upload id."""
+    upload = request.files.get(field)
+    if upload and upload.filename:
+        return DocumentService.save_upload(upload, prefix)
+    upload_id = request.form.get(f'{field}_upload_id')
+    if upload_id:
+        return DocumentService.claim_upload(upload_id, prefix)
+    return None
 
 
 # --- ROUTES ---
@@ -158,10 +260,11 @@ def loans():
 @requires_auth
 def customers():
     """Customer management - requires login"""
-    from models import Customer  # Import model here to avoid circular dependency
     try:
-        all_customers = Customer.query.all()
+        # Only the columns the table shows
+        all_customers = CustomerRepository.list_rows()
     except Exception as e:
+        app.logger.exception("Could not list customers")
         flash(f"Error fetching customers: {e}", "danger")
         all_customers = []
     return render_template("customers.html", customers=all_customers)
@@ -178,7 +281,6 @@ def add_customer():
 @requires_auth
 def create_customer():
     """Create new customer"""
-    from models import Customer, db
 
     try:
         # Get form data
@@ -193,34 +295,16 @@ def create_customer():
         fingerprint_data = request.form.get('fingerprint_data')
 
         # Handle file uploads
-        pan_photo = request.files.get('pan_photo')
-        aadhar_photo = request.files.get('aadhar_photo')
+        pan_document = _document_from_request('pan_photo', 'pan')
+        aadhar_document = _document_from_request('aadhar_photo', 'aadhar')
 
-        pan_photo_url = None
-        aadhar_photo_url = None
+        pan_photo_url = pan_document['url'] if pan_document else None
+        aadhar_photo_url = aadhar_document['url'] if aadhar_document else None
         document_metadata = {}
-
-        if pan_photo and pan_photo.filename:
-            filename = secure_filename(f"pan_{name}_{pan_photo.filename}")
-            pan_photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            pan_photo.save(pan_photo_path)
-            pan_photo_url = f"uploads/{filename}"
-            document_metadata["pan_document"] = {
-                "filename": filename,
-                "original_name": pan_photo.filename,
-                "upload_date": str(datetime.now())
-            }
-
-        if aadhar_photo and aadhar_photo.filename:
-            filename = secure_filename(f"aadhar_{name}_{aadhar_photo.filename}")
-            aadhar_photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            aadhar_photo.save(aadhar_photo_path)
-            aadhar_photo_url = f"uploads/{filename}"
-            document_metadata["aadhar_document"] = {
-                "filename": filename,
-                "original_name": aadhar_photo.filename,
-                "upload_date": str(datetime.now())
-            }
+        if pan_document:
+            document_metadata["pan_document"] = pan_document
+        if aadhar_document:
+            document_metadata["aadhar_document"] = aadhar_document
 
         # Create new customer with corrected field names
         new_customer = Customer(
@@ -239,13 +323,25 @@ def create_customer():
         )
 
         db.session.add(new_customer)
+
+        # Scanner templates are enrolled for 1:N identification; anything
+        # else stays in fingerprint_data as before
+        if fingerprint_data:
+            try:
+                BiometricService.enroll(new_customer, fingerprint_data, request.form.get('fingerprint_finger'))
+                new_customer.fingerprint_data = None
+            except BiometricError:
+                pass
+
         db.session.commit()
+        DocumentService.queue_derivatives(pan_document, aadhar_document)
 
         flash("Customer added successfully!", "success")
         return redirect(url_for('customers'))
 
     except Exception as e:
         db.session.rollback()
+        app.logger.exception("Could not add customer")
         flash(f"Error adding customer: {str(e)}", "danger")
         return redirect(url_for('add_customer'))
 
@@ -292,9 +388,10 @@ def test_new_loan():
     return render_template("new_loan.html", userinfo={'name': 'Test User', 'picture': 'https://via.placeholder.com/40'})
 
 @app.route("/test-api/customers")
+@cache.cached(tags=('customers',), ttl=30)
+@use_replica
 def test_api_customers():
     """Test API endpoint to get all customers without authentication"""
-    from models import Customer
     
     # Get query parameters
     page = request.args.get('page', 1, type=int)
@@ -302,192 +399,52 @@ def test_api_customers():
     search_query = request.args.get('q', '')
     
     try:
-        # Base query
-        query = Customer.query
-        
-        # Apply search filter if provided
         if search_query and len(search_query) >= 3:
-            query = query.filter(
-                or_(
-                    Customer.name.ilike(f"%{search_query}%"),
-                    Customer.mobile.ilike(f"%{search_query}%"),
-                    Customer.father_name.ilike(f"%{search_query}%"),
-                    Customer.aadhar_number.ilike(f"%{search_query}%")
-                )
+            # Ranked results from the customer search index
+            customers, total = CustomerSearchService.search(
+                search_query, limit=per_page, offset=max(page - 1, 0) * per_page, with_total=True
             )
+        else:
+            # Order by creation date (newest first)
+            customers, total = CustomerRepository.page(page, per_page)
         
-        # Order by creation date (newest first)
-        query = query.order_by(Customer.created_at.desc())
-        
-        # Paginate
-        customers_pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
-        
-        customers = customers_pagination.items
-        
-        results = []
-        for customer in customers:
-            results.append({
-                "id": str(customer.id),
-                "name": customer.name,
-                "father_name": customer.father_name or "Not provided",
-                "mobile": customer.mobile,
-                "aadhar_number": customer.aadhar_number or "Not provided",
-                "address": customer.address or "Not provided",
-                "created_at": customer.created_at.isoformat() if customer.created_at else None
-            })
-
-        return jsonify({
-            "customers": results,
-            "pagination": {
-                "page": page,
-                "per_page": per_page,
-                "total": customers_pagination.total,
-                "pages": customers_pagination.pages,
-                "has_next": customers_pagination.has_next,
-                "has_prev": customers_pagination.has_prev
-            }
-        })
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    """API endpoint to get all customers with pagination and search"""
-    from models import Customer
-    
-    # Get query parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
-    search_query = request.args.get('q', '')
-    
-    try:
-        # Base query
-        query = Customer.query
-        
-        # Apply search filter if provided
-        if search_query and len(search_query) >= 3:
-            query = query.filter(
-                or_(
-                    Customer.name.ilike(f"%{search_query}%"),
-                    Customer.mobile.ilike(f"%{search_query}%"),
-                    Customer.father_name.ilike(f"%{search_query}%"),
-                    Customer.aadhar_number.ilike(f"%{search_query}%")
-                )
-            )
-        
-        # Order by creation date (newest first)
-        query = query.order_by(Customer.created_at.desc())
-        
-        # Paginate
-        customers_pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
-        
-        customers = customers_pagination.items
-        
-        results = []
-        for customer in customers:
-            results.append({
-                "id": str(customer.id),
-                "name": customer.name,
-                "father_name": customer.father_name or "Not provided",
-                "mobile": customer.mobile,
-                "aadhar_number": customer.aadhar_number or "Not provided",
-                "address": customer.address or "Not provided",
-                "created_at": customer.created_at.isoformat() if customer.created_at else None
-            })
+        def serialize(customer):
+            return dict(_customer_summary(customer),
+                        aadhar_number=customer.aadhar_number or "Not provided",
+                        created_at=customer.created_at)
 
-        return jsonify({
-            "customers": results,
-            "pagination": {
-                "page": page,
-                "per_page": per_page,
-                "total": customers_pagination.total,
-                "pages": customers_pagination.pages,
-                "has_next": customers_pagination.has_next,
-                "has_prev": customers_pagination.has_prev
-            }
-        })
+        return _json_stream(stream_document(
+            "customers", customers, serialize, pagination=_pagination_info(page, per_page, total)
+        ))
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _server_error(e)
 
 
 @app.route("/test-loans/search-customer")
+@cache.cached(tags=('customers',), ttl=30)
+@use_replica
 def test_search_customer():
     """Test API endpoint to search for customers without authentication"""
-    from models import Customer
-    query = request.args.get('q', '')
-
-    if len(query) < 3:
-        return jsonify({"error": "Query must be at least 3 characters"}), 400
-
-    try:
-        # Search for customers by name, mobile or father's name
-        customers = Customer.query.filter(
-            or_(
-                Customer.name.ilike(f"%{query}%"),
-                Customer.mobile.ilike(f"%{query}%"),
-                Customer.father_name.ilike(f"%{query}%")
-            )
-        ).limit(10).all()
-
-        results = []
-        for customer in customers:
-            results.append({
-                "id": str(customer.id),
-                "name": customer.name,
-                "father_name": customer.father_name or "Not provided",
-                "mobile": customer.mobile,
-                "address": customer.address or "Not provided"
-            })
-
-        return jsonify({"customers": results})
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    """API endpoint to search for customers (legacy endpoint for compatibility)"""
-    from models import Customer
     query = request.args.get('q', '')
 
     if len(query) < 3:
         return jsonify({"error": "Query must be at least 3 characters"}), 400
 
     try:
-        # Search for customers by name, mobile or father's name
-        customers = Customer.query.filter(
-            or_(
-                Customer.name.ilike(f"%{query}%"),
-                Customer.mobile.ilike(f"%{query}%"),
-                Customer.father_name.ilike(f"%{query}%")
-            )
-        ).limit(10).all()
-
-        results = []
-        for customer in customers:
-            results.append({
-                "id": str(customer.id),
-                "name": customer.name,
-                "father_name": customer.father_name or "Not provided",
-                "mobile": customer.mobile,
-                "address": customer.address or "Not provided"
-            })
+        # Search for customers by name, mobile, father's name or ID numbers
+        customers, _ = CustomerSearchService.search(query, limit=10)
 
-        return jsonify({"customers": results})
+        return _json_stream(stream_document("customers", customers, _customer_summary))
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _server_error(e)
 
 
 @app.route("/loans/create", methods=["POST"])
 @requires_auth
 def create_loan():
     """Create a new loan"""
-    from models import Customer, Loan
 
     try:
         # Get customer ID
@@ -506,37 +463,25 @@ def create_loan():
         surety_name = request.form.get('surety_name')
         surety_mobile = request.form.get('surety_mobile')
         surety_aadhar = request.form.get('surety_aadhar')
-        surety_photo = request.files.get('surety_photo')
 
-        # Handle bond paper upload
-        bond_paper = request.files.get('bond_paper')
-        bond_paper_url = None
+        # Handle bond paper and surety photo uploads
+        bond_document = _document_from_request('bond_paper', 'bond')
+        surety_document = _document_from_request('surety_photo', 'surety')
         document_urls = {}
 
-        if bond_paper and bond_paper.filename:
-            filename = secure_filename(f"bond_{uuid.uuid4()}_{bond_paper.filename}")
-            bond_paper_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            bond_paper.save(bond_paper_path)
-            bond_paper_url = f"uploads/{filename}"
-            document_urls["bond_paper"] = bond_paper_url
-
-        # Handle surety photo upload
+        if bond_document:
+            document_urls["bond_paper"] = bond_document['url']
         surety_photo_url = None
-        if surety_photo and surety_photo.filename:
-            filename = secure_filename(f"surety_{uuid.uuid4()}_{surety_photo.filename}")
-            surety_photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            surety_photo.save(surety_photo_path)
-            surety_photo_url = f"uploads/{filename}"
+        if surety_document:
+            surety_photo_url = surety_document['url']
             document_urls["surety_photo"] = surety_photo_url
 
         # Calculate maturity date
         disbursed_date = datetime.utcnow()
-        maturity_date = disbursed_date + relativedelta(months=int(tenure_months))
+        maturity_date = finance.maturity_date(disbursed_date, tenure_months)
 
-        # Create loan number - format: GL-YYYYMMDD-XXXX (GL=Gold Loan, followed by date and 4 random digits)
-        loan_number_prefix = f"{loan_type[0].upper()}L-{disbursed_date.strftime('%Y%m%d')}"
-        random_suffix = ''.join(random.choices(string.digits, k=4))
-        loan_number = f"{loan_number_prefix}-{random_suffix}"
+        # Loan number - format: GL-YYYYMMDD-NNNN (GL=Gold Loan, followed by date and the day's sequence)
+        loan_number = sequences.loan_number(loan_type, disbursed_date)
 
         # Store surety details in collateral_details
         collateral_details = {
@@ -558,217 +503,115 @@ def create_loan():
             disbursed_date=disbursed_date,
             maturity_date=maturity_date,
             loan_type=loan_type,
+            status='pending',
             collateral_details=collateral_details,
             document_urls=document_urls
         )
 
         db.session.add(new_loan)
+        # Ledger account with the disbursement entry, in the same transaction
+        PaymentService.open_accounts([new_loan])
         db.session.commit()
+        DocumentService.queue_derivatives(bond_document, surety_document)
 
         flash("Loan created successfully!", "success")
         return redirect(url_for('loans'))
 
     except Exception as e:
         db.session.rollback()
+        app.logger.exception("Could not create loan")
         flash(f"Error creating loan: {str(e)}", "danger")
         return redirect(url_for('new_loan'))
 
 
 @app.route("/api/loans")
 @requires_auth
+@cache.cached(tags=('loans', 'customers'), ttl=30)
+@use_replica
 def api_loans():
-    """API endpoint to get all loans"""
-    try:
-        # Query loans from the database with customer information
-        from models import Loan, Customer  # Import here to avoid circular dependency
-
-        loans_data = db.session.query(Loan, Customer) \
-            .join(Customer, Loan.customer_id == Customer.id) \
-            .all()
-
-        results = []
-        for loan, customer in loans_data:
-            # Calculate loan status (in a real app, you would have a proper status field)
-            loan_status = "active"
-            maturity_date = loan.maturity_date
-            current_date = datetime.utcnow()
-
-            if maturity_date and maturity_date < current_date:
-                # Loan has passed maturity date
-                loan_status = "completed"
-            elif loan.disbursed_date > current_date - relativedelta(months=1):
-                # Loan was recently created
-                loan_status = "pending"
-
-            # Get surety details from collateral_details if available
-            surety_name = None
-            surety_mobile = None
-            surety_aadhar = None
-            surety_photo_url = None
-
-            if loan.collateral_details and 'surety' in loan.collateral_details:
-                surety = loan.collateral_details['surety']
-                surety_name = surety.get('name')
-                surety_mobile = surety.get('mobile')
-                surety_aadhar = surety.get('aadhar')
-                surety_photo_url = surety.get('photo_url')
-
-            # Get bond paper URL from document_urls if available
-            bond_paper_url = None
-            if loan.document_urls and 'bond_paper' in loan.document_urls:
-                bond_paper_url = loan.document_urls['bond_paper']
-
-            # Create loan object
-            loan_obj = {
-                "id": str(loan.id),
-                "loan_number": loan.loan_number,
-                "customer_id": str(customer.id),
-                "customer_name": customer.name,
-                "customer_mobile": customer.mobile,
-                "customer_father_name": customer.father_name,
-                "customer_address": customer.address,
-                "principal_amount": float(loan.principal_amount),
-                "interest_rate": float(loan.interest_rate),
-                "tenure_months": loan.tenure_months,
-                "disbursed_date": loan.disbursed_date.isoformat() if loan.disbursed_date else None,
-                "maturity_date": loan.maturity_date.isoformat() if loan.maturity_date else None,
-                "loan_type": loan.loan_type,
-                "status": loan_status,
-                "surety_name": surety_name,
-                "surety_mobile": surety_mobile,
-                "surety_aadhar": surety_aadhar,
-                "surety_photo_url": surety_photo_url,
-                "bond_paper_url": bond_paper_url
-            }
-
-            results.append(loan_obj)
-
-        return jsonify({"loans": results})
+    """API endpoint to list loans with filters, sorting and cursor pagination"""
 
+    try:
+        params = LoanService.parse_args(request.args)
+        # Start the generator here so bad cursors and database errors are
+        # reported as a normal error response instead of a truncated stream
+        chunks = LoanService.stream_page(params)
+        first = next(chunks)
+    except LoanQueryError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _server_error(e)
+
+    return _json_stream(itertools.chain([first], chunks))
 
 
 @app.route("/api/dashboard/stats")
 @requires_auth
+@cache.cached(tags=('customers', 'loans', 'payments', 'stats_rollups', 'accrual_runs'))
+@use_replica
 def api_dashboard_stats():
     """API endpoint to get dashboard statistics"""
     try:
-        from models import Loan, Customer  # Import here to avoid circular dependency
-        
-        # Get basic stats
-        total_customers = db.session.query(Customer).count()
-        total_loans = db.session.query(Loan).count()
-        
-        # Calculate total disbursed amount
-        disbursed_result = db.session.query(db.func.sum(Loan.principal_amount)).scalar()
-        total_disbursed = float(disbursed_result) if disbursed_result else 0
-        
-        # Calculate active loans (loans that are not yet matured)
-        active_loans = db.session.query(Loan).filter(
-            db.or_(Loan.maturity_date > datetime.utcnow(), Loan.maturity_date.is_(None))
-        ).count()
-        
-        # Calculate estimated interest (this is a simple calculation)
-        interest_result = db.session.query(
-            db.func.sum(Loan.principal_amount * Loan.interest_rate / 100)
-        ).scalar()
-        total_interest = float(interest_result) if interest_result else 0
-        
-        # Sample monthly data (in real app, this would query actual monthly disbursements)
-        monthly_data = [
-            {'month': i, 'amount': total_disbursed / 6 + (i * 100000)} 
-            for i in range(1, 7)
-        ]
-        
-        # Sample loan types distribution
-        loan_types = [
-            {'type': 'Gold Loans', 'count': int(total_loans * 0.45), 'percentage': 45},
-            {'type': 'Personal Loans', 'count': int(total_loans * 0.25), 'percentage': 25},
-            {'type': 'Business Loans', 'count': int(total_loans * 0.20), 'percentage': 20},
-            {'type': 'Vehicle Loans', 'count': int(total_loans * 0.10), 'percentage': 10}
-        ]
-        
-        # Sample recent activity (latest 5 loans and payments)
-        recent_loans = []
-        loans_query = db.session.query(Loan, Customer).join(Customer).order_by(Loan.disbursed_date.desc()).limit(5).all()
-        for loan, customer in loans_query:
-            recent_loans.append({
-                'id': loan.loan_number,
-                'customer': customer.name,
-                'amount': float(loan.principal_amount),
-                'type': loan.loan_type.title(),
-                'date': loan.disbursed_date.isoformat() if loan.disbursed_date else (datetime.utcnow() - relativedelta(hours=2)).isoformat()
-            })
-        
-        # For payments, we would need a Payment model, so using sample data with recent dates
-        recent_payments = [
-            {
-                'id': 'P001', 
-                'customer': 'Sample Customer', 
-                'amount': 50000, 
-                'loan_id': 'L001', 
-                'date': (datetime.utcnow() - relativedelta(hours=1)).isoformat()
-            },
-            {
-                'id': 'P002', 
-                'customer': 'Another Customer', 
-                'amount': 25000, 
-                'loan_id': 'L002', 
-                'date': (datetime.utcnow() - relativedelta(hours=3)).isoformat()
-            }
-        ]
-        
-        return jsonify({
-            'total_customers': total_customers,
-            'total_disbursed': total_disbursed,
-            'total_interest': total_interest,
-            'active_loans': active_loans,
-            'customers_change': 12.5,
-            'disbursed_change': 8.3,
-            'interest_change': 15.2,
-            'loans_change': -2.1,
-            'monthlyData': monthly_data,
-            'loanTypes': loan_types,
-            'recentLoans': recent_loans,
-            'recentPayments': recent_payments
-        })
+        return jsonify(DashboardService.stats())
         
     except Exception as e:
-        print(f"Error in dashboard stats: {e}")
-        # Return sample data in case of database issues
-        return jsonify({
-            'total_customers': 1250,
-            'total_disbursed': 75000000,
-            'total_interest': 12500000,
-            'active_loans': 387,
-            'customers_change': 12.5,
-            'disbursed_change': 8.3,
-            'interest_change': 15.2,
-            'loans_change': -2.1,
-            'monthlyData': [
-                {'month': 1, 'amount': 4500000},
-                {'month': 2, 'amount': 5200000},
-                {'month': 3, 'amount': 4800000},
-                {'month': 4, 'amount': 6100000},
-                {'month': 5, 'amount': 5800000},
-                {'month': 6, 'amount': 7200000}
-            ],
-            'loanTypes': [
-                {'type': 'Gold Loans', 'count': 174, 'percentage': 45},
-                {'type': 'Personal Loans', 'count': 97, 'percentage': 25},
-                {'type': 'Business Loans', 'count': 77, 'percentage': 20},
-                {'type': 'Vehicle Loans', 'count': 39, 'percentage': 10}
-            ],
-            'recentLoans': [
-                {'id': 'L001', 'customer': 'John Doe', 'amount': 500000, 'type': 'Gold', 'date': (datetime.utcnow() - relativedelta(hours=2)).isoformat()},
-                {'id': 'L002', 'customer': 'Jane Smith', 'amount': 250000, 'type': 'Personal', 'date': (datetime.utcnow() - relativedelta(hours=5)).isoformat()}
-            ],
-            'recentPayments': [
-                {'id': 'P001', 'customer': 'Alice Johnson', 'amount': 50000, 'loan_id': 'L001', 'date': (datetime.utcnow() - relativedelta(hours=1)).isoformat()},
-                {'id': 'P002', 'customer': 'Bob Wilson', 'amount': 25000, 'loan_id': 'L002', 'date': (datetime.utcnow() - relativedelta(hours=4)).isoformat()}
-            ]
-        })
+        return _server_error(e)
+
+
+@app.route("/api/cache/stats")
+@requires_auth
+def api_cache_stats():
+    """API endpoint exposing response cache hit/miss counters"""
+    return jsonify(cache.stats())
+
+
+@app.route("/healthz")
+def healthz():
+    """Liveness probe: the worker is up and answering requests"""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    """Readiness probe: 503 unless the primary database answers and has a free pooled connection
+
+    Replicas are reported but do not fail the check.
+    """
+    checks = database.check(db)
+    ready = checks['primary']['ok']
+    return jsonify({"status": "ready" if ready else "unavailable", "databases": checks}), 200 if ready else 503
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus metrics for this process; needs METRICS_TOKEN as a bearer token when it is set"""
+    token = app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(monitor.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route("/api/monitoring/profiler", methods=["GET", "POST"])
+@requires_auth
+def api_profiler():
+    """API endpoint to start or stop the sampling profiler (POST) or read its status (GET)
+
+    GET ?format=collapsed returns the samples as collapsed stacks for flame graph tools.
+    Each worker process has its own profiler.
+    """
+    profiler = monitor.profiler
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            if data.get('enabled', True):
+                profiler.start(float(data['interval_ms']) if data.get('interval_ms') else None)
+            else:
+                profiler.stop()
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+    elif request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    return jsonify(profiler.status())
 
 
 @app.route("/api/user/profile")
@@ -802,6 +645,7 @@ def api_user_profile():
 @app.route("/api/calculators/emi", methods=["POST"])
 def api_calculate_emi():
     """API endpoint to calculate EMI"""
+
     try:
         data = request.get_json()
         
@@ -812,38 +656,15 @@ def api_calculate_emi():
         if principal <= 0 or interest_rate <= 0 or tenure_months <= 0:
             return jsonify({"error": "Invalid input values"}), 400
         
-        # Calculate EMI using the formula: EMI = [P x R x (1+R)^N] / [(1+R)^N-1]
-        monthly_rate = interest_rate / (12 * 100)
-        
-        if monthly_rate == 0:
-            emi = principal / tenure_months
-        else:
-            emi = (principal * monthly_rate * (1 + monthly_rate)**tenure_months) / ((1 + monthly_rate)**tenure_months - 1)
-        
-        total_amount = emi * tenure_months
-        total_interest = total_amount - principal
-        
-        # Generate amortization schedule
-        amortization = []
-        balance = principal
-        
-        for month in range(1, tenure_months + 1):
-            interest_payment = balance * monthly_rate
-            principal_payment = emi - interest_payment
-            balance -= principal_payment
-            
-            amortization.append({
-                'month': month,
-                'emi': round(emi, 2),
-                'principal': round(principal_payment, 2),
-                'interest': round(interest_payment, 2),
-                'balance': round(max(0, balance), 2)
-            })
+        summary = finance.loan_summary(principal, interest_rate, tenure_months)
+        amortization = finance.amortization_schedule(
+            principal, interest_rate, tenure_months, summary['emi']
+        )
         
         return jsonify({
-            'emi': round(emi, 2),
-            'total_amount': round(total_amount, 2),
-            'total_interest': round(total_interest, 2),
+            'emi': round(summary['emi'], 2),
+            'total_amount': round(summary['total_amount'], 2),
+            'total_interest': round(summary['total_interest'], 2),
             'principal': principal,
             'amortization': amortization
         })
@@ -851,62 +672,92 @@ def api_calculate_emi():
     except (ValueError, TypeError) as e:
         return jsonify({"error": "Invalid input data"}), 400
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _server_error(e)
+
+
+@app.route("/api/calculators/emi/batch", methods=["POST"])
+def api_calculate_emi_batch():
+    """API endpoint to price many EMI scenarios at once (columnar output)"""
+
+    try:
+        data = request.get_json()
+
+        principal, interest_rate, tenure_months = prepare_inputs(
+            data.get('principal', []),
+            data.get('interest_rate', []),
+            data.get('tenure_months', []),
+            grid=bool(data.get('grid', False)),
+            max_scenarios=MAX_BATCH_SCENARIOS,
+        )
+        include_schedule = bool(data.get('include_schedule', False))
+
+        if principal.size == 0:
+            return jsonify({"error": "No scenarios given"}), 400
+
+        invalid = invalid_scenarios(principal, interest_rate, tenure_months)
+        if invalid.any():
+            return jsonify({
+                "error": "Invalid input values",
+                "invalid_indices": invalid.nonzero()[0][:100].tolist()
+            }), 400
+
+        if include_schedule and int(tenure_months.sum()) > MAX_SCHEDULE_ROWS:
+            return jsonify({"error": f"Schedules would exceed {MAX_SCHEDULE_ROWS} rows"}), 400
+
+        results = batch_emi(principal, interest_rate, tenure_months)
+        response = {
+            'count': int(principal.size),
+            'principal': principal.tolist(),
+            'interest_rate': interest_rate.tolist(),
+            'tenure_months': tenure_months.tolist(),
+            'emi': round2(results['emi']).tolist(),
+            'total_amount': round2(results['total_amount']).tolist(),
+            'total_interest': round2(results['total_interest']).tolist()
+        }
+
+        if include_schedule:
+            schedule = batch_amortization(principal, interest_rate, tenure_months, results['emi'])
+            response['schedule'] = {
+                'offsets': schedule['offsets'].tolist(),
+                'month': schedule['month'].tolist(),
+                'principal': round2(schedule['principal']).tolist(),
+                'interest': round2(schedule['interest']).tolist(),
+                'balance': round2(schedule['balance']).tolist()
+            }
+
+        return jsonify(response)
+
+    except BatchTooLarge as e:
+        return jsonify({"error": str(e)}), 400
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({"error": "Invalid input data"}), 400
+    except Exception as e:
+        return _server_error(e)
 
 
 @app.route("/api/calculators/gold", methods=["POST"])
 def api_calculate_gold_loan():
     """API endpoint to calculate gold loan amount"""
+
     try:
         data = request.get_json()
         
         gold_weight = float(data.get('gold_weight', 0))
         gold_purity = float(data.get('gold_purity', 0))
-        gold_rate = float(data.get('gold_rate', 5500))  # Default gold rate per gram
-        ltv_ratio = float(data.get('ltv_ratio', 75))  # Loan to Value ratio (75% default)
+        gold_rate = float(data.get('gold_rate', finance.DEFAULT_GOLD_RATE))  # Default gold rate per gram
+        ltv_ratio = float(data.get('ltv_ratio', finance.DEFAULT_LTV_RATIO))  # Loan to Value ratio (75% default)
         
         if gold_weight <= 0 or gold_purity <= 0:
             return jsonify({"error": "Invalid gold weight or purity"}), 400
         
-        # Calculate gold value
-        gold_value = gold_weight * (gold_purity / 100) * gold_rate
-        
-        # Calculate loan amount based on LTV ratio
-        max_loan_amount = gold_value * (ltv_ratio / 100)
-        
-        # Calculate different tenure options with interest
-        tenure_options = [
-            {'months': 6, 'rate': 10.5},
-            {'months': 12, 'rate': 11.0},
-            {'months': 18, 'rate': 11.5},
-            {'months': 24, 'rate': 12.0},
-            {'months': 36, 'rate': 12.5}
-        ]
-        
-        loan_options = []
-        for option in tenure_options:
-            monthly_rate = option['rate'] / (12 * 100)
-            if monthly_rate == 0:
-                emi = max_loan_amount / option['months']
-            else:
-                emi = (max_loan_amount * monthly_rate * (1 + monthly_rate)**option['months']) / ((1 + monthly_rate)**option['months'] - 1)
-            
-            total_amount = emi * option['months']
-            total_interest = total_amount - max_loan_amount
-            
-            loan_options.append({
-                'tenure_months': option['months'],
-                'interest_rate': option['rate'],
-                'emi': round(emi, 2),
-                'total_amount': round(total_amount, 2),
-                'total_interest': round(total_interest, 2)
-            })
+        gold_value = finance.gold_value(gold_weight, gold_purity, gold_rate)
+        max_loan_amount = finance.max_loan_amount(gold_value, ltv_ratio)
         
         return jsonify({
             'gold_value': round(gold_value, 2),
             'max_loan_amount': round(max_loan_amount, 2),
             'ltv_ratio': ltv_ratio,
-            'loan_options': loan_options,
+            'loan_options': finance.tenure_options(max_loan_amount),
             'gold_details': {
                 'weight': gold_weight,
                 'purity': gold_purity,
@@ -917,14 +768,15 @@ def api_calculate_gold_loan():
     except (ValueError, TypeError) as e:
         return jsonify({"error": "Invalid input data"}), 400
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _server_error(e)
 
 
 @app.route("/api/customers/search")
 @requires_auth
+@cache.cached(tags=('customers',), ttl=30)
+@use_replica
 def api_search_customers():
     """API endpoint to search customers with pagination"""
-    from models import Customer
     
     # Get query parameters
     search_term = request.args.get('q', '')
@@ -932,62 +784,71 @@ def api_search_customers():
     per_page = request.args.get('per_page', 20, type=int)
     
     try:
-        # Base query
-        query = Customer.query
-        
-        # Apply search filter if provided
         if search_term and len(search_term) >= 2:
-            search_filter = f"%{search_term}%"
-            query = query.filter(
-                or_(
-                    Customer.name.ilike(search_filter),
-                    Customer.mobile.ilike(search_filter),
-                    Customer.father_name.ilike(search_filter),
-                    Customer.aadhar_number.ilike(search_filter),
-                    Customer.pan_number.ilike(search_filter)
-                )
+            # Ranked results from the customer search index
+            customers, total = CustomerSearchService.search(
+                search_term, limit=per_page, offset=max(page - 1, 0) * per_page, with_total=True
             )
+        else:
+            # Order by creation date (newest first)
+            customers, total = CustomerRepository.page(page, per_page)
         
-        # Order by creation date (newest first)
-        query = query.order_by(Customer.created_at.desc())
-        
-        # Paginate
-        customers_pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
-        
-        customers = customers_pagination.items
-        
-        results = []
-        for customer in customers:
-            results.append({
-                "id": str(customer.id),
-                "name": customer.name,
-                "father_name": customer.father_name or "Not provided",
-                "mobile": customer.mobile,
-                "additional_mobile": customer.additional_mobile,
-                "aadhar_number": customer.aadhar_number or "Not provided",
-                "pan_number": customer.pan_number or "Not provided",
-                "address": customer.address or "Not provided",
-                "created_at": customer.created_at.isoformat() if customer.created_at else None
-            })
+        return _json_stream(stream_document(
+            "customers", customers, _customer_detail, pagination=_pagination_info(page, per_page, total)
+        ))
 
-        return jsonify({
-            "customers": results,
-            "pagination": {
-                "page": page,
-                "per_page": per_page,
-                "total": customers_pagination.total,
-                "pages": customers_pagination.pages,
-                "has_next": customers_pagination.has_next,
-                "has_prev": customers_pagination.has_prev
-            }
-        })
+    except Exception as e:
+        return _server_error(e)
 
+
+@app.route("/api/biometrics/identify", methods=["POST"])
+@requires_auth
+def api_identify_fingerprint():
+    """Identify a customer from a captured fingerprint template (1:N search)"""
+
+    data = request.get_json(silent=True) or {}
+    if not data.get('template'):
+        return jsonify({"error": "template is required"}), 400
+
+    try:
+        candidates = BiometricService.identify(data['template'], limit=min(int(data.get('limit', 5)), 20))
+    except (BiometricError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _server_error(e)
+
+    match = candidates[0] if candidates and candidates[0]['matched'] else None
+    return jsonify({"identified": match is not None, "match": match, "candidates": candidates})
+
+
+@app.route("/api/customers/<uuid:customer_id>/fingerprints", methods=["POST"])
+@requires_auth
+def api_enroll_fingerprint(customer_id):
+    """Enroll (or replace) a fingerprint template for one of a customer's fingers"""
+
+    customer = db.session.get(Customer, customer_id)
+    if customer is None:
+        return jsonify({"error": "Customer not found"}), 404
+    data = request.get_json(silent=True) or {}
+    if not data.get('template'):
+        return jsonify({"error": "template is required"}), 400
+
+    try:
+        # Someone else already enrolled with this finger is worth a second look
+        duplicates = [
+            candidate for candidate in BiometricService.identify(data['template'], exclude_customer=customer.id)
+            if candidate['matched']
+        ]
+        record = BiometricService.enroll(customer, data['template'], data.get('finger'), data.get('quality'))
+        db.session.commit()
+    except BiometricError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return _server_error(e)
+
+    return jsonify({"id": record.id, "finger": record.finger, "possible_duplicates": duplicates}), 201
 
 
 @app.route("/payments")
@@ -997,31 +858,556 @@ def payments():
     return render_template("payments.html", userinfo=session.get('profile'))
 
 
+@app.route("/api/payments", methods=["POST"])
+@requires_auth
+def api_post_payment():
+    """API endpoint to record one payment, split into interest and principal"""
+    data = request.get_json(silent=True) or request.form.to_dict()
+
+    try:
+        posted, rejected = PaymentService.post_many([data])
+        if rejected:
+            db.session.rollback()
+            return jsonify({"error": rejected[0]['error']}), 400
+        db.session.commit()
+    except PaymentError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return _server_error(e)
+
+    return Response(dumps(posted[0]), status=201, mimetype='application/json')
+
+
+@app.route("/api/payments/bulk", methods=["POST"])
+@requires_auth
+def api_post_payments_bulk():
+    """API endpoint to post a day's receipts at once; bad or duplicate receipts are returned, not posted"""
+    data = request.get_json(silent=True) or {}
+    items = data.get('payments')
+    if not isinstance(items, list):
+        return jsonify({"error": "payments must be a list"}), 400
+
+    try:
+        posted, rejected = PaymentService.post_many(items)
+        db.session.commit()
+    except PaymentError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return _server_error(e)
+
+    return Response(dumps({
+        "posted": len(posted),
+        "rejected": len(rejected),
+        "total_amount": sum(payment['amount'] for payment in posted),
+        "payments": posted,
+        "errors": rejected,
+    }), mimetype='application/json')
+
+
+@app.route("/api/payments/summary")
+@requires_auth
+@cache.cached(tags=('loan_balances', 'stats_rollups'), ttl=60)
+@use_replica
+def api_payments_summary():
+    """API endpoint for outstanding, overdue, due-today and collection figures"""
+    try:
+        return jsonify(PaymentService.summary())
+    except Exception as e:
+        return _server_error(e)
+
+
+@app.route("/api/loans/<uuid:loan_id>/ledger")
+@requires_auth
+def api_loan_ledger(loan_id):
+    """API endpoint for a loan's position and ledger entries"""
+    loan = db.session.get(Loan, loan_id)
+    if loan is None:
+        return jsonify({"error": "Loan not found"}), 404
+
+    try:
+        position = PaymentService.position(loan)
+        entries = PaymentService.ledger(loan.id)
+        # Loans from before the ledger are opened on first view
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return _server_error(e)
+
+    return Response(dumps({
+        "position": position,
+        "entries": [{
+            "id": entry.id,
+            "type": entry.entry_type,
+            "payment_id": entry.payment_id,
+            "principal": entry.principal,
+            "interest": entry.interest,
+            "principal_balance": entry.principal_balance,
+            "effective_date": entry.effective_date,
+            "posted_at": entry.created_at,
+        } for entry in entries],
+    }), mimetype='application/json')
+
+
 @app.route("/api/reports/generate", methods=["POST"])
 @requires_auth
 def api_generate_report():
-    """API endpoint to generate reports"""
+    """API endpoint to queue report generation as a background job"""
+
     try:
         data = request.get_json()
-        report_type = data.get('report_type')
-        format_type = data.get('format', 'pdf')
+        report_type, format_type = ReportService.normalize(data.get('report_type'), data.get('format', 'csv'))
         date_range = data.get('date_range', 'month')
-        
-        # Simulate report generation
-        report_data = {
-            'report_id': f"RPT_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}",
+        date_bounds(date_range, data.get('start_date'), data.get('end_date'))
+
+        job = job_queue.submit('report', {
+            'report_type': report_type,
+            'format': format_type,
+            'date_range': date_range,
+            'start_date': data.get('start_date'),
+            'end_date': data.get('end_date')
+        }, created_by=(session.get('profile') or {}).get('userinfo', {}).get('email'))
+
+        return jsonify({
+            'job_id': str(job.id),
             'type': report_type,
             'format': format_type,
-            'status': 'generated',
-            'download_url': f"/api/reports/download/{report_type}_{datetime.utcnow().strftime('%Y%m%d')}.{format_type}",
-            'generated_at': datetime.utcnow().isoformat()
-        }
-        
-        return jsonify(report_data)
+            'status': job.status,
+            'status_url': url_for('api_job_status', job_id=job.id)
+        }), 202
         
+    except ReportError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return _server_error(e)
+
+
+@app.route("/api/reports/download/<report_id>")
+@requires_auth
+def api_download_report(report_id):
+    """API endpoint to download a generated report file"""
+
+    found = ReportService.find(app.config['REPORTS_FOLDER'], report_id)
+    if not found:
+        return jsonify({"error": "Report not found"}), 404
+
+    path, mimetype = found
+    return send_private_file(app, path, mimetype=mimetype, as_attachment=True,
+                             download_name=os.path.basename(path))
+
+
+@app.route("/api/documents/uploads", methods=["POST"])
+@requires_auth
+def api_begin_document_upload():
+    """API endpoint to start a chunked document upload"""
+    data = request.get_json() or {}
+    kind = data.get('kind')
+    if kind not in ('pan', 'aadhar', 'bond', 'surety'):
+        return jsonify({"error": "kind must be one of pan, aadhar, bond, surety"}), 400
+
+    try:
+        upload_id = DocumentService.begin_upload(kind, data.get('filename'), int(data.get('size') or 0))
+        return jsonify({
+            'upload_id': upload_id,
+            'chunk_size': UPLOAD_CHUNK_SIZE,
+            'upload_url': url_for('api_upload_document_chunk', upload_id=upload_id)
+        }), 201
+    except (DocumentError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/api/documents/uploads/<upload_id>", methods=["PUT"])
+@requires_auth
+def api_upload_document_chunk(upload_id):
+    """API endpoint to append one piece of a chunked upload.
+
+    The body is the raw bytes; ``Content-Range: bytes <start>-<end>/<total>``
+    gives their position. Pass the returned ``upload_id`` as
+    ``<field>_upload_id`` in the customer or loan form once complete.
+    """
+    content_range = request.headers.get('Content-Range', '')
+    try:
+        offset = int(content_range.split(' ', 1)[1].split('-', 1)[0])
+    except (IndexError, ValueError):
+        return jsonify({"error": "Content-Range header is required"}), 400
+
+    try:
+        received, document = DocumentService.append_chunk(upload_id, offset, request.stream)
+    except DocumentError as e:
+        return jsonify({"error": str(e)}), 409 if str(e).startswith('Expected offset') else 400
+
+    if document is None:
+        return jsonify({'upload_id': upload_id, 'received': received}), 202
+    return jsonify({'upload_id': upload_id, 'received': received, 'complete': True,
+                    'sha256': document['sha256'], 'content_type': document['content_type']}), 200
+
+
+@app.route("/documents/<name>")
+@requires_auth
+def document_file(name):
+    """A stored document, by content hash"""
+    try:
+        path = document_store.local_path(name)
+    except ValueError:
+        return jsonify({"error": "Not found"}), 404
+
+    if path is None:
+        url = document_store.url(name)
+        if url is None:
+            return jsonify({"error": "Not found"}), 404
+        return redirect(url)
+    # Content-addressed, so the bytes behind a name never change
+    response = send_private_file(app, path, mimetype=mimetypes.guess_type(name)[0], max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route("/documents/<name>/thumbnail")
+@requires_auth
+def document_thumbnail(name):
+    """Small version of a stored document for list views; the original until it is built"""
+    try:
+        thumbnail = DocumentService.derivative_name(name, 'thumb')
+        path = document_store.local_path(thumbnail)
+    except ValueError:
+        return jsonify({"error": "Not found"}), 404
+
+    if path is None:
+        if document_store.exists(thumbnail):
+            return redirect(document_store.url(thumbnail))
+        return redirect(url_for('document_file', name=name))
+    return send_private_file(app, path, mimetype='image/jpeg', max_age=IMMUTABLE_MAX_AGE)
+
+
+@app.route("/api/imports", methods=["POST"])
+@requires_auth
+def api_import_data():
+    """API endpoint to upload a customer or loan file (CSV/JSONL) for bulk import"""
+
+    # Raise the upload limit for this endpoint only
+    request.max_content_length = app.config['IMPORT_MAX_CONTENT_LENGTH']
+
+    kind = request.form.get('kind')
+    upload = request.files.get('file')
+    if kind not in IMPORTERS:
+        return jsonify({"error": f"kind must be one of {', '.join(IMPORTERS)}"}), 400
+    if not upload or not upload.filename:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    extension = os.path.splitext(upload.filename)[1].lower()
+    if extension not in ('.csv', '.jsonl', '.ndjson'):
+        return jsonify({"error": "File must be .csv or .jsonl"}), 400
+
+    try:
+        os.makedirs(app.config['IMPORTS_FOLDER'], exist_ok=True)
+        filename = secure_filename(f"{kind}_{uuid.uuid4().hex}{extension}")
+        path = os.path.join(app.config['IMPORTS_FOLDER'], filename)
+        upload.save(path)
+
+        job = job_queue.submit('import', {'kind': kind, 'path': path},
+                               created_by=(session.get('profile') or {}).get('userinfo', {}).get('email'))
+        return jsonify({
+            'job_id': str(job.id),
+            'kind': kind,
+            'status': job.status,
+            'status_url': url_for('api_job_status', job_id=job.id)
+        }), 202
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _server_error(e)
+
+
+@app.route("/api/jobs", methods=["POST"])
+@requires_auth
+def api_submit_job():
+    """API endpoint to queue a maintenance job (status refresh, rollup rebuild)"""
+    data = request.get_json() or {}
+    kind = data.get('kind')
+
+    if kind not in ('refresh_loan_statuses', 'rebuild_rollups'):
+        return jsonify({"error": f"Unknown job kind: {kind}"}), 400
+
+    try:
+        job = job_queue.submit(kind, created_by=(session.get('profile') or {}).get('userinfo', {}).get('email'))
+        return jsonify({
+            'job_id': str(job.id),
+            'status': job.status,
+            'status_url': url_for('api_job_status', job_id=job.id)
+        }), 202
+    except Exception as e:
+        return _server_error(e)
+
+
+@app.route("/api/jobs/<uuid:job_id>")
+@requires_auth
+def api_job_status(job_id):
+    """API endpoint to poll a background job's status and progress"""
+
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    data = job.to_dict()
+    if job.kind == 'report' and job.status == 'succeeded' and job.result:
+        data['download_url'] = url_for('api_download_report', report_id=job.result['report_id'])
+    return jsonify(data)
+
+
+@app.cli.command("db-upgrade")
+@click.option("--to", "target", help="Stop after this revision (default: apply all).")
+def db_upgrade_command(target):
+    """Apply pending schema migrations."""
+    import migrations
+
+    applied = migrations.upgrade(target=target)
+    print(f"{len(applied)} migration(s) applied" if applied else "Database schema is up to date")
+
+
+@app.cli.command("db-status")
+def db_status_command():
+    """List schema migrations and whether each has been applied."""
+    import migrations
+
+    for migration in migrations.status():
+        applied_at = migration['applied_at']
+        state = f"applied {applied_at:%Y-%m-%d %H:%M}" if applied_at else "pending"
+        print(f"{migration['revision']}  {state:<24} {migration['description']}")
+
+
+@app.cli.command("index-report")
+@click.argument("log_path", type=click.Path(exists=True, dir_okay=False), required=False)
+@click.option("--min-rows", default=1000, show_default=True, help="Ignore scans of tables smaller than this.")
+def index_report_command(log_path, min_rows):
+    """Explain logged queries and report those that scan or sort without an index."""
+
+    log_path = log_path or app.config['QUERY_LOG_PATH']
+    if not log_path:
+        raise click.UsageError("Pass a query log or set QUERY_LOG_PATH")
+
+    with db.engine.connect() as connection:
+        report = index_report(log_path, connection, min_rows=min_rows)
+
+    for entry in report:
+        print(f"\n{entry['calls']} call(s), {entry['total_ms']:.0f} ms total, {entry['max_ms']:.0f} ms max")
+        print(f"  {' '.join(entry['statement'].split())[:300]}")
+        if entry.get('error'):
+            print(f"  could not explain: {entry['error']}")
+        for finding in entry['findings']:
+            print(f"  {finding['problem']} of {finding['table']} ({finding['rows']} rows): {finding['detail']}")
+            if finding['suggested_index']:
+                print(f"    consider: {finding['suggested_index']}")
+    print(f"\n{len(report)} statement(s) need attention" if report else "No unindexed scans or sorts found")
+
+
+@app.cli.command("seed-synthetic")
+@click.option("--scale", type=click.Choice(list(synthetic_data.SCALES)), default="10k", show_default=True,
+              help="Number of loans; half as many customers.")
+@click.option("--seed", default=42, show_default=True, help="Same seed, same data.")
+@click.option("--as-of", type=click.DateTime(formats=["%Y-%m-%d"]),
+              help=f"Date the book is generated up to.  [default: {synthetic_data.AS_OF}]")
+def seed_synthetic_command(scale, seed, as_of):
+    """Fill an empty database with deterministic synthetic customers, loans and payments for benchmarks."""
+    started = time.perf_counter()
+    try:
+        counts = synthetic_data.generate(
+            scale, seed, as_of.date() if as_of else synthetic_data.AS_OF,
+            progress=lambda table, rows: print(f"{rows} {table}", end="\r", flush=True),
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    print(", ".join(f"{count} {table}" for table, count in counts.items())
+          + f" generated in {time.perf_counter() - started:.0f}s")
+
+
+@app.cli.command("benchmark")
+@click.option("--scenario", "scenarios", type=click.Choice(list(loadtest.SCENARIOS)), multiple=True,
+              help="Scenario to run; repeat for several.  [default: all]")
+@click.option("--url", help="Base URL of a running server, e.g. http://localhost:8000.  [default: in-process]")
+@click.option("--cookie", help="Cookie header for --url, e.g. a signed-in session cookie.")
+@click.option("--requests", "count", default=500, show_default=True, help="Measured requests per scenario.")
+@click.option("--warmup", default=50, show_default=True, help="Unmeasured requests sent first.")
+@click.option("--concurrency", default=4, show_default=True, help="Concurrent clients.")
+@click.option("--seed", default=1, show_default=True, help="Same seed, same requests.")
+@click.option("--no-cache", is_flag=True, help="Bypass the response cache (in-process only).")
+@click.option("--save", type=click.Path(dir_okay=False), help="Write the results as a baseline JSON file.")
+@click.option("--compare", "baseline", type=click.Path(exists=True, dir_okay=False),
+              help="Fail if a scenario regressed against this baseline.")
+@click.option("--tolerance", default=loadtest.DEFAULT_TOLERANCE, show_default=True,
+              help="Allowed p95 rise or throughput drop, as a fraction.")
+def benchmark_command(scenarios, url, cookie, count, warmup, concurrency, seed, no_cache, save, baseline, tolerance):
+    """Load-test the API with repeatable scenarios; report throughput and latency percentiles.
+
+    Seed a database first with `flask seed-synthetic`. Against a server
+    (--url) use the production WSGI setup; in-process runs measure the
+    app and database without the network.
+    """
+    if url:
+        headers = {'Cookie': cookie} if cookie else {}
+        make_client = lambda: loadtest.HttpClient(url, headers)
+    else:
+        make_client = lambda: loadtest.AppClient(app)
+
+    backend = cache.backend
+    if no_cache and not url:
+        cache.backend = NullBackend()
+    results = {
+        'environment': loadtest.environment(
+            url or 'in-process', requests=count, warmup=warmup, concurrency=concurrency,
+            seed=seed, cache=not no_cache,
+            database=db.engine.dialect.name, open_loans=LoanRepository.open_count() if not url else None,
+        ),
+        'scenarios': {},
+    }
+    try:
+        for scenario in scenarios or loadtest.SCENARIOS:
+            print(f"{scenario}...", end="\r", flush=True)
+            results['scenarios'][scenario] = loadtest.run_scenario(
+                scenario, make_client, requests=count, concurrency=concurrency, warmup=warmup, seed=seed,
+            )
+    finally:
+        cache.backend = backend
+
+    print(loadtest.format_table(results))
+    if save:
+        loadtest.save(results, save)
+        print(f"Results saved to {save}")
+    if baseline:
+        previous = loadtest.load(baseline)
+        for name, (current, was) in loadtest.differing_settings(results, previous).items():
+            print(f"Warning: {name} is {current}, the baseline was run with {was}")
+        regressions = loadtest.compare(results, previous, tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise click.ClickException(f"{len(regressions)} regression(s) against {baseline}")
+        print(f"No regressions against {baseline}")
+
+
+@app.cli.command("job-worker")
+def job_worker_command():
+    """Run background jobs from the jobs table (for JOB_BACKEND=database)."""
+    print(f"Job worker started with pools {job_queue.pools}")
+    job_queue.work_forever()
+
+
+@app.cli.command("import-data")
+@click.argument("kind", type=click.Choice(["customers", "loans"]))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=5000, show_default=True, help="Rows per insert transaction.")
+@click.option("--restart", is_flag=True, help="Ignore the checkpoint and import the file from the start.")
+def import_data_command(kind, path, batch_size, restart):
+    """Bulk import customers or loans from a CSV/JSONL file, resuming after interruptions."""
+
+    def progress(rows):
+        print(f"{rows} rows processed", end="\r", flush=True)
+
+    summary = ImportService.run(path, kind, batch_size=batch_size, restart=restart, progress=progress)
+    print(f"Imported {summary['inserted']} {kind}, {summary['failed']} row(s) rejected"
+          + (f" (resumed after row {summary['resumed_from']})" if summary['resumed_from'] else ""))
+    if summary['errors_file']:
+        print(f"Rejected rows are listed in {path}.errors.jsonl")
+
+
+@app.cli.command("migrate-documents")
+def migrate_documents_command():
+    """Move uploads referenced from customers and loans into the document store."""
+    rewritten, missing = DocumentService.migrate_legacy()
+    print(f"{rewritten} document reference(s) moved into the store, {missing} file(s) missing")
+
+
+@app.cli.command("documents-gc")
+@click.option("--grace", default=3600, show_default=True, help="Keep files written in the last N seconds.")
+def documents_gc_command(grace):
+    """Delete stored documents that no customer or loan refers to."""
+    removed = DocumentService.collect_garbage(grace_seconds=grace)
+    print(f"{removed} unreferenced object(s) removed")
+
+
+@app.cli.command("rebuild-fingerprint-index")
+def rebuild_fingerprint_index_command():
+    """Load every enrolled fingerprint template and report the index size."""
+
+    started = datetime.now()
+    count = BiometricService.refresh_index(force=True)
+    print(f"{count} fingerprint template(s) indexed in {(datetime.now() - started).total_seconds():.1f}s")
+
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Recompute the dashboard rollup tables from loans, payments and customers."""
+
+    RollupService.rebuild()
+    print("Dashboard rollups rebuilt")
+
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    """Create and repopulate the customer search index."""
+
+    CustomerSearchService.rebuild_index()
+    print("Customer search index rebuilt")
+
+
+@app.cli.command("open-loan-accounts")
+@click.option("--batch-size", default=1000, show_default=True, help="Loans per transaction.")
+def open_loan_accounts_command(batch_size):
+    """Open ledger accounts for loans that have none, replaying their completed payments."""
+    opened = 0
+    while True:
+        loans = PaymentService.loans_without_account(batch_size)
+        if not loans:
+            break
+        PaymentService.open_accounts(loans)
+        db.session.commit()
+        opened += len(loans)
+        print(f"{opened} account(s) opened", end="\r", flush=True)
+    print(f"{opened} loan account(s) opened")
+
+
+@app.cli.command("accrue-interest")
+@click.option("--date", "through", type=click.DateTime(formats=["%Y-%m-%d"]),
+              help="Last business date to accrue.  [default: yesterday]")
+@click.option("--chunk-size", default=50000, show_default=True, help="Loans per transaction.")
+def accrue_interest_command(through, chunk_size):
+    """Accrue daily and penal interest for open loans (run nightly from cron; safe to re-run).
+
+    Catches up every business date since the last run, resuming an
+    interrupted one from its checkpoint.
+    """
+    through = through.date() if through else datetime.utcnow().date() - timedelta(days=1)
+    dates = AccrualService.pending_dates(through)
+    if not dates:
+        print(f"Interest is already accrued through {through}")
+    for business_date in dates:
+        try:
+            run = AccrualService.accrue(
+                business_date,
+                penal_rate=app.config['PENAL_INTEREST_RATE'],
+                grace_days=app.config['PENAL_GRACE_DAYS'],
+                chunk_size=chunk_size,
+                progress=lambda count: print(f"{business_date}: {count} loan(s) accrued", end="\r", flush=True),
+            )
+        except AccrualError as e:
+            raise click.ClickException(str(e))
+        print(f"{business_date}: {run.loans_accrued} loan(s), interest {float(run.interest_total):.2f}, "
+              f"penal interest {float(run.penal_interest_total):.2f}")
+
+    missing = len(PaymentService.loans_without_account(1))
+    if missing:
+        print("Some loans have no ledger account and were not accrued; run `flask open-loan-accounts`")
+
+
+@app.cli.command("refresh-loan-statuses")
+def refresh_loan_statuses_command():
+    """Apply scheduled loan status transitions (run daily from cron)."""
+
+    moved = LoanStatusService.refresh_statuses()
+    for status, count in moved.items():
+        print(f"{count} loan(s) moved to {status}")
 
 
+# Development server; production runs under gunicorn with gunicorn.conf.py
 if __name__ == '__main__':
     app.run(host="localhost", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,236 @@
+"""
+Async (ASGI) variants of the read-heavy JSON endpoints.
+
+Customer search autocomplete and dashboard polling send many small requests
+that spend nearly all their time waiting on the database, and under
+gunicorn each of them holds a worker thread for that time. This ASGI app
+serves the same endpoints from an event loop on async engines (asyncpg or
+aiosqlite), so one process keeps thousands of them in flight, bounded by
+its connection pool rather than by threads:
+
+    /api/customers/search        /test-loans/search-customer
+    /api/dashboard/stats         /api/loans
+
+Run it beside the WSGI app and route those paths to it at the proxy:
+
+    pip install -r requirements-async.txt
+    uvicorn async_api:app --port 8001
+
+Each request runs inside a Flask request context for the matching route,
+so the session cookie, before/after request hooks (metrics, access log,
+request id), the response cache and url_for behave as they do for the
+Flask views, and responses and ETags are identical. The queries go
+through AsyncSession.run_sync, which runs the services' usual session code
+over the async connection: the database waits are awaited, not blocked on.
+/healthz, /readyz and /metrics report on this process.
+
+This process never writes, so it only learns of invalidations through a
+shared cache: unless CACHE_TYPE is 'redis' its response cache is off
+(NullBackend) rather than serving entries that outlive their data.
+"""
+import random
+import time
+
+from flask import abort, jsonify, make_response, redirect, request, session, Response
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from werkzeug.exceptions import HTTPException
+
+import database
+from app import app as flask_app, _customer_detail, _customer_summary, _pagination_info, _server_error, metrics
+from cache import cache, NullBackend
+from extensions import db
+from monitoring import monitor
+from services.dashboard_service import DashboardService
+from services.loan_service import LoanService, LoanQueryError
+from services.repository import CustomerRepository
+from services.search_service import CustomerSearchService
+from services.serialization import stream_document
+
+
+async def search_customers(db_session, args):
+    """Async /api/customers/search"""
+    search_term = args.get('q', '')
+    page = args.get('page', 1, type=int)
+    per_page = args.get('per_page', 20, type=int)
+
+    if search_term and len(search_term) >= 2:
+        customers, total = await db_session.run_sync(lambda sync_session: CustomerSearchService.search(
+            search_term, limit=per_page, offset=max(page - 1, 0) * per_page, with_total=True,
+            session=sync_session,
+        ))
+    else:
+        customers, total = await db_session.run_sync(
+            lambda sync_session: CustomerRepository.page(page, per_page, session=sync_session)
+        )
+    return _json(stream_document(
+        "customers", customers, _customer_detail, pagination=_pagination_info(page, per_page, total)
+    ))
+
+
+async def test_search_customer(db_session, args):
+    """Async /test-loans/search-customer"""
+    query = args.get('q', '')
+    if len(query) < 3:
+        return jsonify({"error": "Query must be at least 3 characters"}), 400
+
+    customers, _ = await db_session.run_sync(
+        lambda sync_session: CustomerSearchService.search(query, limit=10, session=sync_session)
+    )
+    return _json(stream_document("customers", customers, _customer_summary))
+
+
+async def dashboard_stats(db_session, args):
+    """Async /api/dashboard/stats"""
+    return jsonify(await db_session.run_sync(DashboardService.stats))
+
+
+async def loans(db_session, args):
+    """Async /api/loans"""
+    try:
+        params = LoanService.parse_args(args)
+        # The page is small, so it is built whole; bad cursors only fail here
+        chunks = await db_session.run_sync(
+            lambda sync_session: list(LoanService.stream_page(params, session=sync_session))
+        )
+    except LoanQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    return _json(chunks)
+
+
+# path: (view, signed in only, cache tags, cache ttl), as on the Flask views
+ROUTES = {
+    '/api/customers/search': (search_customers, True, ('customers',), 30),
+    '/test-loans/search-customer': (test_search_customer, False, ('customers',), 30),
+    '/api/dashboard/stats': (dashboard_stats, True, ('customers', 'loans', 'payments', 'stats_rollups', 'accrual_runs'), None),
+    '/api/loans': (loans, True, ('loans', 'customers'), 30),
+}
+
+
+def _json(chunks):
+    # Marked as streamed, like the Flask views' responses, so it gets the same ETag
+    return Response(iter(chunks), mimetype='application/json')
+
+
+class AsyncApi:
+    """The ASGI application; engines are created on lifespan startup (or the first request)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.engine = None
+        self.replicas = []
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            if self.engine is None:
+                self._start()
+            await self._http(scope, send)
+
+    def _start(self):
+        if self.app.config.get('CACHE_TYPE') != 'redis':
+            cache.backend = NullBackend()
+        self.engine, self.replicas = database.create_async_engines(self.app, db)
+        for engine in [self.engine] + self.replicas:
+            monitor.instrument(engine.sync_engine)
+        # Searches here assume the index exists rather than creating it on first use
+        with self.app.app_context():
+            CustomerSearchService.create_index()
+
+    async def _stop(self):
+        for engine in [self.engine] + self.replicas:
+            if engine is not None:
+                await engine.dispose()
+        self.engine, self.replicas = None, []
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    self._start()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self._stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, send):
+        headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']]
+        host = next((value for name, value in headers if name.lower() == 'host'), None)
+        server = scope.get('server') or ('localhost', 80)
+        context = self.app.test_request_context(
+            scope['path'],
+            base_url=f"{scope.get('scheme', 'http')}://{host or f'{server[0]}:{server[1]}'}{scope.get('root_path', '')}",
+            method=scope['method'],
+            query_string=scope.get('query_string', b'').decode('latin-1'),
+            headers=headers,
+            environ_base={'REMOTE_ADDR': (scope.get('client') or ('', 0))[0]},
+        )
+        # The context is this task's own, so concurrent requests do not see each other's
+        with context:
+            try:
+                response = self.app.preprocess_request()
+                if response is None:
+                    response = await self._dispatch(scope)
+                response = self.app.process_response(make_response(response))
+            except HTTPException as e:
+                # The app's own error handlers and pages, as for the Flask views
+                response = self.app.process_response(make_response(self.app.handle_user_exception(e)))
+            except Exception as e:
+                response = make_response(_server_error(e))
+            await self._send(send, response, include_body=scope['method'] != 'HEAD')
+
+    async def _dispatch(self, scope):
+        path = scope['path']
+        if path == '/healthz':
+            return jsonify({"status": "ok"})
+        if path == '/readyz':
+            return await self._ready()
+        if path == '/metrics':
+            return metrics()
+
+        route = ROUTES.get(path)
+        if route is None:
+            abort(404)
+        if scope['method'] not in ('GET', 'HEAD'):
+            abort(405, valid_methods=['GET', 'HEAD'])
+        view, signed_in_only, tags, ttl = route
+        if signed_in_only and 'profile' not in session:
+            session['next_url'] = request.url
+            return redirect('/login')
+
+        key, response = cache.lookup(tags)
+        if response is not None:
+            return response
+        # Reads go to a replica when there are any; this process never writes
+        engine = random.choice(self.replicas) if self.replicas else self.engine
+        async with AsyncSession(engine) as db_session:
+            response = make_response(await view(db_session, request.args))
+        return cache.store(key, response, ttl)
+
+    async def _ready(self):
+        started = time.perf_counter()
+        try:
+            async with self.engine.connect() as connection:
+                await connection.execute(text('SELECT 1'))
+        except Exception as e:
+            return jsonify({"status": "unavailable", "error": str(e)}), 503
+        return jsonify({"status": "ready", "latency_ms": round((time.perf_counter() - started) * 1000, 2)})
+
+    @staticmethod
+    async def _send(send, response, include_body=True):
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': response.get_data() if include_body else b''})
+
+
+app = AsyncApi(flask_app)
@@ -0,0 +1,304 @@
+"""
+Response cache for the AGV Secure application.
+
+Cached entries are grouped under tags named after database tables. Entries are
+keyed by the current version of each tag they depend on, so invalidating a tag
+is a single counter bump; stale entries are never read again and simply age
+out of the LRU or expire. Tags are bumped automatically after any commit that
+wrote to the matching table.
+
+Streamed responses are not stored, as that would mean buffering the whole
+body. Their ETag is derived from the cache key (and so the tag versions) and
+the current TTL period instead of the body, so a client that already has the
+page still gets a 304 before the view runs.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+
+from flask import request, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """In-process LRU with per-entry TTL. Each worker process has its own copy."""
+
+    versioned = True
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def version(self, tag):
+        return self._versions[tag]
+
+    def bump(self, tag):
+        with self._lock:
+            self._versions[tag] += 1
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shared cache in a Redis-compatible server, so every worker sees invalidations."""
+
+    prefix = 'agv:cache:'
+    versioned = True
+
+    def __init__(self, url):
+        import redis  # Optional dependency, only needed for CACHE_TYPE=redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def version(self, tag):
+        return int(self._client.get(f'{self.prefix}version:{tag}') or 0)
+
+    def bump(self, tag):
+        self._client.incr(f'{self.prefix}version:{tag}')
+
+    def size(self):
+        return None
+
+
+class NullBackend:
+    """Disables caching while keeping ETag handling for stored (non-streamed) responses."""
+
+    # Versions never change, so they cannot vouch for a streamed response
+    versioned = False
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def version(self, tag):
+        return 0
+
+    def bump(self, tag):
+        pass
+
+    def size(self):
+        return 0
+
+
+class ResponseCache:
+    def __init__(self, app=None):
+        self.backend = MemoryBackend()
+        self.default_ttl = 60
+        self.counters = defaultdict(int)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Pick the backend from CACHE_TYPE (memory, redis or null)."""
+        cache_type = app.config.get('CACHE_TYPE', 'memory')
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', 60)
+
+        if cache_type == 'redis':
+            self.backend = RedisBackend(app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+        elif cache_type == 'null':
+            self.backend = NullBackend()
+        else:
+            self.backend = MemoryBackend(app.config.get('CACHE_MAX_ENTRIES', 2048))
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            try:
+                self.backend.bump(tag)
+                self.counters['invalidations'] += 1
+            except Exception as e:
+                self.counters['errors'] += 1
+                logger.warning("Cache invalidation failed for %s: %s", tag, e)
+
+    def stats(self):
+        lookups = self.counters['hits'] + self.counters['misses']
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.counters['hits'],
+            'misses': self.counters['misses'],
+            'not_modified': self.counters['not_modified'],
+            'invalidations': self.counters['invalidations'],
+            'errors': self.counters['errors'],
+            'hit_ratio': round(self.counters['hits'] / lookups, 3) if lookups else 0.0,
+            'entries': self.backend.size(),
+        }
+
+    def metrics(self):
+        """Counters for /metrics, as monitoring collector families."""
+        backend = type(self.backend).__name__
+        families = [
+            (f'cache_{name}_total', 'counter', f'Response cache {name.replace("_", " ")}.',
+             [({'backend': backend}, self.counters[name])])
+            for name in ('hits', 'misses', 'not_modified', 'invalidations', 'errors')
+        ]
+        size = self.backend.size()
+        if size is not None:
+            families.append(('cache_entries', 'gauge', 'Entries in the response cache.', [({'backend': backend}, size)]))
+        return families
+
+    def _key(self, tags):
+        query = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        versions = ','.join(f'{tag}:{self.backend.version(tag)}' for tag in sorted(tags))
+        return f'{request.path}?{query}|{versions}'
+
+    def _stream_etag(self, key, ttl):
+        """ETag of a streamed response: the same until a tag changes or the TTL period ends."""
+        if key is None or not self.backend.versioned:
+            return None
+        period = int(time.time() // (ttl or self.default_ttl))
+        return hashlib.sha1(f'{key}|{period}'.encode()).hexdigest()
+
+    @staticmethod
+    def _validated(response, etag):
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def _respond(self, entry):
+        """Build a 200 from a cached entry, or a bodiless 304 if the client already has it."""
+        if entry['etag'] in request.if_none_match:
+            self.counters['not_modified'] += 1
+            response = make_response('', 304)
+        else:
+            response = make_response(entry['body'])
+            response.mimetype = entry['mimetype']
+        return self._validated(response, entry['etag'])
+
+    def lookup(self, tags, ttl=None):
+        """The current request's cache key and cached response (None on a miss).
+
+        The response is a 304 when the client sends the ETag of a streamed
+        response that is still current. The key is None when the cache
+        cannot be reached; the response is then built as if caching were off.
+        """
+        try:
+            key = self._key(tags)
+            entry = self.backend.get(key)
+        except Exception as e:
+            # A broken cache must never take the endpoint down with it
+            self.counters['errors'] += 1
+            logger.warning("Cache lookup failed: %s", e)
+            return None, None
+
+        if entry is not None:
+            self.counters['hits'] += 1
+            return key, self._respond(entry)
+        stream_etag = self._stream_etag(key, ttl)
+        if stream_etag is not None and stream_etag in request.if_none_match:
+            self.counters['hits'] += 1
+            self.counters['not_modified'] += 1
+            return key, self._validated(make_response('', 304), stream_etag)
+        self.counters['misses'] += 1
+        return key, None
+
+    def store(self, key, response, ttl=None):
+        """Cache a successful ``response`` under ``key``; returns the response to send.
+
+        Streamed responses are sent as they are, with only an ETag added.
+        """
+        if key is None or response.status_code != 200:
+            return response
+        if response.is_streamed:
+            stream_etag = self._stream_etag(key, ttl)
+            return self._validated(response, stream_etag) if stream_etag else response
+
+        body = response.get_data(as_text=True)
+        entry = {
+            'etag': hashlib.sha1(body.encode()).hexdigest(),
+            'mimetype': response.mimetype,
+            'body': body,
+        }
+        try:
+            self.backend.set(key, entry, ttl or self.default_ttl)
+        except Exception as e:
+            self.counters['errors'] += 1
+            logger.warning("Cache store failed: %s", e)
+        return self._respond(entry)
+
+    def cached(self, tags, ttl=None):
+        """Cache successful responses of a GET view until ``tags`` change or ``ttl`` expires."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key, response = self.lookup(tags, ttl)
+                if response is not None:
+                    return response
+                return self.store(key, make_response(view(*args, **kwargs)), ttl)
+
+            return wrapper
+
+        return decorator
+
+
+cache = ResponseCache()
+
+
+# --- INVALIDATION ---
+# Tags are table names. Writes are collected per session and only invalidate
+# once the transaction commits, so rolled-back work never evicts anything.
+
+@event.listens_for(Session, 'after_flush')
+def _collect_written_tables(session, flush_context):
+    tables = session.info.setdefault('cache_tags', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tablename = getattr(obj, '__tablename__', None)
+        if tablename:
+            tables.add(tablename)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_writes(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements skip the flush, e.g. status
+    # transitions and imports
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            orm_execute_state.session.info.setdefault('cache_tags', set()).add(mapper.local_table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    tables = session.info.pop('cache_tags', None)
+    if tables:
+        cache.invalidate(*tables)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('cache_tags', None)
@@ -4,18 +4,60 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-class Config:
-    # Database Configuration
-    DATABASE_URL = os.environ.get('DATABASE_URL')
-    if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
-        DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://')
+def _pairs(value):
+    """Parse "key=value,key=value" environment settings into a dict."""
+    return dict(item.split('=', 1) for item in (value or '').split(',') if '=' in item)
+
 
-    SQLALCHEMY_DATABASE_URI = DATABASE_URL
+class Config:
+    # Database Configuration: DATABASE_URL (PostgreSQL in production), SQLite file otherwise
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_pre_ping': True,
-        'pool_recycle': 300,
-    }
+    # Overrides for the engine options database.py derives from the URL
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+
+    # PostgreSQL connection pool, per process (web workers x pool size must fit max_connections)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 5))
+    # Server-side timeouts; background jobs use JOB_STATEMENT_TIMEOUT_MS instead
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    DB_LOCK_TIMEOUT_MS = int(os.environ.get('DB_LOCK_TIMEOUT_MS', 10000))
+    DB_IDLE_IN_TRANSACTION_TIMEOUT_MS = int(os.environ.get('DB_IDLE_IN_TRANSACTION_TIMEOUT_MS', 60000))
+
+    # Overrides for the SQLite pragmas in database.SQLITE_PRAGMAS
+    SQLITE_PRAGMAS = {}
+
+    # Read replicas for @use_replica views, comma separated; a user's reads stay
+    # on the primary for DATABASE_REPLICA_LAG seconds after they write
+    DATABASE_REPLICA_URLS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+    DATABASE_REPLICA_LAG = float(os.environ.get('DATABASE_REPLICA_LAG', 2.0))
+
+    # Loan/payment numbers each worker reserves at a time; unused ones are skipped when it stops
+    NUMBER_BLOCK_SIZE = int(os.environ.get('NUMBER_BLOCK_SIZE', 20))
+
+    # Nightly `flask accrue-interest`: penal interest (% a year) on instalments more than the grace days past due
+    PENAL_INTEREST_RATE = float(os.environ.get('PENAL_INTEREST_RATE', 2.0))
+    PENAL_GRACE_DAYS = int(os.environ.get('PENAL_GRACE_DAYS', 0))
+
+    # Slow statement log read by `flask index-report`
+    QUERY_LOG_PATH = os.environ.get('QUERY_LOG_PATH')
+    QUERY_LOG_MIN_MS = float(os.environ.get('QUERY_LOG_MIN_MS', 20))
+    QUERY_LOG_PARAMETERS = os.environ.get('QUERY_LOG_PARAMETERS') == '1'  # Logs customer data
+
+    # Logging: one JSON object per line ('json') or plain text ('text')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    # Prometheus /metrics; when METRICS_TOKEN is set scrapers must send it as a bearer token
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Statements at least this slow are logged with their plan; 0 turns the log off
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 500))
+    SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '1') != '0'
+    # Sampling profiler for requests, also started and stopped via /api/monitoring/profiler
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED') == '1'
+    PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', 10))
 
     # Auth0 Configuration
     AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN')
@@ -23,11 +65,59 @@ class Config:
     AUTH0_CLIENT_SECRET = os.environ.get('AUTH0_CLIENT_SECRET')
 
     # Security
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-change-in-production'
+    SECRET_KEY = os.environ.get('APP_SECRET_KEY') or os.environ.get('SECRET_KEY') or 'dev-secret-key-for-testing'
 
     # File Upload Settings
     UPLOAD_FOLDER = 'static/uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    DOCUMENT_MAX_SIZE = int(os.environ.get('DOCUMENT_MAX_SIZE', 64 * 1024 * 1024))  # Per document, via the chunked upload API
+    # Static assets get content-hashed URLs and precompressed variants; turn off while editing assets
+    ASSETS_HASHED_URLS = os.environ.get('ASSETS_HASHED_URLS', '1') != '0'
+    ASSETS_BUILD_PATH = os.environ.get('ASSETS_BUILD_PATH')  # Default: <instance>/assets
+
+    # Let the front proxy send private files: 'x-accel-redirect' (nginx) or 'x-sendfile'
+    SENDFILE_BACKEND = os.environ.get('SENDFILE_BACKEND')
+    USE_X_SENDFILE = SENDFILE_BACKEND == 'x-sendfile'
+    # nginx internal locations, as "directory=/location/,..."
+    X_ACCEL_LOCATIONS = _pairs(os.environ.get('X_ACCEL_LOCATIONS'))  # e.g. {'documents': '/_protected/documents/'}
+
+    # Content-addressed document store: 'local' or 's3' (any S3-compatible endpoint)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    STORAGE_PATH = os.environ.get('STORAGE_PATH', 'documents')
+    STORAGE_S3_BUCKET = os.environ.get('STORAGE_S3_BUCKET')
+    STORAGE_S3_PREFIX = os.environ.get('STORAGE_S3_PREFIX', '')
+    STORAGE_S3_ENDPOINT_URL = os.environ.get('STORAGE_S3_ENDPOINT_URL')  # MinIO or other S3-compatible server
+    STORAGE_S3_REGION = os.environ.get('STORAGE_S3_REGION')
+    # Generated reports contain customer data, so they live outside static/
+    REPORTS_FOLDER = os.environ.get('REPORTS_FOLDER', 'reports')
+    # Uploaded bulk import files; these may be far larger than document photos
+    IMPORTS_FOLDER = os.environ.get('IMPORTS_FOLDER', 'imports')
+    IMPORT_MAX_CONTENT_LENGTH = int(os.environ.get('IMPORT_MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
+
+    # Response cache: 'memory' (per process), 'redis' (shared) or 'null'
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'memory')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', 60))
+
+    # Background jobs: 'thread' runs them in the web process, 'database' leaves
+    # them for 'flask job-worker' processes. JOB_POOLS is "pool=threads,...";
+    # heavy jobs (reports, imports) only use the heavy pool and thumbnail
+    # rendering only the media pool
+    JOB_BACKEND = os.environ.get('JOB_BACKEND', 'thread')
+    JOB_POOLS = {name: int(size) for name, size in _pairs(os.environ.get('JOB_POOLS', 'default=2,heavy=1,media=2')).items()}
+    JOB_STATEMENT_TIMEOUT_MS = int(os.environ.get('JOB_STATEMENT_TIMEOUT_MS', 0))  # 0 = no limit
+    # A running job not heard from in JOB_LEASE_SECONDS is re-queued, up to JOB_MAX_ATTEMPTS runs in all
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 120))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+
+    # Fingerprint identification: match threshold (cosine similarity) and
+    # index partitioning; the in-memory index is fully rebuilt this often
+    BIOMETRIC_MATCH_THRESHOLD = float(os.environ.get('BIOMETRIC_MATCH_THRESHOLD', 0.8))
+    BIOMETRIC_PARTITIONS = int(os.environ.get('BIOMETRIC_PARTITIONS', 64))
+    BIOMETRIC_PROBE_PARTITIONS = int(os.environ.get('BIOMETRIC_PROBE_PARTITIONS', 12))
+    BIOMETRIC_REBUILD_SECONDS = int(os.environ.get('BIOMETRIC_REBUILD_SECONDS', 3600))
+    # Ids below the highest indexed one re-read on every refresh, for enrolments committed out of id order
+    BIOMETRIC_REFRESH_WINDOW = int(os.environ.get('BIOMETRIC_REFRESH_WINDOW', 256))
 
     # Environment
-    DEBUG = os.environ.get('FLASK_ENV') == 'development'
\ No newline at end of file
+    DEBUG = os.environ.get('FLASK_ENV') == 'development'
@@ -0,0 +1,302 @@
+"""
+Database engine setup for the AGV Secure application.
+
+configure() picks engine options for the configured database before
+``db.init_app``:
+
+* PostgreSQL gets a sized connection pool with pre-ping, LIFO reuse and
+  recycling, plus server-side statement, lock and idle-in-transaction
+  timeouts sent as connection options.
+* SQLite gets WAL journaling, a busy timeout and the pragmas in
+  SQLITE_PRAGMAS, applied to every new connection.
+
+Read replicas listed in DATABASE_REPLICA_URLS become ``replica_N`` binds.
+Views decorated with @use_replica send their plain SELECTs to one of them;
+writes, flushes and everything else always go to the primary. A user's
+last write time is kept in their session cookie, so their own reads stay
+on the primary until the replicas have caught up with it.
+
+check() pings each database, without queueing for a pooled connection,
+for the readiness endpoint. create_async_engines() builds the matching
+async engines for the async read endpoints.
+"""
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial, wraps
+
+from flask import current_app, g, has_app_context, has_request_context
+from flask import session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import FromStatement
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.selectable import TextualSelect
+
+DEFAULT_DATABASE_URI = 'sqlite:///test.db'
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',     # Durable across app crashes; fsyncs at checkpoints only in WAL mode
+    'foreign_keys': 'ON',
+    'busy_timeout': 5000,        # ms to wait for the write lock instead of failing at once
+    'cache_size': -65536,        # KiB (64 MB) of page cache per connection
+    'temp_store': 'MEMORY',
+    'mmap_size': 268435456,
+}
+
+# Seconds after a user writes during which their reads stay on the primary,
+# so a request right after a save does not miss it on a lagging replica
+DEFAULT_REPLICA_LAG = 2.0
+
+# Session cookie key holding the time of the user's last write
+LAST_WRITE_KEY = 'db_last_write'
+
+# Async drivers by backend, for the async read endpoints (async_api.py)
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+_SELECT_TEXT = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+_statement_timeout = ContextVar('statement_timeout', default=None)
+
+
+def database_uri(uri):
+    """The configured URI with Heroku-style postgres:// fixed up; SQLite when unset."""
+    uri = uri or DEFAULT_DATABASE_URI
+    if uri.startswith('postgres://'):
+        uri = uri.replace('postgres://', 'postgresql://', 1)
+    return uri
+
+
+def engine_options(uri, config):
+    """Pool and connection settings for one database URL."""
+    backend = make_url(uri).get_backend_name()
+    if backend == 'postgresql':
+        timeouts = _postgres_timeouts(config)
+        return {
+            'pool_size': config.get('DB_POOL_SIZE', 10),
+            'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+            'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+            'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+            'pool_pre_ping': True,
+            # Reuse the most recent connection so idle ones can time out server-side
+            'pool_use_lifo': True,
+            'connect_args': {
+                'connect_timeout': config.get('DB_CONNECT_TIMEOUT', 5),
+                'application_name': config.get('DB_APPLICATION_NAME', 'agv-secure'),
+                'options': ' '.join(f'-c {name}={value}' for name, value in timeouts.items()),
+            },
+        }
+    if backend == 'sqlite':
+        return {'connect_args': {'check_same_thread': False}}
+    return {'pool_pre_ping': True}
+
+
+def _postgres_timeouts(config):
+    return {
+        'statement_timeout': config.get('DB_STATEMENT_TIMEOUT_MS', 30000),
+        'lock_timeout': config.get('DB_LOCK_TIMEOUT_MS', 10000),
+        'idle_in_transaction_session_timeout': config.get('DB_IDLE_IN_TRANSACTION_TIMEOUT_MS', 60000),
+    }
+
+
+def async_database_uri(url):
+    """The database URL with an async driver: asyncpg for PostgreSQL, aiosqlite for SQLite."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == 'postgresql' and url.get_driver_name() == 'psycopg':
+        return url  # psycopg 3 has its own async mode
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver is known for {backend}")
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+def create_async_engines(app, db):
+    """Async engines for the primary and each replica bind: (primary, [replicas]).
+
+    They connect to the same databases as the sync engines ``db.init_app``
+    created, with the same pool sizes, timeouts and SQLite pragmas. Needs
+    the async driver and greenlet installed.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine  # Optional: only the async endpoints need it
+
+    config = app.config
+    pragmas = dict(SQLITE_PRAGMAS, **(config.get('SQLITE_PRAGMAS') or {}))
+
+    def create(sync_engine):
+        url = async_database_uri(sync_engine.url)
+        options = engine_options(sync_engine.url, config)
+        if url.get_backend_name() == 'sqlite':
+            options.pop('connect_args', None)
+        elif url.get_driver_name() == 'asyncpg':
+            # asyncpg takes server settings rather than libpq options
+            options['connect_args'] = {
+                'timeout': config.get('DB_CONNECT_TIMEOUT', 5),
+                'server_settings': dict(
+                    {name: str(value) for name, value in _postgres_timeouts(config).items()},
+                    application_name=config.get('DB_APPLICATION_NAME', 'agv-secure'),
+                ),
+            }
+        engine = create_async_engine(url, **options)
+        if url.get_backend_name() == 'sqlite':
+            event.listen(engine.sync_engine, 'connect', _sqlite_connect(pragmas, url.database))
+        return engine
+
+    with app.app_context():
+        engines = db.engines
+        replicas = [create(engine) for key, engine in engines.items() if key and key.startswith('replica_')]
+        return create(engines[None]), replicas
+
+
+def configure(app):
+    """Set the database URI, engine options and replica binds; call before ``db.init_app``.
+
+    Options in SQLALCHEMY_ENGINE_OPTIONS override the computed ones.
+    """
+    config = app.config
+    uri = database_uri(config.get('SQLALCHEMY_DATABASE_URI'))
+    config['SQLALCHEMY_DATABASE_URI'] = uri
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(engine_options(uri, config), **(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}))
+
+    binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+    for number, replica_uri in enumerate(config.get('DATABASE_REPLICA_URLS') or [], 1):
+        replica_uri = database_uri(replica_uri)
+        binds[f'replica_{number}'] = dict(engine_options(replica_uri, config), url=replica_uri)
+    config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_app(app, db):
+    """Install per-connection settings on the engines ``db.init_app`` created."""
+    pragmas = dict(SQLITE_PRAGMAS, **(app.config.get('SQLITE_PRAGMAS') or {}))
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', _sqlite_connect(pragmas, engine.url.database))
+            elif engine.dialect.name == 'postgresql':
+                event.listen(engine, 'begin', _postgres_begin)
+            # Workers forked from a preloaded app (gunicorn) must not share the parent's
+            # connections; close=False leaves them open for the parent
+            os.register_at_fork(after_in_child=partial(engine.dispose, close=False))
+
+
+def check(db):
+    """Ping every engine's database; returns {name: {'ok', 'latency_ms', 'pool', 'error'}}.
+
+    An engine whose pool has no connection to spare fails at once rather
+    than waiting DB_POOL_TIMEOUT for one. Call inside an app context.
+    """
+    results = {}
+    for name, engine in db.engines.items():
+        pool = engine.pool
+        result = {'ok': False}
+        if hasattr(pool, 'overflow'):
+            max_overflow = getattr(pool, '_max_overflow', -1)
+            result['pool'] = {'size': pool.size(), 'checked_out': pool.checkedout(),
+                              'overflow': max(pool.overflow(), 0)}
+            if max_overflow >= 0 and pool.checkedout() >= pool.size() + max_overflow:
+                result['error'] = 'connection pool exhausted'
+                results[name or 'primary'] = result
+                continue
+        started = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            result['ok'] = True
+        except Exception as e:
+            result['error'] = str(e)
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        results[name or 'primary'] = result
+    return results
+
+
+def _sqlite_connect(pragmas, database):
+    in_memory = database in (None, '', ':memory:')
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if name == 'journal_mode' and in_memory:
+                continue
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return on_connect
+
+
+def _postgres_begin(connection):
+    timeout = _statement_timeout.get()
+    if timeout is not None:
+        # SET LOCAL ends with the transaction, so pooled connections keep their defaults
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+
+
+@contextmanager
+def statement_timeout(milliseconds):
+    """Override the PostgreSQL statement timeout (0 = none) for transactions begun inside the block."""
+    token = _statement_timeout.set(milliseconds)
+    try:
+        yield
+    finally:
+        _statement_timeout.reset(token)
+
+
+def use_replica(view):
+    """Let a read-only view's SELECTs run on a read replica when one is configured."""
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        g.db_use_replica = True
+        return view(*args, **kwargs)
+    return decorated
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends reads from @use_replica views to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and self._reads_from_replica(clause):
+            replica = self._replica()
+            if replica is not None:
+                return replica
+        if self._flushing or (clause is not None and not self._is_read(clause)):
+            self._record_write()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    @staticmethod
+    def _record_write():
+        # Wall clock time, as the next request may be served by another process or host
+        if has_app_context():
+            g.db_last_write = time.time()
+            if has_request_context():
+                flask_session[LAST_WRITE_KEY] = g.db_last_write
+
+    @staticmethod
+    def _last_write():
+        last_write = g.get('db_last_write', 0.0)
+        if has_request_context():
+            last_write = max(last_write, flask_session.get(LAST_WRITE_KEY, 0.0))
+        return last_write
+
+    @staticmethod
+    def _is_read(clause):
+        if isinstance(clause, (FromStatement, TextualSelect)):
+            # select(Model).from_statement(...) and text(...).columns(...): the wrapped statement decides
+            clause = clause.element
+        if isinstance(clause, Select):
+            return clause._for_update_arg is None
+        return getattr(clause, 'text', None) is not None and bool(_SELECT_TEXT.match(clause.text))
+
+    def _reads_from_replica(self, clause):
+        if not has_app_context() or not g.get('db_use_replica') or clause is None:
+            return False
+        lag = current_app.config.get('DATABASE_REPLICA_LAG', DEFAULT_REPLICA_LAG)
+        return self._is_read(clause) and time.time() - self._last_write() > lag
+
+    def _replica(self):
+        # One replica per request, so its reads see a consistent snapshot
+        if 'db_replica' not in g:
+            replicas = [key for key in self._db.engines if key and key.startswith('replica_')]
+            g.db_replica = random.choice(replicas) if replicas else None
+        return self._db.engines[g.db_replica] if g.db_replica else None
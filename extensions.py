@@ -4,5 +4,7 @@ This module contains the SQLAlchemy database instance to avoid circular imports.
 """
 from flask_sqlalchemy import SQLAlchemy
 
-# Initialize the database instance
-db = SQLAlchemy()
\ No newline at end of file
+from database import RoutingSession
+
+# Initialize the database instance; the session routes @use_replica reads to replicas
+db = SQLAlchemy(session_options={'class_': RoutingSession})
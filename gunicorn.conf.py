@@ -0,0 +1,93 @@
+"""
+Production server settings for gunicorn, which reads this file from the
+working directory:
+
+    pip install -r requirements.txt
+    gunicorn                    # serves app:app on WEB_BIND (default 0.0.0.0:8000)
+
+The master imports the app once (preload_app) and forks the workers from
+it, so they start with warm imports and share its memory pages; each
+worker opens its own database connections after the fork. Each worker
+serves WEB_THREADS requests at a time (gthread), which suits views that
+mostly wait on the database. Without overrides there are 2 x CPUs + 1
+workers, counting only the CPUs this process may use (affinity and cgroup
+quota), and as many threads as one worker's connection pool can serve,
+up to DEFAULT_THREADS. With WEB_DB_CONNECTIONS set, workers are capped so
+that workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) fits within it.
+
+Stopping or restarting is graceful: workers stop accepting connections and
+get WEB_GRACEFUL_TIMEOUT seconds to finish requests in flight, long enough
+for a large upload. To deploy new code without dropping requests (HUP
+alone would reuse the preloaded code):
+
+    kill -USR2 <master pid>     # new master and workers on the new code, same socket
+    kill -TERM <old master pid> # once they are up; old workers finish their requests
+
+Workers are also replaced gracefully after WEB_MAX_REQUESTS requests
+(with jitter, so they do not all restart together). Load balancers should
+poll /readyz, which fails when the database or its pool cannot serve.
+Background jobs in JOB_BACKEND=thread run inside the workers and are cut
+off when one exits (they are retried once their JOB_LEASE_SECONDS lease
+lapses); use the database backend with `flask job-worker` here.
+"""
+import math
+import multiprocessing
+import os
+
+from config import Config
+
+DEFAULT_THREADS = 4
+
+
+def cpu_count():
+    """CPUs this process may run on: its affinity mask, capped by a cgroup v2 CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = multiprocessing.cpu_count()
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as quota_file:
+            quota, period = quota_file.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def _setting(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+_pool_capacity = Config.DB_POOL_SIZE + Config.DB_MAX_OVERFLOW
+_workers = 2 * cpu_count() + 1
+if os.environ.get('WEB_DB_CONNECTIONS'):
+    _workers = min(_workers, int(os.environ['WEB_DB_CONNECTIONS']) // _pool_capacity)
+
+wsgi_app = 'app:app'
+bind = os.environ.get('WEB_BIND', f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+worker_class = 'gthread'
+workers = _setting('WEB_WORKERS', max(_workers, 1))
+threads = _setting('WEB_THREADS', min(DEFAULT_THREADS, _pool_capacity))
+preload_app = True
+
+# Seconds a worker may go without checking in before it is killed and replaced
+timeout = _setting('WEB_TIMEOUT', 60)
+graceful_timeout = _setting('WEB_GRACEFUL_TIMEOUT', 120)
+keepalive = _setting('WEB_KEEPALIVE', 5)
+max_requests = _setting('WEB_MAX_REQUESTS', 5000)
+max_requests_jitter = max_requests // 10
+
+# Heartbeat files on tmpfs, so a slow disk cannot get workers killed
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# Requests are logged by the app (JSON, with timings); X-Forwarded-* are trusted from these proxies
+accesslog = None
+errorlog = '-'
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+
+def when_ready(server):
+    server.log.info("Serving %s on %s with %d worker(s) x %d thread(s)", wsgi_app, bind, workers, threads)
@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 """
 Database initialization script for AGV Secure application.
-Creates all database tables based on the models.
+Brings the schema up to date by applying pending migrations (see
+migrations/); existing data is kept.
 """
 
+import migrations
 from app import app
 from extensions import db
-from models import Customer, Loan, Payment
+from services.search_service import CustomerSearchService
 
 
 def init_database():
@@ -15,14 +17,13 @@ def init_database():
         try:
             print("Starting database initialization...")
 
-            # For development: Drop all tables to recreate with new schema
-            print("⚠️  Dropping existing tables to update schema...")
-            db.drop_all()
-            print("✅ Dropped existing tables")
+            # Create missing tables and apply schema changes without dropping data
+            applied = migrations.upgrade()
+            print(f"✅ {len(applied)} migration(s) applied" if applied else "✅ Database schema is up to date")
 
-            # Create all tables with new schema
-            db.create_all()
-            print("✅ Database tables created successfully!")
+            # Build the customer search index (FTS5 on SQLite, trigram on Postgres) if it is missing
+            CustomerSearchService.create_index()
+            print("✅ Customer search index ready")
 
             # Print table information
             inspector = db.inspect(db.engine)
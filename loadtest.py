@@ -0,0 +1,276 @@
+"""
+Repeatable load scenarios for the HTTP API, with saved baselines.
+
+A scenario is a request mix against one part of the API (the loan list,
+the dashboard, customer search, the calculators, or all of them). Its
+requests are drawn from a seeded generator using the same name lists as
+synthetic_data.py, so two runs with the same seed send the same requests in
+the same order. run() sends them from ``concurrency`` worker threads, each
+with a keep-alive connection, either to a running server (``base_url``) or
+in-process through the Flask test client, and reports throughput, latency
+percentiles and failures per scenario.
+
+Results can be saved as a JSON baseline and later runs compared against
+it: a scenario regresses when its p95 latency rises, or its throughput
+falls, by more than the tolerance.
+"""
+import http.client
+import json
+import platform
+import random
+import statistics
+import subprocess
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from synthetic_data import FIRST_NAMES, SURNAMES
+
+PERCENTILES = (50, 90, 95, 99)
+DEFAULT_TOLERANCE = 0.2
+
+
+def _loans(rng):
+    query = {'limit': rng.choice((20, 20, 50, 100))}
+    if rng.random() < 0.4:
+        query['status'] = rng.choice(('active', 'overdue', 'pending', 'completed'))
+    if rng.random() < 0.3:
+        query['loan_type'] = rng.choice(('gold', 'personal', 'business'))
+    if rng.random() < 0.2:
+        query['sort'] = rng.choice(('principal_amount', 'loan_number'))
+        query['order'] = rng.choice(('asc', 'desc'))
+    return 'GET', '/api/loans?' + '&'.join(f'{key}={value}' for key, value in query.items()), None
+
+
+def _dashboard(rng):
+    return 'GET', '/api/dashboard/stats', None
+
+
+def _search(rng):
+    term = rng.choice((
+        rng.choice(FIRST_NAMES),
+        rng.choice(SURNAMES),
+        f'{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}',
+        rng.choice(SURNAMES)[:3],
+        f"{rng.choice('6789')}{rng.randrange(1000):03d}",
+    ))
+    return 'GET', f'/api/customers/search?q={term.replace(" ", "+")}&page={rng.choice((1, 1, 1, 2))}&per_page=20', None
+
+
+def _calculators(rng):
+    kind = rng.random()
+    if kind < 0.5:
+        return 'POST', '/api/calculators/emi', {
+            'principal': rng.randrange(10_000, 500_000, 500),
+            'interest_rate': rng.choice((10.5, 11, 12, 14, 16)),
+            'tenure_months': rng.choice((6, 12, 18, 24, 36)),
+        }
+    if kind < 0.9:
+        return 'POST', '/api/calculators/gold', {
+            'gold_weight': round(rng.uniform(5, 200), 1),
+            'gold_purity': rng.choice((75, 83.3, 91.6, 99.9)),
+        }
+    return 'POST', '/api/calculators/emi/batch', {
+        'principal': [rng.randrange(10_000, 500_000, 500) for _ in range(20)],
+        'interest_rate': [10.5, 12, 14],
+        'tenure_months': [12, 24],
+        'grid': True,
+    }
+
+
+# name: [(request factory, weight)]
+SCENARIOS = {
+    'loans': [(_loans, 1)],
+    'dashboard': [(_dashboard, 1)],
+    'search': [(_search, 1)],
+    'calculators': [(_calculators, 1)],
+    'mixed': [(_loans, 4), (_search, 3), (_dashboard, 2), (_calculators, 1)],
+}
+
+
+def build_requests(scenario, count, seed):
+    """The scenario's first ``count`` requests for ``seed``: (method, path, JSON body) tuples."""
+    rng = random.Random(f'{seed}:{scenario}')
+    factories = [factory for factory, _ in SCENARIOS[scenario]]
+    weights = [weight for _, weight in SCENARIOS[scenario]]
+    return [rng.choices(factories, weights)[0](rng) for _ in range(count)]
+
+
+class HttpClient:
+    """One keep-alive connection to a running server."""
+
+    def __init__(self, base_url, headers=None, timeout=30):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=timeout)
+        self.prefix = parts.path.rstrip('/')
+        self.headers = dict(headers or {})
+
+    def request(self, method, path, body):
+        headers = dict(self.headers)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.connection.request(method, self.prefix + path, payload, headers)
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            # Reconnect on the next request
+            self.connection.close()
+            raise
+
+
+class AppClient:
+    """In-process requests through the Flask test client, signed in as a benchmark user."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['profile'] = {'name': 'benchmark'}
+
+    def request(self, method, path, body):
+        response = self.client.open(path, method=method, json=body, buffered=True)
+        response.close()
+        return response.status_code
+
+
+def _percentile(sorted_values, percent):
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    return statistics.quantiles(sorted_values, n=100, method='inclusive')[percent - 1]
+
+
+def summarize(latencies, failures, elapsed):
+    """Throughput (requests/s) and latency percentiles (ms) for one scenario."""
+    ordered = sorted(latencies)
+    summary = {
+        'requests': len(latencies),
+        'failures': failures,
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+    if ordered:
+        summary['mean_ms'] = round(statistics.fmean(ordered) * 1000, 2)
+        for percent in PERCENTILES:
+            summary[f'p{percent}_ms'] = round(_percentile(ordered, percent) * 1000, 2)
+        summary['max_ms'] = round(ordered[-1] * 1000, 2)
+    return summary
+
+
+def run_scenario(scenario, make_client, requests=500, concurrency=4, warmup=50, seed=1):
+    """Send the scenario's requests from ``concurrency`` threads; returns its summary.
+
+    The first ``warmup`` requests are sent the same way but not measured.
+    A response with status 400 or above, or a connection error, counts as
+    a failure and its latency is not included.
+    """
+    plan = build_requests(scenario, warmup + requests, seed)
+    lock = threading.Lock()
+    latencies, failures = [], [0]
+    clients = [make_client() for _ in range(concurrency)]
+    measuring = threading.Event()
+
+    def worker(client, positions):
+        while True:
+            with lock:
+                index = next(positions, None)
+            if index is None:
+                return
+            method, path, body = plan[index]
+            started = time.perf_counter()
+            try:
+                ok = client.request(method, path, body) < 400
+            except Exception:
+                ok = False
+            latency = time.perf_counter() - started
+            if measuring.is_set():
+                with lock:
+                    if ok:
+                        latencies.append(latency)
+                    else:
+                        failures[0] += 1
+
+    def run_phase(start, stop):
+        positions = iter(range(start, stop))
+        threads = [threading.Thread(target=worker, args=(client, positions)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    run_phase(0, warmup)
+    measuring.set()
+    started = time.perf_counter()
+    run_phase(warmup, warmup + requests)
+    return summarize(latencies, failures[0], time.perf_counter() - started)
+
+
+def environment(target, **settings):
+    """Where and how the run happened, stored with the results."""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                  text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        revision = None
+    return dict(
+        settings,
+        target=target,
+        revision=revision,
+        python=platform.python_version(),
+        machine=platform.machine(),
+        finished_at=datetime.utcnow().isoformat(timespec='seconds'),
+    )
+
+
+def save(results, path):
+    with open(path, 'w') as handle:
+        json.dump(results, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+
+
+def load(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+# Settings that must match for a comparison to mean anything
+COMPARABLE_SETTINGS = ('target', 'database', 'requests', 'concurrency', 'seed', 'cache')
+
+
+def differing_settings(results, baseline):
+    """Run settings that differ between ``results`` and ``baseline``, as {name: (current, baseline)}."""
+    current, previous = results['environment'], baseline.get('environment', {})
+    return {
+        name: (current.get(name), previous.get(name))
+        for name in COMPARABLE_SETTINGS if current.get(name) != previous.get(name)
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Regressions of ``results`` against ``baseline``, as readable lines (empty when none)."""
+    regressions = []
+    for scenario, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(scenario)
+        if not previous:
+            continue
+        if current.get('failures', 0) > previous.get('failures', 0):
+            regressions.append(f"{scenario}: {current['failures']} failure(s), baseline {previous.get('failures', 0)}")
+        if 'p95_ms' in current and 'p95_ms' in previous and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {current['p95_ms']} ms, baseline {previous['p95_ms']} ms")
+        if current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(
+                f"{scenario}: {current['throughput']} requests/s, baseline {previous['throughput']} requests/s"
+            )
+    return regressions
+
+
+def format_table(results):
+    """Fixed-width report of a run's scenarios."""
+    columns = ['requests', 'failures', 'throughput', 'mean_ms'] + [f'p{p}_ms' for p in PERCENTILES] + ['max_ms']
+    lines = [f"{'scenario':<12}" + ''.join(f'{column:>12}' for column in columns)]
+    for scenario, summary in results['scenarios'].items():
+        lines.append(f'{scenario:<12}' + ''.join(f"{summary.get(column, '-'):>12}" for column in columns))
+    return '\n'.join(lines)
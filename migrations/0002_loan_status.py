@@ -0,0 +1,10 @@
+"""Add the loan lifecycle status column.
+
+Existing loans start as 'pending'; run ``flask refresh-loan-statuses`` once
+afterwards to move them to their real state.
+"""
+from sqlalchemy import Column, String
+
+
+def upgrade(op):
+    op.add_column('loans', Column('status', String(20), nullable=False, server_default='pending'))
@@ -0,0 +1,29 @@
+"""Add composite indexes for the loan list, customer search, reports and status refresh.
+
+Column order follows the queries: equality filters first, then the range or
+sort column, then id where it is the keyset pagination tie-breaker.
+"""
+
+INDEXES = [
+    ('ix_customers_mobile', 'customers', ['mobile']),
+    ('ix_customers_created_at', 'customers', ['created_at', 'id']),
+    ('ix_customers_name', 'customers', ['name']),
+    ('ix_customers_aadhar_number', 'customers', ['aadhar_number']),
+    ('ix_customers_pan_number', 'customers', ['pan_number']),
+    ('ix_loans_disbursed_date', 'loans', ['disbursed_date', 'id']),
+    ('ix_loans_status_disbursed_date', 'loans', ['status', 'disbursed_date', 'id']),
+    ('ix_loans_type_disbursed_date', 'loans', ['loan_type', 'disbursed_date', 'id']),
+    ('ix_loans_customer_disbursed_date', 'loans', ['customer_id', 'disbursed_date']),
+    ('ix_loans_principal_amount', 'loans', ['principal_amount', 'id']),
+    ('ix_loans_status_maturity_date', 'loans', ['status', 'maturity_date']),
+    ('ix_payments_loan_status_date', 'payments', ['loan_id', 'payment_status', 'payment_date']),
+    ('ix_payments_status_date', 'payments', ['payment_status', 'payment_date']),
+]
+
+
+def upgrade(op):
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+    # Every status query is served by the status-leading composites above
+    op.drop_index('ix_loans_status', 'loans')
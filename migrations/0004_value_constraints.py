@@ -0,0 +1,17 @@
+"""Add CHECK constraints for loan amounts, rates, tenure and status, and payment amounts and status."""
+
+LOAN_STATUSES = "'pending', 'active', 'overdue', 'completed'"
+PAYMENT_STATUSES = "'pending', 'completed', 'failed'"
+
+
+def upgrade(op):
+    op.add_check_constraints('loans', {
+        'ck_loans_principal_amount': 'principal_amount > 0',
+        'ck_loans_interest_rate': 'interest_rate >= 0 AND interest_rate <= 100',
+        'ck_loans_tenure_months': 'tenure_months > 0',
+        'ck_loans_status': f'status IN ({LOAN_STATUSES})',
+    })
+    op.add_check_constraints('payments', {
+        'ck_payments_payment_amount': 'payment_amount > 0',
+        'ck_payments_payment_status': f'payment_status IN ({PAYMENT_STATUSES})',
+    })
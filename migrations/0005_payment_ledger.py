@@ -0,0 +1,11 @@
+"""Add the loan ledger and running loan balances, and index payment references.
+
+Existing loans get their ledger account on their first payment posting, or
+all at once with ``flask open-loan-accounts``.
+"""
+
+
+def upgrade(op):
+    # loan_ledger and loan_balances, with their indexes
+    op.create_missing_tables()
+    op.create_index('ix_payments_reference_number', 'payments', ['reference_number'])
@@ -0,0 +1,37 @@
+"""Add daily interest accruals, accrual run checkpoints and accrual totals on loan balances.
+
+Loan balances also get the total amount payable on their schedule, filled
+in here for existing accounts. Accrual starts from the first business date
+``flask accrue-interest`` is run for; earlier days are not back-filled.
+"""
+from decimal import Decimal
+
+from sqlalchemy import Column, Date, Numeric
+
+from services.finance import repayment_schedule
+
+BATCH_SIZE = 10000
+
+
+def upgrade(op):
+    # interest_accruals and accrual_runs, with their indexes
+    op.create_missing_tables()
+    op.add_column('loan_balances', Column('interest_accrued', Numeric(14, 4), nullable=False, server_default='0'))
+    op.add_column('loan_balances', Column('penal_interest_accrued', Numeric(14, 4), nullable=False, server_default='0'))
+    op.add_column('loan_balances', Column('accrued_through', Date))
+    op.add_column('loan_balances', Column('amount_payable', Numeric(12, 2), nullable=False, server_default='0'))
+
+    accounts = op.execute(
+        'SELECT b.loan_id, l.principal_amount, l.interest_rate, l.tenure_months '
+        'FROM loan_balances b JOIN loans l ON l.id = b.loan_id WHERE b.amount_payable = 0'
+    ).all()
+    for start in range(0, len(accounts), BATCH_SIZE):
+        op.execute('UPDATE loan_balances SET amount_payable = :amount WHERE loan_id = :loan_id', [
+            {
+                'loan_id': loan_id,
+                'amount': str(sum(interest + principal_part for interest, principal_part in repayment_schedule(
+                    Decimal(str(principal)), Decimal(str(rate)), int(tenure)
+                ))),
+            }
+            for loan_id, principal, rate, tenure in accounts[start:start + BATCH_SIZE]
+        ])
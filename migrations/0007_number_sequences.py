@@ -0,0 +1,27 @@
+"""Add the counters behind loan and payment numbers.
+
+Loan numbers used to end in four random digits. Today's (and any later)
+prefixes already in use start their counter after the highest suffix
+taken, so new numbers cannot collide with them.
+"""
+import re
+from datetime import datetime
+
+_LOAN_NUMBER = re.compile(r'^([A-Z]L-(\d{8}))-(\d+)$')
+
+
+def upgrade(op):
+    op.create_missing_tables()
+
+    today = datetime.utcnow().strftime('%Y%m%d')
+    highest = {}
+    for (loan_number,) in op.execute("SELECT loan_number FROM loans WHERE loan_number LIKE '_L-%'"):
+        match = _LOAN_NUMBER.match(loan_number)
+        if match and match.group(2) >= today:
+            prefix = match.group(1)
+            highest[prefix] = max(highest.get(prefix, 0), int(match.group(3)))
+
+    existing = {name for (name,) in op.execute('SELECT name FROM number_sequences')}
+    rows = [{'name': prefix, 'next_value': value + 1} for prefix, value in highest.items() if prefix not in existing]
+    if rows:
+        op.execute('INSERT INTO number_sequences (name, next_value) VALUES (:name, :next_value)', rows)
@@ -0,0 +1,11 @@
+"""Add job attempts and heartbeats, so jobs of a worker that died are retried.
+
+Jobs left 'running' by a worker that stopped before this migration have no
+heartbeat; their started_at stands in for it.
+"""
+from sqlalchemy import Column, DateTime, Integer
+
+
+def upgrade(op):
+    op.add_column('jobs', Column('attempts', Integer, nullable=False, server_default='0'))
+    op.add_column('jobs', Column('heartbeat_at', DateTime))
@@ -0,0 +1,224 @@
+"""
+Versioned schema migrations for the AGV Secure database.
+
+Each migration is a module in this package named ``NNNN_description.py``
+with an ``upgrade(op)`` function. ``flask db-upgrade`` (and init_db.py)
+applies the pending ones in order, each in its own transaction, and records
+them in the ``schema_migrations`` table. Schema changes never drop data.
+
+0001 creates the tables the models define that do not exist yet, so a fresh
+database starts from the current models; every later migration must
+therefore be a no-op where its change is already present, which the ``op``
+helpers below take care of. To change the schema, edit models.py and add
+the next numbered migration making the same change to existing databases.
+"""
+import importlib
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Index, MetaData, String, Table, inspect, insert, select, text
+from sqlalchemy.schema import CreateColumn
+
+from database import statement_timeout
+from extensions import db
+
+MIGRATIONS_TABLE = 'schema_migrations'
+
+_MODULE_NAME = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+_migrations = Table(
+    MIGRATIONS_TABLE, MetaData(),
+    Column('revision', String(4), primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+class MigrationError(RuntimeError):
+    """A migration cannot be applied to the data as it stands."""
+
+
+class Operations:
+    """Schema changes available to migrations; each one is skipped when already in place."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.dialect = connection.dialect.name
+
+    def _inspector(self):
+        # Not cached: earlier operations in the same migration change the answers
+        return inspect(self.connection)
+
+    def has_table(self, table):
+        return self._inspector().has_table(table)
+
+    def has_column(self, table, column):
+        return column in {c['name'] for c in self._inspector().get_columns(table)}
+
+    def has_index(self, table, name):
+        return name in {index['name'] for index in self._inspector().get_indexes(table)}
+
+    def has_check_constraint(self, table, name):
+        return name in {check['name'] for check in self._inspector().get_check_constraints(table)}
+
+    def execute(self, statement, parameters=None):
+        return self.connection.execute(text(statement), parameters or {})
+
+    def create_missing_tables(self):
+        """Create every model table (with its indexes) that does not exist yet."""
+        db.metadata.create_all(self.connection, checkfirst=True)
+
+    def create_index(self, name, table, columns, unique=False):
+        columns = list(columns)
+        if self.has_index(table, name):
+            return
+        # Index DDL only needs the names, not the column types
+        target = Table(table, MetaData(), *[Column(column) for column in columns])
+        Index(name, *[target.c[column] for column in columns], unique=unique).create(self.connection)
+
+    def drop_index(self, name, table):
+        if self.has_index(table, name):
+            self.execute(f'DROP INDEX {name}')
+
+    def add_column(self, table, column):
+        """Add a ``sqlalchemy.Column``; give it a server_default if it is NOT NULL."""
+        if self.has_column(table, column.name):
+            return
+        Table(table, MetaData(), column)
+        ddl = CreateColumn(column).compile(dialect=self.connection.dialect)
+        self.execute(f'ALTER TABLE {table} ADD COLUMN {ddl}')
+
+    def add_check_constraints(self, table, constraints):
+        """Add named CHECK constraints ({name: condition}) after verifying existing rows satisfy them.
+
+        SQLite cannot add a constraint to an existing table, so there the
+        table is rebuilt once with all missing constraints appended.
+        """
+        missing = {name: condition for name, condition in constraints.items()
+                   if not self.has_check_constraint(table, name)}
+        if not missing:
+            return
+
+        for name, condition in missing.items():
+            violations = self.execute(f'SELECT count(*) FROM {table} WHERE NOT ({condition})').scalar()
+            if violations:
+                raise MigrationError(
+                    f"{violations} row(s) in {table} violate {name} ({condition}); "
+                    f"correct them and run the migration again"
+                )
+
+        if self.dialect == 'sqlite':
+            self._rebuild_sqlite_table(table, [
+                f'CONSTRAINT {name} CHECK ({condition})' for name, condition in missing.items()
+            ])
+        else:
+            for name, condition in missing.items():
+                self.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} CHECK ({condition})')
+
+    def _rebuild_sqlite_table(self, table, extra_definitions):
+        """Copy ``table`` into a new definition with ``extra_definitions`` appended.
+
+        Follows SQLite's documented procedure for schema changes ALTER TABLE
+        cannot make: create, copy, drop, rename, then recreate the table's
+        indexes and triggers. Column order, rowids and data are preserved.
+        """
+        rows = self.execute(
+            "SELECT type, sql FROM sqlite_master WHERE tbl_name = :table AND sql IS NOT NULL",
+            {'table': table},
+        ).all()
+        create_sql = next(sql for kind, sql in rows if kind == 'table')
+        dependents = [sql for kind, sql in rows if kind in ('index', 'trigger')]
+
+        temporary = f'_new_{table}'
+        create_sql, replaced = re.subn(r'^CREATE TABLE\s+("?)\w+\1', f'CREATE TABLE "{temporary}"', create_sql.strip())
+        if not replaced:
+            raise MigrationError(f"Cannot parse the definition of {table}")
+        create_sql = create_sql[:create_sql.rindex(')')].rstrip() + ',\n\t' + ',\n\t'.join(extra_definitions) + '\n)'
+
+        columns = ', '.join(f'"{row[1]}"' for row in self.execute(f'PRAGMA table_info({table})'))
+        self.execute(create_sql)
+        self.execute(f'INSERT INTO "{temporary}" (rowid, {columns}) SELECT rowid, {columns} FROM {table}')
+        self.execute(f'DROP TABLE {table}')
+        self.execute(f'ALTER TABLE "{temporary}" RENAME TO {table}')
+        for sql in dependents:
+            self.execute(sql)
+
+
+def available():
+    """(revision, name, module) for every migration in this package, in order."""
+    found = []
+    for filename in sorted(os.listdir(os.path.dirname(__file__))):
+        match = _MODULE_NAME.match(filename)
+        if match:
+            module = importlib.import_module(f'{__name__}.{filename[:-3]}')
+            found.append((match.group(1), match.group(2), module))
+    return found
+
+
+def applied(connection):
+    """{revision: applied_at} of the migrations already run."""
+    if not inspect(connection).has_table(MIGRATIONS_TABLE):
+        return {}
+    return dict(connection.execute(select(_migrations.c.revision, _migrations.c.applied_at)).all())
+
+
+def status(engine=None):
+    """Every known migration with when it was applied (None if pending)."""
+    engine = engine or db.engine
+    with engine.connect() as connection:
+        done = applied(connection)
+    return [
+        {
+            'revision': revision,
+            'name': name,
+            'description': (module.__doc__ or '').strip().split('\n')[0],
+            'applied_at': done.get(revision),
+        }
+        for revision, name, module in available()
+    ]
+
+
+@contextmanager
+def _transaction(engine):
+    with engine.connect() as connection:
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            # Table rebuilds drop tables that others refer to; this pragma is
+            # ignored inside a transaction, so set it first
+            foreign_keys = connection.exec_driver_sql('PRAGMA foreign_keys').scalar()
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            connection.commit()
+        try:
+            with connection.begin():
+                if sqlite:
+                    # pysqlite leaves DDL outside transactions unless told otherwise
+                    connection.exec_driver_sql('BEGIN')
+                yield connection
+        finally:
+            if sqlite and foreign_keys:
+                connection.exec_driver_sql('PRAGMA foreign_keys=ON')
+
+
+def upgrade(engine=None, target=None, log=print):
+    """Apply pending migrations up to ``target`` (default: all); returns the revisions applied."""
+    engine = engine or db.engine
+    _migrations.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        done = applied(connection)
+
+    ran = []
+    for revision, name, module in available():
+        if revision in done:
+            continue
+        if target is not None and revision > target:
+            break
+        log(f"Applying {revision} {name}")
+        # Index builds and table rebuilds may run far past the web statement timeout
+        with statement_timeout(0), _transaction(engine) as connection:
+            module.upgrade(Operations(connection))
+            connection.execute(insert(_migrations).values(
+                revision=revision, name=name, applied_at=datetime.utcnow()))
+        ran.append(revision)
+    return ran
@@ -1,7 +1,6 @@
-from sqlalchemy import String, Integer, Numeric, DateTime, Text, Boolean, JSON, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import String, Integer, BigInteger, Numeric, Date, DateTime, Text, Boolean, JSON, ForeignKey, LargeBinary, UniqueConstraint, CheckConstraint, Index, Uuid
 from sqlalchemy.orm import relationship, Mapped, mapped_column
-from datetime import datetime
+from datetime import datetime, date
 import uuid
 from typing import Optional
 from extensions import db
@@ -10,11 +9,11 @@ from extensions import db
 class Customer(db.Model):
     __tablename__ = 'customers'
 
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
 
     # Personal Information
     name: Mapped[str] = mapped_column(String(100), nullable=False)
-    mobile: Mapped[str] = mapped_column(String(15), nullable=False)  # Changed from 'phone'
+    mobile: Mapped[str] = mapped_column(String(15), nullable=False, index=True)  # Changed from 'phone'
     additional_mobile: Mapped[Optional[str]] = mapped_column(String(15))  # NEW
     father_name: Mapped[Optional[str]] = mapped_column(String(100))  # NEW
     mother_name: Mapped[Optional[str]] = mapped_column(String(100))  # NEW
@@ -28,8 +27,9 @@ class Customer(db.Model):
     pan_number: Mapped[Optional[str]] = mapped_column(String(10))
 
     # Cloud Storage URLs for documents
-    pan_photo_url: Mapped[Optional[str]] = mapped_column(String(500))  # NEW
-    aadhar_photo_url: Mapped[Optional[str]] = mapped_column(String(500))  # NEW
+    # active_history: the replaced value is loaded so its document reference can be released
+    pan_photo_url: Mapped[Optional[str]] = mapped_column(String(500), active_history=True)  # NEW
+    aadhar_photo_url: Mapped[Optional[str]] = mapped_column(String(500), active_history=True)  # NEW
     document_metadata: Mapped[Optional[str]] = mapped_column(Text)  # NEW - JSON string
 
     # Biometric Information
@@ -39,6 +39,15 @@ class Customer(db.Model):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Indexes follow the list, search and report queries; add new ones
+    # through a migration (see migrations/) as well as here
+    __table_args__ = (
+        Index('ix_customers_created_at', 'created_at', 'id'),
+        Index('ix_customers_name', 'name'),
+        Index('ix_customers_aadhar_number', 'aadhar_number'),
+        Index('ix_customers_pan_number', 'pan_number'),
+    )
+
     # Relationships
     loans: Mapped[list["Loan"]] = relationship(back_populates="customer")
 
@@ -46,12 +55,28 @@ class Customer(db.Model):
         return f'<Customer {self.name}>'
 
 
+# Loan lifecycle: pending -> active -> (overdue <-> active) -> completed
+LOAN_STATUSES = ('pending', 'active', 'overdue', 'completed')
+OPEN_LOAN_STATUSES = ('pending', 'active', 'overdue')
+LOAN_STATUS_TRANSITIONS = {
+    'pending': {'active', 'overdue', 'completed'},
+    'active': {'overdue', 'completed'},
+    'overdue': {'active', 'completed'},
+    'completed': set(),
+}
+
+PAYMENT_STATUSES = ('pending', 'completed', 'failed')
+PAYMENT_METHODS = ('cash', 'cheque', 'online', 'card')
+LEDGER_ENTRY_TYPES = ('disbursement', 'payment')
+ACCRUAL_RUN_STATUSES = ('running', 'completed')
+
+
 # Keep your Loan and Payment models as they are
 class Loan(db.Model):
     __tablename__ = 'loans'
 
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    customer_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('customers.id'), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
+    customer_id: Mapped[uuid.UUID] = mapped_column(Uuid, ForeignKey('customers.id'), nullable=False)
     loan_number: Mapped[str] = mapped_column(String(20), unique=True, nullable=False)
     principal_amount: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False)
     interest_rate: Mapped[float] = mapped_column(Numeric(5, 2), nullable=False)
@@ -59,15 +84,40 @@ class Loan(db.Model):
     disbursed_date: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     maturity_date: Mapped[Optional[datetime]] = mapped_column(DateTime)
     loan_type: Mapped[str] = mapped_column(String(50), default='gold')
+    status: Mapped[str] = mapped_column(String(20), default='pending', nullable=False)
     collateral_details: Mapped[Optional[dict]] = mapped_column(JSON)
-    document_urls: Mapped[Optional[dict]] = mapped_column(JSON)
+    document_urls: Mapped[Optional[dict]] = mapped_column(JSON, active_history=True)  # Counted references, see Customer
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # /api/loans sorts by disbursed_date (or principal) with id as the keyset
+        # tie-breaker, optionally filtered by status, type or customer
+        Index('ix_loans_disbursed_date', 'disbursed_date', 'id'),
+        Index('ix_loans_status_disbursed_date', 'status', 'disbursed_date', 'id'),
+        Index('ix_loans_type_disbursed_date', 'loan_type', 'disbursed_date', 'id'),
+        Index('ix_loans_customer_disbursed_date', 'customer_id', 'disbursed_date'),
+        Index('ix_loans_principal_amount', 'principal_amount', 'id'),
+        # Nightly status refresh closes open loans past maturity
+        Index('ix_loans_status_maturity_date', 'status', 'maturity_date'),
+        CheckConstraint('principal_amount > 0', name='ck_loans_principal_amount'),
+        CheckConstraint('interest_rate >= 0 AND interest_rate <= 100', name='ck_loans_interest_rate'),
+        CheckConstraint('tenure_months > 0', name='ck_loans_tenure_months'),
+        CheckConstraint(f"status IN ({', '.join(repr(status) for status in LOAN_STATUSES)})", name='ck_loans_status'),
+    )
+
     # Relationships
     customer: Mapped["Customer"] = relationship(back_populates="loans")
     payments: Mapped[list["Payment"]] = relationship(back_populates="loan")
 
+    def transition_to(self, new_status):
+        """Move the loan to ``new_status``, rejecting transitions the lifecycle does not allow."""
+        if new_status == self.status:
+            return
+        if new_status not in LOAN_STATUS_TRANSITIONS.get(self.status, set()):
+            raise ValueError(f"Cannot move loan {self.loan_number} from {self.status} to {new_status}")
+        self.status = new_status
+
     def __repr__(self):
         return f'<Loan {self.loan_number}>'
 
@@ -75,8 +125,8 @@ class Loan(db.Model):
 class Payment(db.Model):
     __tablename__ = 'payments'
 
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    loan_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey('loans.id'), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
+    loan_id: Mapped[uuid.UUID] = mapped_column(Uuid, ForeignKey('loans.id'), nullable=False)
     payment_number: Mapped[str] = mapped_column(String(20), nullable=False, unique=True)
     
     # Payment Details
@@ -101,8 +151,301 @@ class Payment(db.Model):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # Per-loan history and the "recent completed payment" check
+        Index('ix_payments_loan_status_date', 'loan_id', 'payment_status', 'payment_date'),
+        # Recent payments and payment reports by date
+        Index('ix_payments_status_date', 'payment_status', 'payment_date'),
+        # Duplicate detection when bank and counter receipts are posted in bulk
+        Index('ix_payments_reference_number', 'reference_number'),
+        CheckConstraint('payment_amount > 0', name='ck_payments_payment_amount'),
+        CheckConstraint(f"payment_status IN ({', '.join(repr(status) for status in PAYMENT_STATUSES)})",
+                        name='ck_payments_payment_status'),
+    )
+
     # Relationships
     loan: Mapped["Loan"] = relationship(back_populates="payments")
 
     def __repr__(self):
-        return f'<Payment {self.payment_number}>'
\ No newline at end of file
+        return f'<Payment {self.payment_number}>'
+
+
+class LedgerEntry(db.Model):
+    """One movement on a loan account; rows are only ever inserted.
+
+    ``principal`` is the change in principal owed (positive for the
+    disbursement, negative for repayments) and ``interest`` the interest a
+    payment settled. ``principal_balance`` is the principal outstanding
+    after the entry, so the ledger can be audited without summing it.
+    See services/payment_service.py.
+    """
+    __tablename__ = 'loan_ledger'
+
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    loan_id: Mapped[uuid.UUID] = mapped_column(Uuid, ForeignKey('loans.id'), nullable=False)
+    payment_id: Mapped[Optional[uuid.UUID]] = mapped_column(Uuid, ForeignKey('payments.id'), unique=True)
+    entry_type: Mapped[str] = mapped_column(String(20), nullable=False)
+    principal: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False)
+    interest: Mapped[float] = mapped_column(Numeric(12, 2), default=0, nullable=False)
+    principal_balance: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False)
+    effective_date: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    payment: Mapped[Optional["Payment"]] = relationship()
+
+    __table_args__ = (
+        # A loan's statement, in posting order
+        Index('ix_loan_ledger_loan_id', 'loan_id', 'id'),
+        CheckConstraint(f"entry_type IN ({', '.join(repr(kind) for kind in LEDGER_ENTRY_TYPES)})",
+                        name='ck_loan_ledger_entry_type'),
+    )
+
+    def __repr__(self):
+        return f'<LedgerEntry {self.entry_type} {self.loan_id} {self.principal}>'
+
+
+class LoanBalance(db.Model):
+    """Running position of a loan, updated in the same transaction as every ledger entry.
+
+    ``amount_paid`` places the loan on its repayment schedule: payments
+    settle instalments in order, each one's interest before its principal,
+    so the instalments paid and the next due date follow from it.
+    """
+    __tablename__ = 'loan_balances'
+
+    loan_id: Mapped[uuid.UUID] = mapped_column(Uuid, ForeignKey('loans.id'), primary_key=True)
+    principal_outstanding: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False)
+    principal_paid: Mapped[float] = mapped_column(Numeric(12, 2), default=0, nullable=False)
+    interest_paid: Mapped[float] = mapped_column(Numeric(12, 2), default=0, nullable=False)
+    amount_paid: Mapped[float] = mapped_column(Numeric(12, 2), default=0, nullable=False)
+    instalments_paid: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    instalment_amount: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False)
+    # Total of every instalment on the schedule: what is due once the loan matures
+    amount_payable: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False)
+    # Due date of the first instalment not fully paid; None once the loan is repaid
+    next_due_date: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    last_payment_date: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    # Running totals of the daily accruals, through accrued_through inclusive
+    interest_accrued: Mapped[float] = mapped_column(Numeric(14, 4), default=0, nullable=False)
+    penal_interest_accrued: Mapped[float] = mapped_column(Numeric(14, 4), default=0, nullable=False)
+    accrued_through: Mapped[Optional[date]] = mapped_column(Date)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # Overdue and due-today figures
+        Index('ix_loan_balances_next_due_date', 'next_due_date'),
+    )
+
+    def __repr__(self):
+        return f'<LoanBalance {self.loan_id} {self.principal_outstanding}>'
+
+
+class InterestAccrual(db.Model):
+    """Interest and penal interest one loan accrued on one business date.
+
+    Written in bulk by the nightly accrual batch (services/accrual_service.py),
+    at most once per loan and date. Amounts keep four decimal places so a
+    month of daily accruals adds up to the paisa.
+    """
+    __tablename__ = 'interest_accruals'
+
+    business_date: Mapped[date] = mapped_column(Date, primary_key=True)
+    loan_id: Mapped[uuid.UUID] = mapped_column(Uuid, ForeignKey('loans.id'), primary_key=True)
+    principal_balance: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False)
+    interest_rate: Mapped[float] = mapped_column(Numeric(5, 2), nullable=False)
+    interest: Mapped[float] = mapped_column(Numeric(12, 4), nullable=False)
+    # Instalment amounts past due on the business date and the penal interest on them
+    overdue_amount: Mapped[float] = mapped_column(Numeric(12, 2), default=0, nullable=False)
+    days_past_due: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    penal_interest: Mapped[float] = mapped_column(Numeric(12, 4), default=0, nullable=False)
+
+    __table_args__ = (
+        # A loan's accrual history
+        Index('ix_interest_accruals_loan_id', 'loan_id', 'business_date'),
+    )
+
+    def __repr__(self):
+        return f'<InterestAccrual {self.business_date} {self.loan_id} {self.interest}>'
+
+
+class AccrualRun(db.Model):
+    """Progress and totals of the accrual batch for one business date.
+
+    ``last_loan_id`` is the checkpoint: loans are accrued in id order and
+    each chunk commits together with it, so an interrupted run resumes
+    after the last committed chunk.
+    """
+    __tablename__ = 'accrual_runs'
+
+    business_date: Mapped[date] = mapped_column(Date, primary_key=True)
+    status: Mapped[str] = mapped_column(String(20), default='running', nullable=False)
+    # Penal terms the run started with, kept so a resumed run applies the same ones
+    penal_interest_rate: Mapped[float] = mapped_column(Numeric(5, 2), nullable=False)
+    penal_grace_days: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_loan_id: Mapped[Optional[uuid.UUID]] = mapped_column(Uuid)
+    loans_accrued: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    interest_total: Mapped[float] = mapped_column(Numeric(16, 4), default=0, nullable=False)
+    penal_interest_total: Mapped[float] = mapped_column(Numeric(16, 4), default=0, nullable=False)
+    started_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+    __table_args__ = (
+        CheckConstraint(f"status IN ({', '.join(repr(status) for status in ACCRUAL_RUN_STATUSES)})",
+                        name='ck_accrual_runs_status'),
+    )
+
+    def __repr__(self):
+        return f'<AccrualRun {self.business_date} {self.status}>'
+
+
+class NumberSequence(db.Model):
+    """Counter behind a family of document numbers, e.g. loan numbers 'GL-20261017-NNNN'.
+
+    ``next_value`` is the first value not yet handed to any worker; workers
+    reserve blocks of values at a time (see sequences.py).
+    """
+    __tablename__ = 'number_sequences'
+
+    name: Mapped[str] = mapped_column(String(40), primary_key=True)
+    next_value: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+    def __repr__(self):
+        return f'<NumberSequence {self.name} {self.next_value}>'
+
+
+class StatsRollup(db.Model):
+    """Pre-aggregated dashboard figures per period and loan type.
+
+    Rows are maintained incrementally as customers, loans and payments are
+    written (see services/rollup_service.py). ``granularity`` is 'day',
+    'month' or 'all'; 'all' rows use a fixed period_start and hold running
+    totals. Customer counts are not tied to a loan type and use loan_type ''.
+    """
+    __tablename__ = 'stats_rollups'
+
+    granularity: Mapped[str] = mapped_column(String(10), primary_key=True)
+    period_start: Mapped[date] = mapped_column(Date, primary_key=True)
+    loan_type: Mapped[str] = mapped_column(String(50), primary_key=True, default='')
+
+    new_customers: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    loans_disbursed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    disbursed_amount: Mapped[float] = mapped_column(Numeric(16, 2), default=0, nullable=False)
+    interest_amount: Mapped[float] = mapped_column(Numeric(16, 2), default=0, nullable=False)
+    payments_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    payments_amount: Mapped[float] = mapped_column(Numeric(16, 2), default=0, nullable=False)
+    interest_collected: Mapped[float] = mapped_column(Numeric(16, 2), default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<StatsRollup {self.granularity} {self.period_start} {self.loan_type}>'
+
+
+class Job(db.Model):
+    """Background job record; the source of truth for status and progress polling."""
+    __tablename__ = 'jobs'
+
+    id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True, default=uuid.uuid4)
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)
+    status: Mapped[str] = mapped_column(String(20), default='queued', nullable=False)  # queued, running, succeeded, failed
+    priority: Mapped[int] = mapped_column(Integer, default=5, nullable=False)  # Lower runs first
+    params: Mapped[Optional[dict]] = mapped_column(JSON)
+    progress: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    total: Mapped[Optional[int]] = mapped_column(Integer)
+    result: Mapped[Optional[dict]] = mapped_column(JSON)
+    error: Mapped[Optional[str]] = mapped_column(Text)
+    created_by: Mapped[Optional[str]] = mapped_column(String(100))
+
+    # Times claimed; a running job whose heartbeat is older than the lease is re-queued
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+    __table_args__ = (
+        db.Index('ix_jobs_status_priority', 'status', 'priority', 'created_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': str(self.id),
+            'kind': self.kind,
+            'status': self.status,
+            'priority': self.priority,
+            'progress': self.progress,
+            'total': self.total,
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<Job {self.kind} {self.status}>'
+
+
+class ImportCheckpoint(db.Model):
+    """How far a bulk import of one source file has committed.
+
+    Updated in the same transaction as each inserted batch, so a resumed
+    import never inserts a row twice (see services/import_service.py).
+    """
+    __tablename__ = 'import_checkpoints'
+
+    source: Mapped[str] = mapped_column(String(500), primary_key=True)
+    kind: Mapped[str] = mapped_column(String(20), nullable=False)
+    rows_done: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    inserted: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    failed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    completed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ImportCheckpoint {self.source} {self.rows_done}>'
+
+
+class StoredObject(db.Model):
+    """A file in the content-addressed document store and how many rows refer to it.
+
+    Objects are named by the SHA-256 of their contents (see storage.py);
+    ``refcount`` changes in the same transaction as the customer or loan
+    row that gains or drops the reference.
+    """
+    __tablename__ = 'stored_objects'
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    extension: Mapped[str] = mapped_column(String(10), nullable=False)
+    content_type: Mapped[str] = mapped_column(String(100), nullable=False)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    refcount: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StoredObject {self.sha256[:12]} x{self.refcount}>'
+
+
+class FingerprintTemplate(db.Model):
+    """A fixed-size fingerprint feature template enrolled for a customer.
+
+    ``template`` holds TEMPLATE_DIM signed bytes (see services/biometric_service.py).
+    Ids are assigned at insert, not commit, so a lower id can become visible
+    after a higher one; the in-memory matching index therefore re-reads a
+    trailing window of ids below the highest it has seen when it picks up
+    new enrolments.
+    """
+    __tablename__ = 'fingerprint_templates'
+    __table_args__ = (UniqueConstraint('customer_id', 'finger'),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    customer_id: Mapped[uuid.UUID] = mapped_column(Uuid, ForeignKey('customers.id'), nullable=False, index=True)
+    finger: Mapped[str] = mapped_column(String(20), nullable=False, default='unknown')
+    template: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    quality: Mapped[Optional[int]] = mapped_column(Integer)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    customer: Mapped["Customer"] = relationship()
+
+    def __repr__(self):
+        return f'<FingerprintTemplate {self.customer_id} {self.finger}>'
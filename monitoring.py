@@ -0,0 +1,480 @@
+"""
+Request metrics, SQL instrumentation, JSON logs and a sampling profiler.
+
+Monitoring.init_app() hooks every request and every database engine:
+
+* each request is timed and counted per route, method and status, with the
+  number of SQL statements it ran and their total time;
+* every statement is timed per operation (select, insert, ...); one taking
+  at least SLOW_QUERY_MS is logged with its plan (EXPLAIN, at most once per
+  statement shape every EXPLAIN_EVERY seconds);
+* an access log line is written per request, and with LOG_FORMAT=json all
+  logging goes out as one JSON object per line, tagged with the request id
+  (X-Request-ID, passed through or generated).
+
+render() returns the figures in the Prometheus text format for ``/metrics``.
+Like the memory cache, figures are kept per process: with several workers
+each reports its own, so scrape them individually or sum across them.
+
+The sampling profiler is off unless PROFILER_ENABLED is set or it is
+started at runtime. While running it records, every PROFILER_INTERVAL_MS,
+the stack of each thread that is serving a request, as collapsed stacks
+(``route;module:function;...  samples``) for flame graph tools.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as StackCounter
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+from sqlalchemy import event
+
+from extensions import db
+from query_plans import EXPLAINERS, _normalize
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+DEFAULT_SLOW_QUERY_MS = 500
+
+# Seconds before the same statement shape is explained again
+EXPLAIN_EVERY = 300
+
+# Endpoints polled by scrapers and probes, logged at DEBUG rather than INFO
+QUIET_ENDPOINTS = {'metrics', 'healthz', 'readyz'}
+
+# Frames kept per sampled stack, counted from the innermost
+MAX_STACK_DEPTH = 64
+
+_OPERATION = re.compile(r'^\s*(\w+)')
+_OPERATIONS = {'select', 'insert', 'update', 'delete'}
+
+logger = logging.getLogger('agv.monitoring')
+access_logger = logging.getLogger('agv.access')
+sql_logger = logging.getLogger('agv.sql')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic total per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.label_names, labels)} {_number(value)}'
+
+
+class Gauge(Counter):
+    """Current value per label set."""
+
+    kind = 'gauge'
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label set."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, [('le', _number(bound))])} {cumulative}"
+            yield f'{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}'
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, request id and any ``extra={'fields': ...}``."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if has_request_context() and 'request_id' in g:
+            entry['request_id'] = g.request_id
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads serving requests from a background thread."""
+
+    def __init__(self):
+        self.interval = 0.01
+        self.samples = StackCounter()
+        self.started_at = None
+        self._routes = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # Threads do not survive fork, so a worker forked while sampling starts its own
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._routes.clear()
+        if self._thread is not None:
+            self._thread = None
+            self.start()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms=None):
+        """Start sampling afresh; a running profiler is restarted with the new interval."""
+        self.stop()
+        if interval_ms:
+            self.interval = max(float(interval_ms), 1.0) / 1000
+        with self._lock:
+            self.samples.clear()
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def enter(self, route):
+        self._routes[threading.get_ident()] = route
+
+    def leave(self):
+        self._routes.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            stacks = []
+            for thread_id, route in list(self._routes.items()):
+                frame = frames.get(thread_id)
+                names = []
+                while frame is not None and len(names) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+                    frame = frame.f_back
+                if names:
+                    stacks.append(';'.join([route] + names[::-1]))
+            del frames
+            if stacks:
+                with self._lock:
+                    self.samples.update(stacks)
+
+    def collapsed(self):
+        """Samples as collapsed stacks, most sampled first."""
+        with self._lock:
+            return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common()) + '\n'
+
+    def status(self):
+        with self._lock:
+            total = sum(self.samples.values())
+        return {
+            'running': self.running,
+            'interval_ms': round(self.interval * 1000, 3),
+            'started_at': self.started_at,
+            'samples': total,
+        }
+
+
+class Monitoring:
+    def __init__(self, app=None):
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Time to serve a request, streamed bodies included.',
+            ('method', 'route', 'status'))
+        self.request_queries = Histogram(
+            'http_request_db_queries', 'SQL statements run per request.', ('method', 'route'), QUERY_COUNT_BUCKETS)
+        self.request_query_time = Histogram(
+            'http_request_db_seconds', 'Time per request spent running SQL statements.', ('method', 'route'))
+        self.in_progress = Gauge('http_requests_in_progress', 'Requests being served by this process.')
+        self.query_duration = Histogram(
+            'db_query_duration_seconds', 'SQL statement execution time.', ('operation',))
+        self.slow_queries = Counter(
+            'db_slow_queries_total', 'SQL statements that took at least SLOW_QUERY_MS.', ('operation',))
+        self.started = Gauge('process_start_time_seconds', 'Start time of the process since the Unix epoch.')
+        self.started.set(value=time.time())
+        self.metrics = [
+            self.request_duration, self.request_queries, self.request_query_time, self.in_progress,
+            self.query_duration, self.slow_queries, self.started,
+        ]
+        self.profiler = SamplingProfiler()
+        self.slow_query_ms = DEFAULT_SLOW_QUERY_MS
+        self.explain_slow = True
+        self._collectors = [self._pool_metrics]
+        self._explained = {}
+        self._local = threading.local()
+        self._in_progress = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure logging, time every request and instrument every engine (including binds)."""
+        configure_logging(app)
+        self.slow_query_ms = float(app.config.get('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS))
+        self.explain_slow = app.config.get('SLOW_QUERY_EXPLAIN', True)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                self.instrument(engine)
+
+        if app.config.get('PROFILER_ENABLED'):
+            self.profiler.start(app.config.get('PROFILER_INTERVAL_MS'))
+
+    def instrument(self, engine):
+        """Time the statements ``engine`` runs (for an async engine, pass its ``sync_engine``)."""
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def add_collector(self, collect):
+        """Report extra figures: ``collect()`` returns (name, kind, help, [(labels dict, value)]) tuples."""
+        self._collectors.append(collect)
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception:
+                logger.exception("Metrics collector failed")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_labels(labels.keys(), labels.values())} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _pool_metrics():
+        pools = {name or 'primary': engine.pool for name, engine in db.engines.items()}
+        figures = [
+            ('db_pool_size', 'Connections the pool keeps open.', lambda pool: pool.size()),
+            ('db_pool_checked_out', 'Pooled connections in use.', lambda pool: pool.checkedout()),
+            # QueuePool counts overflow down from -size while the pool is not yet full
+            ('db_pool_overflow', 'Connections open beyond the pool size.', lambda pool: max(pool.overflow(), 0)),
+        ]
+        # Only queue pools (PostgreSQL, SQLite files) have these figures
+        pools = {database: pool for database, pool in pools.items() if hasattr(pool, 'overflow')}
+        return [
+            (name, 'gauge', help, [({'database': database}, figure(pool)) for database, pool in pools.items()])
+            for name, help, figure in figures
+        ]
+
+    # --- Requests ---
+
+    def _before_request(self):
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+        g.db_queries, g.db_seconds = 0, 0.0
+        with self._lock:
+            self._in_progress += 1
+            self.in_progress.set(value=self._in_progress)
+        if self.profiler.running:
+            self.profiler.enter(self._route())
+
+    def _after_request(self, response):
+        g.response_status = response.status_code
+        response.headers.setdefault('X-Request-ID', g.request_id)
+        return response
+
+    def _teardown_request(self, error):
+        # Runs once the response body has been sent, so streamed bodies are timed in full
+        if 'request_started' not in g:
+            return
+        elapsed = time.perf_counter() - g.pop('request_started')
+        self.profiler.leave()
+        with self._lock:
+            self._in_progress -= 1
+            self.in_progress.set(value=self._in_progress)
+
+        route, method = self._route(), request.method
+        status = 500 if error is not None else g.get('response_status', 500)
+        self.request_duration.observe(method, route, str(status), value=elapsed)
+        self.request_queries.observe(method, route, value=g.db_queries)
+        self.request_query_time.observe(method, route, value=g.db_seconds)
+
+        fields = {
+            'method': method,
+            'path': request.full_path.rstrip('?'),
+            'route': route,
+            'status': status,
+            'duration_ms': round(elapsed * 1000, 2),
+            'db_queries': g.db_queries,
+            'db_ms': round(g.db_seconds * 1000, 2),
+            'remote_addr': request.remote_addr,
+        }
+        level = logging.DEBUG if request.endpoint in QUIET_ENDPOINTS else logging.INFO
+        # Unhandled errors are already logged with their traceback by Flask
+        access_logger.log(level, "%s %s %s", method, fields['path'], status, extra={'fields': fields})
+
+    @staticmethod
+    def _route():
+        return request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+
+    # --- SQL statements ---
+
+    def _before_execute(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('monitoring_started', []).append(time.perf_counter())
+
+    def _after_execute(self, connection, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - connection.info['monitoring_started'].pop()
+        if getattr(self._local, 'explaining', False):
+            return
+        match = _OPERATION.match(statement)
+        operation = match.group(1).lower() if match else 'other'
+        if operation == 'with':
+            operation = 'select'
+        elif operation not in _OPERATIONS:
+            operation = 'other'
+
+        self.query_duration.observe(operation, value=elapsed)
+        if has_request_context() and 'db_queries' in g:
+            g.db_queries += 1
+            g.db_seconds += elapsed
+
+        if self.slow_query_ms and elapsed * 1000 >= self.slow_query_ms:
+            self.slow_queries.inc(operation)
+            self._log_slow(connection, statement, parameters, operation, elapsed, executemany)
+
+    def _log_slow(self, connection, statement, parameters, operation, elapsed, executemany):
+        fields = {
+            'duration_ms': round(elapsed * 1000, 2),
+            'operation': operation,
+            'statement': statement,
+        }
+        if has_request_context():
+            fields['route'] = self._route()
+        if self.explain_slow and not executemany and operation != 'other':
+            plan = self._explain(connection, statement, parameters)
+            if plan is not None:
+                fields['plan'] = plan
+        sql_logger.warning("Slow %s statement (%.0f ms)", operation, elapsed * 1000, extra={'fields': fields})
+
+    def _explain(self, connection, statement, parameters):
+        """The statement's plan and findings, or None if its shape was explained recently."""
+        explain = EXPLAINERS.get(connection.dialect.name)
+        if explain is None:
+            return None
+        key = _normalize(statement)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained.get(key, -EXPLAIN_EVERY) < EXPLAIN_EVERY:
+                return None
+            self._explained[key] = now
+
+        # A separate connection, so a failing EXPLAIN cannot abort the caller's transaction
+        self._local.explaining = True
+        try:
+            with connection.engine.connect() as explain_connection:
+                lines, problems = explain(explain_connection, statement, parameters)
+            return {
+                'lines': lines,
+                'findings': [{'problem': kind, 'table': table, 'detail': detail} for kind, table, detail in problems],
+            }
+        except Exception as e:
+            return {'error': str(e)}
+        finally:
+            self._local.explaining = False
+
+
+def configure_logging(app):
+    """Send the root logger to stderr at LOG_LEVEL, as JSON lines unless LOG_FORMAT is 'text'.
+
+    Leaves logging alone when the server (e.g. gunicorn) has already set up
+    handlers on the root logger.
+    """
+    root = logging.getLogger()
+    if any(not isinstance(handler, logging.NullHandler) for handler in root.handlers):
+        return
+    handler = logging.StreamHandler()
+    if app.config.get('LOG_FORMAT', 'json') == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root.addHandler(handler)
+    root.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+
+    # Flask's own handler would print every app.logger record a second time
+    app.logger.removeHandler(default_handler)
+
+
+monitor = Monitoring()
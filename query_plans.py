@@ -0,0 +1,256 @@
+"""
+Query logging and missing-index reports for the AGV Secure application.
+
+With QUERY_LOG_PATH set, every SELECT, UPDATE and DELETE taking at least
+QUERY_LOG_MIN_MS is appended to that file as a JSON line. ``flask
+index-report`` then runs EXPLAIN for each distinct logged statement and
+lists those whose plan scans a whole table or sorts without an index, with
+the columns they filter and sort on as the index to consider (equality
+columns first, then range, then sort columns).
+
+Parameters are only logged with QUERY_LOG_PARAMETERS set, since they hold
+customer data; without them SQLite plans are unaffected and PostgreSQL
+(16 and later) uses a generic plan.
+
+QueryCounter counts the statements a block of code runs, for the query
+budget tests.
+"""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, text
+
+from extensions import db
+
+DEFAULT_MIN_MS = 20
+
+# Tables smaller than this are cheaper to scan than to index
+DEFAULT_MIN_ROWS = 1000
+
+_LOGGED = re.compile(r'^\s*(SELECT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+_EXPANDED_IN = re.compile(r'\((?:\?|%\([^)]+\)s)(?:,\s*(?:\?|%\([^)]+\)s))*\)')
+_CLAUSE_END = re.compile(r'\b(GROUP BY|ORDER BY|LIMIT|OFFSET|HAVING|RETURNING)\b', re.IGNORECASE)
+
+
+def _normalize(statement):
+    """One key per query shape: whitespace collapsed, expanded IN lists folded."""
+    return _EXPANDED_IN.sub('(...)', ' '.join(statement.split()))
+
+
+class QueryLog:
+    def __init__(self, app=None):
+        self.path = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Log slow statements on every engine (including binds) when QUERY_LOG_PATH is set."""
+        self.path = app.config.get('QUERY_LOG_PATH')
+        if not self.path:
+            return
+        self.min_ms = float(app.config.get('QUERY_LOG_MIN_MS', DEFAULT_MIN_MS))
+        self.with_parameters = app.config.get('QUERY_LOG_PARAMETERS', False)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before)
+                event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('query_log_started', []).append(time.perf_counter())
+
+    def _after(self, connection, cursor, statement, parameters, context, executemany):
+        started = connection.info['query_log_started'].pop()
+        elapsed = (time.perf_counter() - started) * 1000
+        if elapsed < self.min_ms or executemany or not _LOGGED.match(statement):
+            return
+
+        entry = {
+            'at': time.time(),
+            'ms': round(elapsed, 2),
+            'dialect': connection.dialect.name,
+            'statement': statement,
+        }
+        if self.with_parameters:
+            entry['parameters'] = parameters
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as log:
+                log.write(line + '\n')
+
+
+class QueryCounter:
+    """Record every statement run on the app's engines inside a ``with`` block.
+
+    Used by tests/test_query_budgets.py to catch views whose statement
+    count grows with the number of rows they show.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self._engines = []
+
+    def __enter__(self):
+        self._engines = list(db.engines.values())
+        for engine in self._engines:
+            event.listen(engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        for engine in self._engines:
+            event.remove(engine, 'before_cursor_execute', self._record)
+        self._engines = []
+
+    def _record(self, connection, cursor, statement, parameters, context, executemany):
+        self.statements.append(' '.join(statement.split()))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+def read_log(path):
+    """Distinct statements in a query log with their call count and timings, slowest total first."""
+    statements = OrderedDict()
+    with open(path, encoding='utf-8') as log:
+        for line in log:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            key = _normalize(entry['statement'])
+            stats = statements.setdefault(key, {
+                'statement': entry['statement'],
+                'parameters': entry.get('parameters'),
+                'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            })
+            stats['calls'] += 1
+            stats['total_ms'] += entry['ms']
+            stats['max_ms'] = max(stats['max_ms'], entry['ms'])
+    return sorted(statements.values(), key=lambda stats: -stats['total_ms'])
+
+
+def _explain_sqlite(connection, statement, parameters):
+    if parameters is None:
+        # The plan does not depend on the values bound
+        parameters = (None,) * statement.count('?')
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, tuple(parameters)).all()
+
+    problems = []
+    for row in rows:
+        detail = row[-1]
+        scan = re.match(r'^SCAN (?:TABLE )?(\w+)', detail)
+        if scan and 'USING' not in detail:
+            problems.append(('full scan', scan.group(1), detail))
+        elif detail.startswith('USE TEMP B-TREE'):
+            problems.append(('sort', None, detail))
+    return [row[-1] for row in rows], problems
+
+
+def _explain_postgres(connection, statement, parameters):
+    if parameters is None:
+        plan = connection.exec_driver_sql('EXPLAIN (GENERIC_PLAN, FORMAT JSON) ' + statement).scalar()
+    else:
+        plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    lines, problems = [], []
+
+    def walk(node, depth):
+        description = node['Node Type'] + (f" on {node['Relation Name']}" if 'Relation Name' in node else '')
+        lines.append('  ' * depth + description)
+        if node['Node Type'] == 'Seq Scan':
+            problems.append(('full scan', node['Relation Name'], node.get('Filter') or 'no filter'))
+        elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+            problems.append(('sort', None, ', '.join(node.get('Sort Key', []))))
+        for child in node.get('Plans', []):
+            walk(child, depth + 1)
+
+    walk(plan[0]['Plan'], 0)
+    return lines, problems
+
+
+EXPLAINERS = {
+    'sqlite': _explain_sqlite,
+    'postgresql': _explain_postgres,
+}
+
+
+def _table_rows(connection, table, cache):
+    if table not in cache:
+        if connection.dialect.name == 'postgresql':
+            # The planner's estimate; exact counts on big tables are slow
+            cache[table] = connection.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"), {'table': table}
+            ).scalar() or 0
+        else:
+            cache[table] = connection.execute(text(f'SELECT count(*) FROM "{table}"')).scalar()
+    return cache[table]
+
+
+def suggest_index(statement, table):
+    """Columns of ``table`` the statement filters on (equality, then range) and sorts by."""
+    where = re.split(r'\bWHERE\b', statement, maxsplit=1, flags=re.IGNORECASE)
+    conditions = _CLAUSE_END.split(where[1])[0] if len(where) > 1 else ''
+    order_by = re.search(r'\bORDER BY\b(.*?)(?:\bLIMIT\b|\bOFFSET\b|$)', statement, re.IGNORECASE | re.DOTALL)
+
+    equality, ranged, ordered = [], [], []
+    for column, operator in re.findall(rf'\b{table}\.(\w+)\s*(=|IN\b|<=?|>=?|LIKE\b|BETWEEN\b|IS\b)',
+                                       conditions, re.IGNORECASE):
+        target = equality if operator.upper() in ('=', 'IN', 'IS') else ranged
+        if column not in equality + ranged:
+            target.append(column)
+    if order_by:
+        for column in re.findall(rf'\b{table}\.(\w+)', order_by.group(1)):
+            if column not in equality + ranged + ordered:
+                ordered.append(column)
+
+    # Only the first range column can use the index for seeking
+    return equality + ranged[:1] + [column for column in ordered if column not in ranged[:1]]
+
+
+def index_report(path, connection, min_rows=DEFAULT_MIN_ROWS):
+    """Logged statements whose plans scan large tables or sort, with suggested indexes."""
+    explain = EXPLAINERS.get(connection.dialect.name)
+    if explain is None:
+        raise ValueError(f"Query plans are not supported on {connection.dialect.name}")
+
+    row_counts = {}
+    report = []
+    for stats in read_log(path):
+        try:
+            plan, problems = explain(connection, stats['statement'], stats['parameters'])
+        except Exception as e:
+            connection.rollback()
+            report.append(dict(stats, plan=[], findings=[], error=str(e)))
+            continue
+
+        findings = []
+        for kind, table, detail in problems:
+            if kind == 'sort':
+                # A sort only matters for paginated queries an index could stop early;
+                # plans do not say which table it sorts, so assume the main one
+                main_table = re.search(r'\bFROM\s+"?(\w+)', stats['statement'], re.IGNORECASE)
+                if not main_table or not re.search(r'\bLIMIT\b', stats['statement'], re.IGNORECASE):
+                    continue
+                table = main_table.group(1)
+            rows = _table_rows(connection, table, row_counts)
+            if rows < min_rows:
+                continue
+            columns = suggest_index(stats['statement'], table)
+            findings.append({
+                'problem': kind, 'table': table, 'rows': rows, 'detail': detail,
+                'suggested_index': f"CREATE INDEX ix_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)})"
+                if columns else None,
+            })
+        if findings:
+            report.append(dict(stats, plan=plan, findings=findings))
+    return report
+
+
+query_log = QueryLog()
@@ -0,0 +1,118 @@
+"""
+Collision-free, human-readable loan and payment numbers.
+
+A number is a prefix naming its family and day, such as ``GL-20261017``,
+followed by a counter kept in the ``number_sequences`` table. Workers do
+not go to the table for every number: each reserves a block of
+NUMBER_BLOCK_SIZE values with a single UPDATE ... RETURNING in its own short
+transaction and hands them out from memory. No two workers ever hold the
+same value, so numbers are unique without unique-violation retries, and the
+counter row is locked only for that one statement, never for the length of
+a request. Values left in a block when a worker stops are never used, so a
+day's numbers can have gaps.
+"""
+import os
+import re
+import threading
+from datetime import datetime
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import NumberSequence
+
+DEFAULT_BLOCK_SIZE = 20
+
+LOAN_NUMBER_DIGITS = 4
+PAYMENT_NUMBER_DIGITS = 6
+
+_LOAN_NUMBER = re.compile(r'^[A-Z]L-(\d{8})-\d+$')
+
+
+def loan_prefix(loan_type, day):
+    """'GL-YYYYMMDD' for a gold loan disbursed on ``day``: loan type initial, 'L' and the date."""
+    return f"{loan_type[0].upper()}L-{day.strftime('%Y%m%d')}"
+
+
+def payment_prefix(day):
+    return f"PY-{day.strftime('%Y%m%d')}"
+
+
+def issuable(loan_number, today=None):
+    """Whether loan_number() could still hand out ``loan_number``.
+
+    New loans are numbered with the day they are disbursed, which is never
+    in the past, so numbers of earlier days cannot come up again.
+    """
+    match = _LOAN_NUMBER.match(loan_number)
+    return bool(match) and match.group(1) >= (today or datetime.utcnow()).strftime('%Y%m%d')
+
+
+class NumberSequences:
+    def __init__(self, app=None):
+        self.block_size = DEFAULT_BLOCK_SIZE
+        self._blocks = {}
+        self._lock = threading.Lock()
+        # A forked worker must not hand out its parent's reserved values
+        os.register_at_fork(after_in_child=self._blocks.clear)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.block_size = app.config.get('NUMBER_BLOCK_SIZE', DEFAULT_BLOCK_SIZE)
+
+    def take(self, name, count=1):
+        """``count`` unused values of sequence ``name``, in increasing order."""
+        engine = db.engine
+        key = (str(engine.url), name)
+        values = []
+        with self._lock:
+            start, end = self._blocks.pop(key, (1, 0))
+            while len(values) < count:
+                if start > end:
+                    start, end = self._reserve(engine, name, max(self.block_size, count - len(values)))
+                taken = min(end - start + 1, count - len(values))
+                values.extend(range(start, start + taken))
+                start += taken
+            if start <= end:
+                self._blocks[key] = (start, end)
+        return values
+
+    @staticmethod
+    def _reserve(engine, name, size):
+        """Reserve ``size`` values of ``name`` in a transaction of its own; returns (first, last)."""
+        table = NumberSequence.__table__
+        with engine.begin() as connection:
+            new_next = NumberSequences._advance(connection, table, name, size)
+            if new_next is None:
+                try:
+                    # First use of this sequence; a concurrent first use makes the insert fail instead
+                    with connection.begin_nested():
+                        connection.execute(insert(table).values(name=name, next_value=1 + size))
+                    new_next = 1 + size
+                except IntegrityError:
+                    new_next = NumberSequences._advance(connection, table, name, size)
+        return new_next - size, new_next - 1
+
+    @staticmethod
+    def _advance(connection, table, name, size):
+        statement = update(table).where(table.c.name == name).values(next_value=table.c.next_value + size)
+        if connection.dialect.update_returning:
+            return connection.execute(statement.returning(table.c.next_value)).scalar()
+        if connection.execute(statement).rowcount == 0:
+            return None
+        return connection.execute(select(table.c.next_value).where(table.c.name == name)).scalar()
+
+    def loan_number(self, loan_type, day):
+        """Next loan number, e.g. 'GL-20261017-0042'."""
+        prefix = loan_prefix(loan_type, day)
+        return f"{prefix}-{self.take(prefix)[0]:0{LOAN_NUMBER_DIGITS}d}"
+
+    def payment_numbers(self, day, count):
+        """``count`` payment numbers for payments posted on ``day``, e.g. 'PY-20261017-000042'."""
+        prefix = payment_prefix(day)
+        return [f"{prefix}-{value:0{PAYMENT_NUMBER_DIGITS}d}" for value in self.take(prefix, count)]
+
+
+sequences = NumberSequences()
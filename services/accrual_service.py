@@ -0,0 +1,275 @@
+"""
+Nightly interest accrual for open loans.
+
+AccrualService.accrue(business_date) walks the open loans that have a ledger
+account in id order, a chunk at a time. For each chunk one query reads the
+balances, daily_accruals() prices the whole chunk at once with numpy, the
+accrual rows go in with one executemany and a single UPDATE adds them to
+the loans' running totals. Each chunk commits together with the run's
+checkpoint (AccrualRun.last_loan_id), so a run that stops part way resumes
+after its last committed chunk, and a completed date is never accrued twice.
+
+Interest for a day is principal outstanding x rate / DAY_COUNT (actual/365).
+Penal interest is charged on the instalment amounts past due: an instalment
+is past due from the day after its due date, and is penalised once it is
+more than the grace days late.
+"""
+import calendar
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import and_, case, func, insert, or_, select, update
+
+from models import db, Loan, LoanBalance, InterestAccrual, AccrualRun, OPEN_LOAN_STATUSES
+from services.rollup_service import _percent_change
+
+DAY_COUNT = 365
+
+# Loans priced and written per transaction
+CHUNK_LOANS = 50_000
+
+_DAY = np.timedelta64(1, 'D')
+
+
+class AccrualError(ValueError):
+    """An accrual run that cannot be started for the requested date."""
+
+
+def _dates(values):
+    """datetime/None values as a datetime64[D] array (None becomes NaT)."""
+    return np.array(values, dtype='datetime64[us]').astype('datetime64[D]')
+
+
+def instalments_due(disbursed, tenure, business_date):
+    """How many instalments of each loan fell due before ``business_date`` (vectorized _instalments_due).
+
+    Instalment ``k`` falls due ``k`` months after disbursement, on the same
+    day of the month or the month's last day, so for one business date only
+    the disbursement day has to be compared.
+    """
+    month = np.datetime64(business_date, 'M')
+    disbursed_month = disbursed.astype('datetime64[M]')
+    months = (month - disbursed_month).astype(np.int64)
+    disbursed_day = (disbursed - disbursed_month.astype('datetime64[D]')).astype(np.int64) + 1
+    due_day = np.minimum(disbursed_day, calendar.monthrange(business_date.year, business_date.month)[1])
+    months -= due_day >= business_date.day
+    return np.clip(months, 0, tenure)
+
+
+def daily_accruals(business_date, columns, penal_rate, grace_days=0):
+    """Interest, overdue amount, days past due and penal interest for one day, per loan.
+
+    ``columns`` holds equal-length sequences: principal_outstanding,
+    interest_rate, amount_paid, instalment_amount, amount_payable,
+    tenure_months, disbursed_date and next_due_date (None once repaid).
+    Amounts come back rounded: interest to four places, overdue amounts
+    to the paisa.
+    """
+    outstanding = np.array(columns['principal_outstanding'], dtype=np.float64)
+    rate = np.array(columns['interest_rate'], dtype=np.float64)
+    amount_paid = np.array(columns['amount_paid'], dtype=np.float64)
+    instalment = np.array(columns['instalment_amount'], dtype=np.float64)
+    payable = np.array(columns['amount_payable'], dtype=np.float64)
+    tenure = np.array(columns['tenure_months'], dtype=np.int64)
+    next_due = _dates(columns['next_due_date'])
+    today = np.datetime64(business_date, 'D')
+
+    due = instalments_due(_dates(columns['disbursed_date']), tenure, business_date)
+    # Every instalment but the last is the EMI rounded to the paisa
+    due_amount = np.where(due == tenure, payable, due * instalment)
+    overdue = np.maximum(np.round(due_amount - amount_paid, 2), 0)
+
+    late = (overdue > 0) & (next_due < today)
+    days_past_due = np.where(late, (today - np.where(late, next_due, today)) // _DAY, 0)
+
+    interest = np.round(outstanding * rate / 100 / DAY_COUNT, 4)
+    penal = np.where(
+        days_past_due > grace_days,
+        np.round(overdue * penal_rate / 100 / DAY_COUNT, 4),
+        0.0,
+    )
+    return {
+        'interest': interest,
+        'overdue_amount': np.where(late, overdue, 0.0),
+        'days_past_due': days_past_due,
+        'penal_interest': penal,
+    }
+
+
+class AccrualService:
+    @staticmethod
+    def pending_dates(through):
+        """Business dates still to accrue, oldest first, up to and including ``through``.
+
+        Continues from the latest run; the first ever run accrues ``through``
+        only.
+        """
+        latest = db.session.execute(select(func.max(AccrualRun.business_date))).scalar()
+        if latest is None:
+            return [through]
+        run = db.session.get(AccrualRun, latest)
+        start = latest if run.status != 'completed' else latest + timedelta(days=1)
+        return [start + timedelta(days=offset) for offset in range((through - start).days + 1)]
+
+    @staticmethod
+    def _start(business_date, penal_rate, grace_days):
+        run = db.session.get(AccrualRun, business_date)
+        if run is not None:
+            return run
+
+        if business_date > datetime.utcnow().date():
+            raise AccrualError(f"{business_date} is in the future")
+        unfinished = db.session.execute(
+            select(AccrualRun.business_date).where(AccrualRun.status != 'completed')
+        ).scalar()
+        if unfinished is not None:
+            raise AccrualError(f"The accrual run for {unfinished} has not finished; run it again first")
+        latest = db.session.execute(select(func.max(AccrualRun.business_date))).scalar()
+        if latest is not None and latest > business_date:
+            raise AccrualError(f"Interest has already been accrued through {latest}")
+
+        run = AccrualRun(business_date=business_date, status='running',
+                         penal_interest_rate=penal_rate, penal_grace_days=grace_days)
+        db.session.add(run)
+        db.session.commit()
+        return run
+
+    @staticmethod
+    def accrue(business_date, penal_rate, grace_days=0, chunk_size=CHUNK_LOANS, progress=None):
+        """Accrue one business date's interest and penal interest for every open loan; returns the AccrualRun.
+
+        Safe to re-run: a completed date is returned as it is, and an
+        interrupted one carries on from its checkpoint with the penal terms
+        it started with. Dates must be accrued in order. ``progress`` is
+        called with the number of loans accrued after each chunk.
+        """
+        run = AccrualService._start(business_date, penal_rate, grace_days)
+        if run.status == 'completed':
+            return run
+
+        end_of_day = datetime.combine(business_date, datetime.min.time()) + timedelta(days=1)
+        columns = (
+            LoanBalance.loan_id, LoanBalance.principal_outstanding, LoanBalance.amount_paid,
+            LoanBalance.instalment_amount, LoanBalance.amount_payable, LoanBalance.next_due_date,
+            Loan.interest_rate, Loan.tenure_months, Loan.disbursed_date,
+        )
+        not_accrued = or_(LoanBalance.accrued_through.is_(None), LoanBalance.accrued_through < business_date)
+
+        try:
+            while True:
+                # Re-read the checkpoint under a lock, so two runners of one date cannot interleave
+                run = db.session.execute(
+                    select(AccrualRun).where(AccrualRun.business_date == business_date)
+                    .with_for_update().execution_options(populate_existing=True)
+                ).scalar_one()
+                query = (
+                    select(*columns)
+                    .join(Loan, Loan.id == LoanBalance.loan_id)
+                    .where(Loan.status.in_(OPEN_LOAN_STATUSES), Loan.disbursed_date < end_of_day, not_accrued)
+                    .order_by(LoanBalance.loan_id)
+                    .limit(chunk_size)
+                )
+                if run.last_loan_id is not None:
+                    query = query.where(LoanBalance.loan_id > run.last_loan_id)
+                rows = db.session.execute(query).all()
+                if not rows:
+                    break
+
+                loan_ids, outstanding, amount_paid, instalment, payable, next_due, rate, tenure, disbursed = zip(*rows)
+                accruals = daily_accruals(business_date, {
+                    'principal_outstanding': outstanding,
+                    'interest_rate': rate,
+                    'amount_paid': amount_paid,
+                    'instalment_amount': instalment,
+                    'amount_payable': payable,
+                    'tenure_months': tenure,
+                    'disbursed_date': disbursed,
+                    'next_due_date': next_due,
+                }, float(run.penal_interest_rate), run.penal_grace_days)
+
+                interest, penal = accruals['interest'], accruals['penal_interest']
+                accrued = np.flatnonzero((interest > 0) | (penal > 0))
+                if accrued.size:
+                    values = zip(
+                        accrued.tolist(), interest[accrued].tolist(), penal[accrued].tolist(),
+                        accruals['overdue_amount'][accrued].tolist(), accruals['days_past_due'][accrued].tolist(),
+                    )
+                    db.session.execute(insert(InterestAccrual), [{
+                        'business_date': business_date,
+                        'loan_id': loan_ids[i],
+                        'principal_balance': outstanding[i],
+                        'interest_rate': rate[i],
+                        'interest': day_interest,
+                        'overdue_amount': overdue,
+                        'days_past_due': days,
+                        'penal_interest': day_penal,
+                    } for i, day_interest, day_penal, overdue, days in values])
+
+                    accrual = InterestAccrual.__table__.c
+                    todays = and_(accrual.business_date == business_date, accrual.loan_id == LoanBalance.loan_id)
+                    db.session.execute(
+                        update(LoanBalance)
+                        .where(
+                            LoanBalance.loan_id.in_(
+                                select(accrual.loan_id).where(
+                                    accrual.business_date == business_date,
+                                    accrual.loan_id >= loan_ids[0],
+                                    accrual.loan_id <= loan_ids[-1],
+                                )
+                            ),
+                            not_accrued,
+                        )
+                        .values(
+                            interest_accrued=LoanBalance.interest_accrued
+                            + select(accrual.interest).where(todays).scalar_subquery(),
+                            penal_interest_accrued=LoanBalance.penal_interest_accrued
+                            + select(accrual.penal_interest).where(todays).scalar_subquery(),
+                            accrued_through=business_date,
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+
+                run.last_loan_id = loan_ids[-1]
+                run.loans_accrued += int(accrued.size)
+                run.interest_total = float(run.interest_total) + float(interest.sum())
+                run.penal_interest_total = float(run.penal_interest_total) + float(penal.sum())
+                db.session.commit()
+                if progress is not None:
+                    progress(run.loans_accrued)
+
+            run.status = 'completed'
+            run.finished_at = datetime.utcnow()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return run
+
+    @staticmethod
+    def interest_figures(today=None, session=None):
+        """Dashboard interest from completed accrual runs: total and month-over-month change.
+
+        None until the first run completes. One aggregate over the run rows.
+        """
+        today = today or datetime.utcnow().date()
+        this_month = today.replace(day=1)
+        last_month = (this_month - timedelta(days=1)).replace(day=1)
+        earned = AccrualRun.interest_total + AccrualRun.penal_interest_total
+
+        runs, total, current, previous = (session or db.session).execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(earned), 0),
+                func.coalesce(func.sum(case((AccrualRun.business_date >= this_month, earned), else_=0)), 0),
+                func.coalesce(func.sum(case(
+                    (and_(AccrualRun.business_date >= last_month, AccrualRun.business_date < this_month), earned),
+                    else_=0,
+                )), 0),
+            ).where(AccrualRun.status == 'completed')
+        ).one()
+        if not runs:
+            return None
+        return {
+            'total_interest': round(float(total), 2),
+            'interest_change': _percent_change(current, previous),
+        }
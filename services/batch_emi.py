@@ -0,0 +1,157 @@
+"""
+Vectorized EMI and amortization for pricing many loan scenarios at once.
+
+Results match services/finance.py (and so /api/calculators/emi) to the paisa:
+the schedule is iterated month by month with the same floating point
+operations in the same order, only across every scenario at once, and
+rounding follows Python's round().
+"""
+import math
+
+import numpy as np
+
+# Guards for the HTTP endpoint; the library functions themselves are unbounded
+MAX_BATCH_SCENARIOS = 200_000
+MAX_SCHEDULE_ROWS = 5_000_000
+
+
+def round2(values):
+    """Round to 2 decimals exactly like Python's round(x, 2), elementwise.
+
+    np.round scales by 100 first, which can push values sitting right on a
+    half-paisa boundary to the wrong side. Those few are redone with round().
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scaled = values * 100
+    rounded = np.round(scaled) / 100
+
+    distance_to_half = np.abs(scaled - np.floor(scaled) - 0.5)
+    ambiguous = np.flatnonzero(distance_to_half <= 2 * np.spacing(scaled))
+    if ambiguous.size:
+        flat_values = values.reshape(-1)
+        flat_rounded = rounded.reshape(-1)
+        flat_rounded[ambiguous] = [round(float(flat_values[i]), 2) for i in ambiguous]
+    return rounded
+
+
+class BatchTooLarge(ValueError):
+    """More scenarios than the caller allows."""
+
+
+def prepare_inputs(principal, interest_rate, tenure_months, grid=False, max_scenarios=None):
+    """Broadcast scalars/sequences into equal-length 1-D float arrays.
+
+    With ``grid=True`` the inputs are combined as a cartesian product, which
+    is what rate sheets need (every amount x every rate x every tenure).
+    Raises BatchTooLarge, before anything is broadcast, when that would
+    give more than ``max_scenarios`` scenarios.
+    """
+    principal = np.atleast_1d(np.asarray(principal, dtype=np.float64))
+    interest_rate = np.atleast_1d(np.asarray(interest_rate, dtype=np.float64))
+    tenure_months = np.atleast_1d(np.asarray(tenure_months, dtype=np.int64))
+
+    if grid:
+        count = principal.size * interest_rate.size * tenure_months.size
+    else:
+        count = math.prod(np.broadcast_shapes(principal.shape, interest_rate.shape, tenure_months.shape))
+    if max_scenarios is not None and count > max_scenarios:
+        raise BatchTooLarge(f"At most {max_scenarios} scenarios per request")
+
+    if grid:
+        principal, interest_rate, tenure_months = np.meshgrid(
+            principal, interest_rate, tenure_months, indexing='ij'
+        )
+    else:
+        principal, interest_rate, tenure_months = np.broadcast_arrays(
+            principal, interest_rate, tenure_months
+        )
+
+    return principal.ravel(), interest_rate.ravel(), tenure_months.ravel()
+
+
+def invalid_scenarios(principal, interest_rate, tenure_months):
+    """Mask of the scenarios that cannot be priced: any input not finite and positive.
+
+    NaN compares false with everything, so it is caught by isfinite rather
+    than by the range checks.
+    """
+    return (~np.isfinite(principal) | ~np.isfinite(interest_rate)
+            | (principal <= 0) | (interest_rate <= 0) | (tenure_months <= 0))
+
+
+def batch_emi(principal, interest_rate, tenure_months):
+    """EMI, total amount and total interest for every scenario (unrounded)."""
+    principal = np.asarray(principal, dtype=np.float64)
+    monthly_rate = np.asarray(interest_rate, dtype=np.float64) / (12 * 100)
+    months = np.asarray(tenure_months, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + monthly_rate) ** months
+        emi = np.where(
+            monthly_rate == 0,
+            principal / months,
+            (principal * monthly_rate * growth) / (growth - 1),
+        )
+
+    total_amount = emi * months
+    return {
+        'emi': emi,
+        'total_amount': total_amount,
+        'total_interest': total_amount - principal,
+    }
+
+
+def batch_amortization(principal, interest_rate, tenure_months, emi=None):
+    """Full amortization schedules for every scenario in columnar form.
+
+    Schedules are ragged, so rows for all scenarios are concatenated and
+    ``offsets[i]:offsets[i + 1]`` selects the rows of scenario ``i``. Values
+    are unrounded; pass them through round2() for display.
+    """
+    principal = np.asarray(principal, dtype=np.float64)
+    monthly_rate = np.asarray(interest_rate, dtype=np.float64) / (12 * 100)
+    tenure = np.asarray(tenure_months, dtype=np.int64)
+    if emi is None:
+        emi = batch_emi(principal, interest_rate, tenure)['emi']
+
+    offsets = np.zeros(tenure.size + 1, dtype=np.int64)
+    np.cumsum(tenure, out=offsets[1:])
+    rows = int(offsets[-1])
+
+    month_col = np.empty(rows, dtype=np.int64)
+    principal_col = np.empty(rows, dtype=np.float64)
+    interest_col = np.empty(rows, dtype=np.float64)
+    balance_col = np.empty(rows, dtype=np.float64)
+
+    # Order scenarios longest-first so the schedules still running in any
+    # month are a prefix of the arrays and can be sliced instead of gathered
+    order = np.argsort(-tenure, kind='stable')
+    sorted_tenure = tenure[order]
+    descending_key = -sorted_tenure
+    rate_sorted = monthly_rate[order]
+    emi_sorted = emi[order]
+    start_sorted = offsets[:-1][order]
+    balance = principal[order]
+
+    # Step every schedule forward one month at a time, keeping the scalar
+    # endpoint's operation order so results are bit-identical
+    max_tenure = int(sorted_tenure[0]) if tenure.size else 0
+    for month in range(1, max_tenure + 1):
+        running = int(np.searchsorted(descending_key, -month, side='right'))
+        interest_payment = balance[:running] * rate_sorted[:running]
+        principal_payment = emi_sorted[:running] - interest_payment
+        balance[:running] -= principal_payment
+
+        positions = start_sorted[:running] + (month - 1)
+        month_col[positions] = month
+        interest_col[positions] = interest_payment
+        principal_col[positions] = principal_payment
+        balance_col[positions] = np.maximum(0, balance[:running])
+
+    return {
+        'offsets': offsets,
+        'month': month_col,
+        'principal': principal_col,
+        'interest': interest_col,
+        'balance': balance_col,
+    }
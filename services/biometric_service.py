@@ -0,0 +1,334 @@
+"""
+Fingerprint enrolment and 1:N identification.
+
+Capture devices (through their SDK) produce a fixed-length feature vector
+per finger; it is stored as TEMPLATE_DIM signed bytes in the
+``fingerprint_templates`` table. Identification compares a probe against
+every enrolled template by cosine similarity, using an in-memory NumPy
+index that each process builds from the table and tops up with new
+enrolments as they appear. Ids come from a sequence and are not committed
+in order, so each top-up also re-reads the last few ids below the highest
+one indexed, catching a lower id whose transaction committed late.
+
+Large indexes are split into partitions (spherical k-means over the
+templates) stored contiguously, so a search scans only the few partitions
+closest to the probe plus anything enrolled since the last rebuild.
+Candidates are always re-checked against the database before they are
+returned, so deleted templates never match.
+"""
+import base64
+import binascii
+import threading
+import time
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import delete, select
+
+from models import db, Customer, FingerprintTemplate
+
+TEMPLATE_DIM = 256
+
+DEFAULT_MATCH_THRESHOLD = 0.8
+
+# Rows converted to float32 at a time while scanning
+BLOCK_ROWS = 65536
+
+# Partitioning only pays off once each partition holds this many templates
+MIN_PARTITION_ROWS = 300
+
+# Ids below the highest indexed one re-read on every top-up (BIOMETRIC_REFRESH_WINDOW)
+REFRESH_WINDOW = 256
+
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLE_PER_PARTITION = 64
+
+FINGERS = (
+    'right_thumb', 'right_index', 'right_middle', 'right_ring', 'right_little',
+    'left_thumb', 'left_index', 'left_middle', 'left_ring', 'left_little', 'unknown',
+)
+
+
+class BiometricError(ValueError):
+    """A template could not be decoded or enrolled."""
+
+
+def encode_template(data):
+    """Decode a base64 template into TEMPLATE_DIM signed bytes.
+
+    Accepts either TEMPLATE_DIM float32 features (normalized and quantized
+    here) or an already quantized TEMPLATE_DIM-byte int8 template.
+    """
+    if isinstance(data, str):
+        try:
+            data = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            raise BiometricError("Template is not valid base64")
+
+    if len(data) == TEMPLATE_DIM * 4:
+        features = np.frombuffer(data, dtype='<f4').astype(np.float32)
+        peak = np.abs(features).max() if np.isfinite(features).all() else 0
+        if not peak:
+            raise BiometricError("Template has no usable features")
+        return np.round(features / peak * 127).astype(np.int8).tobytes()
+    if len(data) == TEMPLATE_DIM:
+        if not np.frombuffer(data, dtype=np.int8).any():
+            raise BiometricError("Template has no usable features")
+        return bytes(data)
+    raise BiometricError(f"Template must be {TEMPLATE_DIM} int8 or {TEMPLATE_DIM} float32 values")
+
+
+def _unit_rows(matrix):
+    rows = matrix.astype(np.float32)
+    rows /= np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-6)
+    return rows
+
+
+def _kmeans(matrix, partitions, seed=0):
+    """Spherical k-means centroids from a sample of the templates."""
+    random = np.random.default_rng(seed)
+    sample_size = min(len(matrix), partitions * KMEANS_SAMPLE_PER_PARTITION)
+    sample = _unit_rows(matrix[random.choice(len(matrix), sample_size, replace=False)])
+    centroids = sample[random.choice(sample_size, partitions, replace=False)].copy()
+
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for partition in range(partitions):
+            members = sample[assign == partition]
+            if len(members):
+                centroids[partition] = members.sum(axis=0)
+            else:
+                centroids[partition] = sample[random.integers(sample_size)]
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-6)
+    return centroids
+
+
+class FingerprintIndex:
+    """Enrolled templates as one int8 matrix, searchable by cosine similarity.
+
+    Rows ``[0, partitioned)`` are sorted by partition (``offsets`` bounds
+    each one); rows after that were added since the last rebuild and are
+    always scanned. Readers take a snapshot of the arrays, so searches never
+    block on an append or rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.high_water = 0
+        self.built_at = None
+        # Indexed ids inside the refresh window, so a re-read row is not added twice
+        self._recent = set()
+
+    def __len__(self):
+        return self._snapshot['size'] if self._snapshot else 0
+
+    def rebuild(self, rows, partitions=0, window=REFRESH_WINDOW):
+        """Replace the index with ``rows`` of (template id, template bytes)."""
+        ids, templates = [], []
+        for template_id, template in rows:
+            ids.append(template_id)
+            templates.append(template)
+        matrix = np.frombuffer(b''.join(templates), dtype=np.int8).reshape(-1, TEMPLATE_DIM)
+        ids = np.array(ids, dtype=np.int64)
+
+        offsets = centroids = None
+        if partitions > 1 and len(matrix) >= partitions * MIN_PARTITION_ROWS:
+            centroids = _kmeans(matrix, partitions)
+            assign = np.empty(len(matrix), dtype=np.int64)
+            for start in range(0, len(matrix), BLOCK_ROWS):
+                assign[start:start + BLOCK_ROWS] = np.argmax(
+                    matrix[start:start + BLOCK_ROWS].astype(np.float32) @ centroids.T, axis=1)
+            order = np.argsort(assign, kind='stable')
+            matrix, ids = matrix[order], ids[order]
+            offsets = np.searchsorted(assign[order], np.arange(partitions + 1))
+
+        snapshot = self._allocate(max(len(matrix) * 5 // 4, 1024))
+        size = len(matrix)
+        snapshot['matrix'][:size] = matrix
+        snapshot['inverse_norms'][:size] = self._inverse_norms(matrix)
+        snapshot['ids'][:size] = ids
+        snapshot.update(size=size, partitioned=size, offsets=offsets, centroids=centroids)
+
+        with self._lock:
+            self._snapshot = snapshot
+            self.high_water = int(ids.max()) if size else 0
+            self.built_at = time.monotonic()
+            self._recent = {int(template_id) for template_id in ids[ids > self.high_water - window]}
+
+    def add(self, rows, window=REFRESH_WINDOW):
+        """Append newly enrolled (template id, template bytes) rows; rows already indexed are skipped.
+
+        ``rows`` may repeat ids from the last ``window`` below the high water mark.
+        """
+        rows = [(template_id, template) for template_id, template in rows if template_id not in self._recent]
+        if not rows:
+            return
+        if self._snapshot is None:
+            return self.rebuild(rows, window=window)
+        matrix = np.frombuffer(b''.join(template for _, template in rows), dtype=np.int8).reshape(-1, TEMPLATE_DIM)
+        ids = np.array([template_id for template_id, _ in rows], dtype=np.int64)
+
+        with self._lock:
+            current = self._snapshot
+            size = current['size']
+            if size + len(rows) > len(current['ids']):
+                # Grow into new arrays; searches already running keep the old ones
+                grown = self._allocate(max((size + len(rows)) * 2, 1024))
+                for name in ('matrix', 'inverse_norms', 'ids'):
+                    grown[name][:size] = current[name][:size]
+                grown.update(partitioned=current['partitioned'], offsets=current['offsets'],
+                             centroids=current['centroids'])
+                current = grown
+            current['matrix'][size:size + len(rows)] = matrix
+            current['inverse_norms'][size:size + len(rows)] = self._inverse_norms(matrix)
+            current['ids'][size:size + len(rows)] = ids
+            self._snapshot = dict(current, size=size + len(rows))
+            self.high_water = max(self.high_water, int(ids.max()))
+            self._recent = {template_id for template_id in self._recent.union(ids.tolist())
+                            if template_id > self.high_water - window}
+
+    def search(self, probe, limit=5, probe_partitions=12):
+        """Best ``limit`` (template id, cosine similarity) pairs for a probe template."""
+        snapshot = self._snapshot
+        if not snapshot or not snapshot['size']:
+            return []
+        query = np.frombuffer(probe, dtype=np.int8).astype(np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-6)
+
+        if snapshot['offsets'] is not None:
+            offsets = snapshot['offsets']
+            closest = np.argsort(snapshot['centroids'] @ query)[::-1][:probe_partitions]
+            ranges = [(offsets[partition], offsets[partition + 1]) for partition in closest]
+            ranges.append((snapshot['partitioned'], snapshot['size']))
+        else:
+            ranges = [(0, snapshot['size'])]
+
+        matrix, inverse_norms = snapshot['matrix'], snapshot['inverse_norms']
+        best_rows, best_scores = [], []
+        for start, end in ranges:
+            for block in range(start, end, BLOCK_ROWS):
+                stop = min(block + BLOCK_ROWS, end)
+                scores = (matrix[block:stop].astype(np.float32) @ query) * inverse_norms[block:stop]
+                if len(scores) > limit:
+                    top = np.argpartition(scores, -limit)[-limit:]
+                else:
+                    top = np.arange(len(scores))
+                best_rows.append(top + block)
+                best_scores.append(scores[top])
+
+        if not best_rows:
+            return []
+        rows, scores = np.concatenate(best_rows), np.concatenate(best_scores)
+        order = np.argsort(scores)[::-1][:limit]
+        return [(int(snapshot['ids'][rows[i]]), float(scores[i])) for i in order]
+
+    @staticmethod
+    def _allocate(capacity):
+        return {
+            'matrix': np.empty((capacity, TEMPLATE_DIM), dtype=np.int8),
+            'inverse_norms': np.empty(capacity, dtype=np.float32),
+            'ids': np.empty(capacity, dtype=np.int64),
+            'size': 0, 'partitioned': 0, 'offsets': None, 'centroids': None,
+        }
+
+    @staticmethod
+    def _inverse_norms(matrix):
+        norms = np.linalg.norm(matrix.astype(np.float32), axis=1)
+        return 1.0 / np.maximum(norms, 1e-6)
+
+
+fingerprint_index = FingerprintIndex()
+
+
+class BiometricService:
+    _refresh_lock = threading.Lock()
+
+    @staticmethod
+    def enroll(customer, template, finger='unknown', quality=None):
+        """Add (or replace) the template for one of a customer's fingers; the caller commits."""
+        finger = finger or 'unknown'
+        if finger not in FINGERS:
+            raise BiometricError(f"finger must be one of {', '.join(FINGERS)}")
+        template = encode_template(template)
+
+        if customer.id is not None:
+            # A new id makes the index pick up the replacement
+            db.session.execute(delete(FingerprintTemplate).where(
+                FingerprintTemplate.customer_id == customer.id, FingerprintTemplate.finger == finger))
+        record = FingerprintTemplate(customer=customer, finger=finger, template=template, quality=quality)
+        db.session.add(record)
+        return record
+
+    @staticmethod
+    def refresh_index(force=False):
+        """Load templates enrolled since the last call, rebuilding periodically.
+
+        The full rebuild (every BIOMETRIC_REBUILD_SECONDS) drops deleted
+        templates and re-partitions; in between only rows past the high
+        water mark, and the BIOMETRIC_REFRESH_WINDOW ids just below it, are read.
+        """
+        config = current_app.config
+        window = config.get('BIOMETRIC_REFRESH_WINDOW', REFRESH_WINDOW)
+        with BiometricService._refresh_lock:
+            index = fingerprint_index
+            stale = index.built_at is None or \
+                time.monotonic() - index.built_at > config.get('BIOMETRIC_REBUILD_SECONDS', 3600)
+            if force or stale:
+                rows = db.session.execute(
+                    select(FingerprintTemplate.id, FingerprintTemplate.template)
+                    .execution_options(yield_per=10000)
+                )
+                index.rebuild(rows, partitions=config.get('BIOMETRIC_PARTITIONS', 64), window=window)
+            else:
+                index.add(db.session.execute(
+                    select(FingerprintTemplate.id, FingerprintTemplate.template)
+                    .where(FingerprintTemplate.id > index.high_water - window)
+                    .order_by(FingerprintTemplate.id)
+                ), window=window)
+        return len(fingerprint_index)
+
+    @staticmethod
+    def identify(template, limit=5, threshold=None, exclude_customer=None):
+        """Enrolled customers whose fingerprints best match a probe template.
+
+        Returns the top candidates (best first) with their similarity score;
+        ``matched`` is set on those at or above BIOMETRIC_MATCH_THRESHOLD.
+        """
+        probe = encode_template(template)
+        if threshold is None:
+            threshold = current_app.config.get('BIOMETRIC_MATCH_THRESHOLD', DEFAULT_MATCH_THRESHOLD)
+        BiometricService.refresh_index()
+
+        # Ask for extra candidates: several may belong to one customer
+        scores = dict(fingerprint_index.search(
+            probe, limit=limit * 3,
+            probe_partitions=current_app.config.get('BIOMETRIC_PROBE_PARTITIONS', 12),
+        ))
+        if not scores:
+            return []
+
+        rows = db.session.execute(
+            select(FingerprintTemplate.id, FingerprintTemplate.finger, Customer)
+            .join(Customer, Customer.id == FingerprintTemplate.customer_id)
+            .where(FingerprintTemplate.id.in_(scores))
+        ).all()
+
+        matches = {}
+        for template_id, finger, customer in sorted(rows, key=lambda row: -scores[row[0]]):
+            if customer.id in matches or customer.id == exclude_customer:
+                continue
+            score = round(scores[template_id], 4)
+            matches[customer.id] = {
+                'customer': {
+                    'id': str(customer.id),
+                    'name': customer.name,
+                    'father_name': customer.father_name or "Not provided",
+                    'mobile': customer.mobile,
+                    'address': customer.address or "Not provided",
+                },
+                'finger': finger,
+                'score': score,
+                'matched': score >= threshold,
+            }
+        return list(matches.values())[:limit]
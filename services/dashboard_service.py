@@ -1,46 +1,44 @@
-from models import db, Customer, Loan, Payment
-from sqlalchemy import func
+from services.accrual_service import AccrualService
+from services.repository import LoanRepository
+from services.rollup_service import RollupService
 
 
 class DashboardService:
     @staticmethod
-    def get_dashboard_metrics():
-        try:
-            # Total active customers
-            total_customers = Customer.query.filter_by(status='active').count()
+    def stats(session=None):
+        """Everything the dashboard shows, as the JSON document /api/dashboard/stats returns."""
+        # Totals, trends and the loan type mix come from the rollup tables
+        stats = RollupService.dashboard_figures(session=session)
 
-            # Total disbursed amount
-            total_disbursed = db.session.query(
-                func.coalesce(func.sum(Loan.principal_amount), 0)
-            ).filter_by(status='active').scalar()
+        # Interest earned is the daily accruals once the nightly batch has run
+        accrued = AccrualService.interest_figures(session=session)
+        if accrued is not None:
+            stats.update(accrued)
 
-            # Total interest collected
-            total_interest = db.session.query(
-                func.coalesce(func.sum(Payment.interest_amount), 0)
-            ).scalar()
+        # Open loans are counted through the status index
+        stats['active_loans'] = LoanRepository.open_count(session)
 
-            # Active loans count
-            active_loans = Loan.query.filter_by(status='active').count()
+        # Latest 5 loans and payments, one joined query each
+        recent_loans = []
+        for loan in LoanRepository.recent(5, session):
+            recent_loans.append({
+                'id': loan.loan_number,
+                'customer': loan.customer_name,
+                'amount': float(loan.principal_amount),
+                'type': loan.loan_type.title(),
+                'date': loan.disbursed_date.isoformat() if loan.disbursed_date else None
+            })
 
-            # Overdue loans (past maturity date)
-            overdue_loans = Loan.query.filter(
-                Loan.maturity_date < func.now(),
-                Loan.status == 'active'
-            ).count()
+        recent_payments = []
+        for payment in LoanRepository.recent_payments(5, session):
+            recent_payments.append({
+                'id': payment.payment_number,
+                'customer': payment.customer_name,
+                'amount': float(payment.payment_amount),
+                'loan_id': payment.loan_number,
+                'date': payment.payment_date.isoformat() if payment.payment_date else None
+            })
 
-            return {
-                'total_customers': total_customers,
-                'total_disbursed': float(total_disbursed),
-                'total_interest': float(total_interest),
-                'active_loans': active_loans,
-                'overdue_loans': overdue_loans
-            }
-        except Exception as e:
-            print(f"Dashboard metrics error: {e}")
-            return {
-                'total_customers': 0,
-                'total_disbursed': 0.0,
-                'total_interest': 0.0,
-                'active_loans': 0,
-                'overdue_loans': 0
-            }
\ No newline at end of file
+        stats['recentLoans'] = recent_loans
+        stats['recentPayments'] = recent_payments
+        return stats
@@ -0,0 +1,521 @@
+"""
+KYC and loan documents (PAN/Aadhaar photos, surety photos, bond papers).
+
+Uploads are staged to disk in fixed-size chunks and hashed on the way, so a
+large scan never sits in memory, then moved into the content-addressed
+store (storage.py) under their SHA-256. Identical files are kept once;
+rows refer to them as ``documents/<sha256><ext>`` and every reference is
+counted in ``stored_objects`` within the same transaction as the row.
+References a customer or loan drops, by replacing a document or by being
+deleted, are released in the flush that writes the change.
+
+Large files can also be sent in pieces through the chunked upload API
+(begin_upload / append_chunk), which keeps every request short.
+
+Thumbnails for images and a rendered first page for PDFs are produced by a
+background job in the 'media' pool and stored next to the original. List
+views link to thumbnail_url(), which serves the original until the
+thumbnail exists.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, url_for
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from models import db, Customer, Loan, StoredObject
+from storage import store as object_store
+
+logger = logging.getLogger(__name__)
+
+# Bytes read and written per step when copying or hashing a file
+CHUNK_SIZE = 1024 * 1024
+
+# Suggested piece size for the chunked upload API; must stay under MAX_CONTENT_LENGTH
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+THUMBNAIL_SIZE = (320, 320)
+PREVIEW_SIZE = (1240, 1754)  # First page of PDFs, roughly A4 at 150 dpi
+
+PARTIAL_DIR = '.partial'
+
+# Prefix of document references stored on customers and loans
+REFERENCE_PREFIX = 'documents/'
+
+# Completed chunked uploads not claimed by a form within this long are abandoned
+UNCLAIMED_UPLOAD_SECONDS = 24 * 3600
+
+# Columns holding counted references: a reference string, or a dict of them
+_REFERENCE_ATTRIBUTES = {
+    Customer: ('pan_photo_url', 'aadhar_photo_url'),
+    Loan: ('document_urls',),
+}
+
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# (magic bytes, content type, extension); WebP is checked separately
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png', '.png'),
+    (b'GIF87a', 'image/gif', '.gif'),
+    (b'GIF89a', 'image/gif', '.gif'),
+    (b'%PDF-', 'application/pdf', '.pdf'),
+)
+
+
+class DocumentError(ValueError):
+    """Raised for oversized, unknown or out-of-order uploads."""
+
+
+def sniff(head):
+    """(content type, extension) from the first bytes of a file."""
+    for signature, content_type, extension in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type, extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp', '.webp'
+    return 'application/octet-stream', '.bin'
+
+
+def _staging_dir():
+    """Where uploads are assembled before they enter the store (on the same disk for local stores)."""
+    path = current_app.config.get('STORAGE_STAGING_PATH') or \
+        os.path.join(current_app.config.get('STORAGE_PATH', 'documents'), PARTIAL_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _max_size():
+    return current_app.config.get('DOCUMENT_MAX_SIZE', 64 * 1024 * 1024)
+
+
+def _derivative_name(name, kind):
+    return f"{name.split('.', 1)[0]}_{kind}.jpg"
+
+
+def _name(reference):
+    """Stored object name from a ``documents/...`` reference, or None for legacy upload paths."""
+    if reference and reference.startswith(REFERENCE_PREFIX):
+        return reference[len(REFERENCE_PREFIX):]
+    return None
+
+
+def _references(values):
+    """Counted references in a list of column values."""
+    references = Counter()
+    for value in values:
+        for reference in (value.values() if isinstance(value, dict) else [value]):
+            if isinstance(reference, str) and _name(reference):
+                references[reference] += 1
+    return references
+
+
+@event.listens_for(Session, 'before_flush')
+def _release_dropped_references(session, flush_context, instances):
+    """Release the references customers and loans lose in this flush, replaced or deleted."""
+    dropped = Counter()
+    for obj in session.dirty:
+        attrs = _REFERENCE_ATTRIBUTES.get(type(obj))
+        if not attrs or not session.is_modified(obj):
+            continue
+        for attr in attrs:
+            history = get_history(obj, attr)
+            if history.deleted:
+                dropped += _references(history.deleted) - _references(history.non_deleted())
+    for obj in session.deleted:
+        attrs = _REFERENCE_ATTRIBUTES.get(type(obj))
+        if attrs:
+            dropped += _references(value for attr in attrs for value in get_history(obj, attr).non_added())
+
+    with session.no_autoflush:
+        for reference, count in dropped.items():
+            DocumentService.release(reference, count, session=session)
+
+
+class DocumentService:
+    @staticmethod
+    def save_upload(upload, prefix):
+        """Store a werkzeug FileStorage from a form and count the reference; returns the metadata."""
+        document = DocumentService.store(upload.stream, prefix, upload.filename)
+        DocumentService.attach(document)
+        return document
+
+    @staticmethod
+    def store(stream, prefix, original_name=None):
+        """Copy ``stream`` into the store chunk by chunk; returns the document metadata."""
+        temp_path = os.path.join(_staging_dir(), f"{uuid.uuid4().hex}.part")
+
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+        try:
+            with open(temp_path, 'wb') as output:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > _max_size():
+                        raise DocumentError(f"File is larger than {_max_size() // (1024 * 1024)} MB")
+                    if len(head) < 16:
+                        head += chunk[:16]
+                    digest.update(chunk)
+                    output.write(chunk)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+        return DocumentService._finalize(temp_path, prefix, original_name, digest.hexdigest(), size, head)
+
+    @staticmethod
+    def _finalize(temp_path, prefix, original_name, sha256, size, head):
+        content_type, extension = sniff(head)
+        name = f"{sha256}{extension}"
+        # An identical file already in the store is reused and the temp copy dropped
+        object_store.put_file(name, temp_path, content_type)
+        return {
+            'url': REFERENCE_PREFIX + name,
+            'name': name,
+            'kind': prefix,
+            'original_name': original_name,
+            'content_type': content_type,
+            'size': size,
+            'sha256': sha256,
+            'upload_date': str(datetime.now()),
+        }
+
+    # --- CHUNKED UPLOADS ---
+
+    @staticmethod
+    def begin_upload(prefix, original_name, total_size):
+        """Start a chunked upload and return its id."""
+        if total_size <= 0 or total_size > _max_size():
+            raise DocumentError(f"File size must be between 1 byte and {_max_size() // (1024 * 1024)} MB")
+
+        upload_id = uuid.uuid4().hex
+        partial_dir = _staging_dir()
+        with open(os.path.join(partial_dir, f"{upload_id}.json"), 'w') as state:
+            json.dump({'prefix': prefix, 'original_name': original_name, 'total_size': total_size}, state)
+        open(os.path.join(partial_dir, f"{upload_id}.part"), 'wb').close()
+        return upload_id
+
+    @staticmethod
+    def _upload_paths(upload_id):
+        if not _UPLOAD_ID.match(upload_id or ''):
+            raise DocumentError("Unknown upload")
+        base = os.path.join(_staging_dir(), upload_id)
+        if not os.path.exists(base + '.json'):
+            raise DocumentError("Unknown upload")
+        return base + '.json', base + '.part'
+
+    @staticmethod
+    def append_chunk(upload_id, offset, stream):
+        """Append one piece at ``offset``; returns (bytes received, metadata once complete).
+
+        A piece whose offset does not match what has been received so far is
+        rejected, so the client can resume from the returned position.
+        """
+        state_path, part_path = DocumentService._upload_paths(upload_id)
+        with open(state_path) as state_file:
+            state = json.load(state_file)
+        if 'document' in state:
+            return state['total_size'], state['document']
+
+        received = os.path.getsize(part_path)
+        if offset != received:
+            raise DocumentError(f"Expected offset {received}")
+
+        with open(part_path, 'ab') as output:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if received > state['total_size']:
+                    output.truncate(offset)
+                    raise DocumentError("Upload is larger than announced")
+                output.write(chunk)
+
+        if received < state['total_size']:
+            return received, None
+
+        # Hash the assembled file in one pass; hash state cannot be kept between requests
+        digest = hashlib.sha256()
+        with open(part_path, 'rb') as assembled:
+            head = assembled.read(16)
+            digest.update(head)
+            for chunk in iter(lambda: assembled.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+        document = DocumentService._finalize(
+            part_path, state['prefix'], state['original_name'], digest.hexdigest(), received, head
+        )
+        state['document'] = document
+        with open(state_path, 'w') as state_file:
+            json.dump(state, state_file)
+        return received, document
+
+    @staticmethod
+    def claim_upload(upload_id, prefix):
+        """Metadata of a completed chunked upload, consumed by the form that references it."""
+        state_path, _ = DocumentService._upload_paths(upload_id)
+        with open(state_path) as state_file:
+            state = json.load(state_file)
+        if 'document' not in state:
+            raise DocumentError("Upload is not complete")
+        if state['prefix'] != prefix:
+            raise DocumentError("Upload was started for a different document")
+        os.remove(state_path)
+        DocumentService.attach(state['document'])
+        return state['document']
+
+    # --- REFERENCE COUNTING ---
+
+    @staticmethod
+    def attach(document):
+        """Count one more reference to a stored document, in the current transaction."""
+        table = StoredObject.__table__
+        sha256 = document['name'].split('.', 1)[0]
+        values = {
+            'sha256': sha256,
+            'extension': document['name'][len(sha256):],
+            'content_type': document['content_type'],
+            'size': document['size'],
+            'refcount': 1,
+            'created_at': datetime.utcnow(),
+        }
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert as upsert
+            else:
+                from sqlalchemy.dialects.postgresql import insert as upsert
+            statement = upsert(table).values(**values)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=['sha256'], set_={'refcount': table.c.refcount + 1}
+            ))
+        else:
+            result = db.session.execute(
+                update(table).where(table.c.sha256 == sha256).values(refcount=table.c.refcount + 1)
+            )
+            if result.rowcount == 0:
+                db.session.execute(table.insert().values(**values))
+
+    @staticmethod
+    def release(reference, count=1, session=None):
+        """Drop references; the object is deleted by collect_garbage() once unreferenced.
+
+        Customers and loans release theirs on flush; call this only for
+        references kept elsewhere.
+        """
+        name = _name(reference)
+        if name is None:
+            return
+        table = StoredObject.__table__
+        (session or db.session).execute(
+            update(table).where(table.c.sha256 == name.split('.', 1)[0]).values(refcount=table.c.refcount - count)
+        )
+
+    @staticmethod
+    def _awaiting_claim(unclaimed_seconds=UNCLAIMED_UPLOAD_SECONDS):
+        """Hashes of completed chunked uploads a form may still claim; abandoned ones are removed."""
+        pending = set()
+        partial_dir = _staging_dir()
+        cutoff = time.time() - unclaimed_seconds
+        for entry in os.scandir(partial_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            part_path = entry.path[:-len('.json')] + '.part'
+            try:
+                with open(entry.path) as state_file:
+                    state = json.load(state_file)
+                # Appending a piece touches only the .part file
+                touched = max(entry.stat().st_mtime, os.path.getmtime(part_path) if os.path.exists(part_path) else 0)
+                if touched < cutoff:
+                    os.remove(entry.path)
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                elif 'document' in state:
+                    pending.add(state['document']['sha256'])
+            except (OSError, ValueError, KeyError):
+                # Claimed or rewritten meanwhile
+                continue
+        return pending
+
+    @staticmethod
+    def collect_garbage(grace_seconds=3600, unclaimed_seconds=UNCLAIMED_UPLOAD_SECONDS):
+        """Delete stored objects with no references; returns how many were removed.
+
+        Files written less than ``grace_seconds`` ago are left alone, since
+        their row may not be committed yet, and so are completed chunked
+        uploads still waiting to be claimed (for up to ``unclaimed_seconds``).
+        """
+        live = set(db.session.scalars(select(StoredObject.sha256).where(StoredObject.refcount > 0)))
+        live |= DocumentService._awaiting_claim(unclaimed_seconds)
+        removed = 0
+        for name in list(object_store.iter_names(older_than=grace_seconds)):
+            if name.split('.', 1)[0].split('_', 1)[0] not in live:
+                object_store.delete(name)
+                removed += 1
+        db.session.query(StoredObject).filter(StoredObject.refcount <= 0).delete(synchronize_session=False)
+        db.session.commit()
+        return removed
+
+    @staticmethod
+    def migrate_legacy(batch_size=100):
+        """Move files referenced as ``uploads/...`` into the store and rewrite the references.
+
+        Returns (references rewritten, files missing on disk).
+        """
+        static_folder = current_app.static_folder
+        moved = {}
+        missing = 0
+
+        def convert(reference, prefix):
+            nonlocal missing
+            if not reference or not reference.startswith('uploads/'):
+                return reference, None
+            if reference in moved:
+                document = moved[reference]
+            else:
+                path = os.path.join(static_folder, reference)
+                if not os.path.exists(path):
+                    missing += 1
+                    return reference, None
+                with open(path, 'rb') as handle:
+                    document = DocumentService.store(handle, prefix, os.path.basename(path))
+                moved[reference] = document
+            DocumentService.attach(document)
+            return document['url'], document
+
+        rewritten = 0
+        customers = Customer.query.filter(
+            (Customer.pan_photo_url.like('uploads/%')) | (Customer.aadhar_photo_url.like('uploads/%'))
+        ).yield_per(batch_size)
+        for customer in customers:
+            customer.pan_photo_url, pan = convert(customer.pan_photo_url, 'pan')
+            customer.aadhar_photo_url, aadhar = convert(customer.aadhar_photo_url, 'aadhar')
+            metadata = json.loads(customer.document_metadata) if customer.document_metadata else {}
+            for key, document in (('pan_document', pan), ('aadhar_document', aadhar)):
+                if document:
+                    metadata[key] = document
+                    rewritten += 1
+            customer.document_metadata = json.dumps(metadata) if metadata else None
+
+        for loan in Loan.query.filter(Loan.document_urls.isnot(None)).yield_per(batch_size):
+            document_urls = dict(loan.document_urls or {})
+            if not any(str(value).startswith('uploads/') for value in document_urls.values()):
+                continue
+            for key, prefix in (('bond_paper', 'bond'), ('surety_photo', 'surety')):
+                document_urls[key], document = convert(document_urls.get(key), prefix)
+                rewritten += document is not None
+            loan.document_urls = {key: value for key, value in document_urls.items() if value}
+
+            collateral = dict(loan.collateral_details or {})
+            surety = dict(collateral.get('surety') or {})
+            if (surety.get('photo_url') or '').startswith('uploads/') and document_urls.get('surety_photo'):
+                # Same file as document_urls['surety_photo'], already counted there
+                surety['photo_url'] = document_urls['surety_photo']
+                collateral['surety'] = surety
+                loan.collateral_details = collateral
+
+        db.session.commit()
+        DocumentService.queue_derivatives(*moved.values())
+        return rewritten, missing
+
+    # --- DERIVATIVES ---
+
+    @staticmethod
+    def queue_derivatives(*documents):
+        """Schedule thumbnail/preview generation; call after the owning row is committed."""
+        from services.job_service import job_queue
+
+        for document in documents:
+            if not document or document['content_type'] == 'application/octet-stream':
+                continue
+            # Deduplicated uploads already have their derivatives
+            if not object_store.exists(_derivative_name(document['name'], 'thumb')):
+                job_queue.submit('document_derivatives', {'name': document['name']})
+
+    @staticmethod
+    def url(reference):
+        """URL a browser can open for a stored document reference."""
+        if not reference:
+            return None
+        name = _name(reference)
+        if name is None:
+            # Uploads from before the document store live under static/
+            return url_for('static', filename=reference)
+        return url_for('document_file', name=name)
+
+    @staticmethod
+    def thumbnail_url(reference):
+        """URL for a small version of a stored document, for list views."""
+        name = _name(reference)
+        if name is None:
+            return DocumentService.url(reference)
+        return url_for('document_thumbnail', name=name)
+
+    @staticmethod
+    def derivative_name(name, kind):
+        """Store name of a derivative ('thumb' or 'preview') of a stored object."""
+        return _derivative_name(name, kind)
+
+    @staticmethod
+    def generate_derivatives(name):
+        """Build the thumbnail (and first-page preview for PDFs) of a stored document."""
+        from PIL import Image, ImageOps
+
+        with object_store.open(name) as handle:
+            data = handle.read()
+        content_type, _ = sniff(data[:16])
+
+        if content_type == 'application/pdf':
+            image = DocumentService._render_first_page(data, name)
+            if image is None:
+                return {'derivatives': []}
+        else:
+            image = Image.open(io.BytesIO(data))
+            # JPEG can decode straight at a reduced scale, far cheaper than a full decode
+            image.draft('RGB', (THUMBNAIL_SIZE[0] * 2, THUMBNAIL_SIZE[1] * 2))
+            image = ImageOps.exif_transpose(image)
+
+        image = image.convert('RGB')
+
+        built = []
+        sizes = (('preview', PREVIEW_SIZE), ('thumb', THUMBNAIL_SIZE)) \
+            if content_type == 'application/pdf' else (('thumb', THUMBNAIL_SIZE),)
+        for kind, size in sizes:
+            derived = image.copy()
+            derived.thumbnail(size)
+            output = io.BytesIO()
+            derived.save(output, 'JPEG', quality=80, optimize=True)
+            object_store.put_bytes(_derivative_name(name, kind), output.getvalue(), 'image/jpeg')
+            built.append(kind)
+        return {'derivatives': built}
+
+    @staticmethod
+    def _render_first_page(data, name):
+        """First page of a PDF as a PIL image, or None when PyMuPDF is not installed."""
+        try:
+            import pymupdf
+        except ImportError:
+            logger.warning("PyMuPDF is not installed; skipping PDF preview for %s", name)
+            return None
+        from PIL import Image
+
+        with pymupdf.open(stream=data, filetype='pdf') as pdf:
+            page = pdf[0]
+            zoom = min(PREVIEW_SIZE[0] / page.rect.width, PREVIEW_SIZE[1] / page.rect.height)
+            pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+            return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
@@ -0,0 +1,161 @@
+"""
+Loan arithmetic shared by the calculators, loan creation and reports.
+
+The closed-form pieces (compound growth per rate/tenure, and the factor table
+for the fixed gold loan tenure options) are memoized. Formulas keep the exact
+floating point operation order the calculators have always used, so figures
+do not shift by a paisa between releases; services/batch_emi.py follows the
+same order for vectorized pricing.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+
+from dateutil.relativedelta import relativedelta
+
+# Gold loan tenure options offered at the counter: (months, annual rate %)
+GOLD_TENURE_OPTIONS = (
+    (6, 10.5),
+    (12, 11.0),
+    (18, 11.5),
+    (24, 12.0),
+    (36, 12.5),
+)
+
+DEFAULT_GOLD_RATE = 5500  # Rupees per gram
+DEFAULT_LTV_RATIO = 75  # Percent of gold value lent
+
+CENT = Decimal('0.01')
+
+
+def monthly_rate(annual_rate):
+    """Monthly interest rate as a fraction, from an annual percentage."""
+    return annual_rate / (12 * 100)
+
+
+@lru_cache(maxsize=4096)
+def compound_growth(rate, months):
+    """(1 + r)^n for a monthly rate ``r``; the expensive part of the EMI formula."""
+    return (1 + rate) ** months
+
+
+def emi(principal, annual_rate, tenure_months):
+    """Equated monthly instalment: P x R x (1+R)^N / ((1+R)^N - 1)."""
+    rate = monthly_rate(annual_rate)
+    if rate == 0:
+        return principal / tenure_months
+    growth = compound_growth(rate, tenure_months)
+    return (principal * rate * growth) / (growth - 1)
+
+
+def loan_summary(principal, annual_rate, tenure_months):
+    """EMI, total repayable and total interest (unrounded)."""
+    instalment = emi(principal, annual_rate, tenure_months)
+    total_amount = instalment * tenure_months
+    return {
+        'emi': instalment,
+        'total_amount': total_amount,
+        'total_interest': total_amount - principal,
+    }
+
+
+def amortization_schedule(principal, annual_rate, tenure_months, instalment=None):
+    """Month-by-month split of each EMI into principal and interest, rounded for display."""
+    rate = monthly_rate(annual_rate)
+    if instalment is None:
+        instalment = emi(principal, annual_rate, tenure_months)
+
+    schedule = []
+    balance = principal
+    for month in range(1, tenure_months + 1):
+        interest_payment = balance * rate
+        principal_payment = instalment - interest_payment
+        balance -= principal_payment
+
+        schedule.append({
+            'month': month,
+            'emi': round(instalment, 2),
+            'principal': round(principal_payment, 2),
+            'interest': round(interest_payment, 2),
+            'balance': round(max(0, balance), 2)
+        })
+    return schedule
+
+
+@lru_cache(maxsize=4096)
+def repayment_schedule(principal, annual_rate, tenure_months):
+    """Exact (interest, principal) due per instalment, in Decimal rupees, for the payment ledger.
+
+    Each instalment is the EMI rounded to the paisa; its interest is the
+    balance times the monthly rate, also rounded, and the final instalment
+    takes whatever principal is left, so the principal parts always add up
+    to ``principal`` exactly. Arguments must be hashable (Decimals or ints).
+    """
+    principal = Decimal(principal)
+    tenure_months = int(tenure_months)
+    rate = Decimal(annual_rate) / 1200
+    instalment = Decimal(repr(emi(float(principal), float(annual_rate), tenure_months)))
+    instalment = instalment.quantize(CENT, ROUND_HALF_UP)
+
+    schedule = []
+    balance = principal
+    for month in range(1, tenure_months + 1):
+        interest = (balance * rate).quantize(CENT, ROUND_HALF_UP)
+        if month == tenure_months:
+            principal_part = balance
+        else:
+            principal_part = min(max(instalment - interest, Decimal(0)), balance)
+        balance -= principal_part
+        schedule.append((interest, principal_part))
+    return tuple(schedule)
+
+
+def gold_value(weight, purity, rate_per_gram=DEFAULT_GOLD_RATE):
+    """Market value of gold of ``purity`` percent."""
+    return weight * (purity / 100) * rate_per_gram
+
+
+def max_loan_amount(collateral_value, ltv_ratio=DEFAULT_LTV_RATIO):
+    """Largest loan allowed against collateral at the given loan-to-value percentage."""
+    return collateral_value * (ltv_ratio / 100)
+
+
+def loan_to_value(principal, collateral_value):
+    """Loan-to-value percentage of an existing loan, or None without collateral."""
+    if not collateral_value:
+        return None
+    return principal / collateral_value * 100
+
+
+@lru_cache(maxsize=32)
+def tenure_option_factors(options=GOLD_TENURE_OPTIONS):
+    """Precomputed (months, annual rate, monthly rate, growth) for a rate table."""
+    factors = []
+    for months, annual_rate in options:
+        rate = monthly_rate(annual_rate)
+        factors.append((months, annual_rate, rate, compound_growth(rate, months) if rate else None))
+    return tuple(factors)
+
+
+def tenure_options(amount, options=GOLD_TENURE_OPTIONS):
+    """EMI and totals for ``amount`` under every option of a rate table, rounded for display."""
+    loan_options = []
+    for months, annual_rate, rate, growth in tenure_option_factors(tuple(options)):
+        if rate == 0:
+            instalment = amount / months
+        else:
+            instalment = (amount * rate * growth) / (growth - 1)
+
+        total_amount = instalment * months
+        loan_options.append({
+            'tenure_months': months,
+            'interest_rate': annual_rate,
+            'emi': round(instalment, 2),
+            'total_amount': round(total_amount, 2),
+            'total_interest': round(total_amount - amount, 2)
+        })
+    return loan_options
+
+
+def maturity_date(disbursed_date, tenure_months):
+    """Date the final instalment falls due."""
+    return disbursed_date + relativedelta(months=int(tenure_months))
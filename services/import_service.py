@@ -0,0 +1,376 @@
+"""
+Bulk import of customers and loans from CSV or JSONL files.
+
+The file is read one row at a time and processed in batches: each batch is
+validated, inserted with a single executemany per table and committed
+together with its checkpoint, rollup deltas and, for loans, the ledger
+accounts payments are posted against. A failed or interrupted
+import can be run again and continues after the last committed batch.
+
+Rows that fail validation are skipped and written to ``<file>.errors.jsonl``
+with their row number, so the rest of the file still loads.
+"""
+import csv
+import json
+import os
+import re
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import insert, select
+
+from models import db, Customer, Loan, ImportCheckpoint, LedgerEntry, LoanBalance, LOAN_STATUSES
+from sequences import issuable
+from services import finance
+from services.payment_service import PaymentService
+from services.rollup_service import RollupService
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Only the first few errors are returned inline; the rest are in the errors file
+MAX_REPORTED_ERRORS = 50
+
+_MOBILE = re.compile(r'^\d{10,15}$')
+_AADHAR = re.compile(r'^\d{12}$')
+_PAN = re.compile(r'^[A-Z]{5}\d{4}[A-Z]$')
+
+class ImportDataError(ValueError):
+    """Raised when a whole file cannot be imported (unknown kind, format or columns)."""
+
+
+class RowError(ValueError):
+    """A single row failed validation."""
+
+
+def _text(row, field, max_length=None, required=False):
+    value = row.get(field)
+    value = str(value).strip() if value is not None else ''
+    if not value:
+        if required:
+            raise RowError(f"{field} is required")
+        return None
+    if max_length and len(value) > max_length:
+        raise RowError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def _digits(value):
+    return re.sub(r'[\s+-]', '', value) if value else value
+
+
+def _decimal(row, field, minimum=None, maximum=None):
+    try:
+        value = Decimal(str(row.get(field)).strip().replace(',', ''))
+    except (InvalidOperation, AttributeError):
+        raise RowError(f"{field} must be a number")
+    if not value.is_finite() or (minimum is not None and value < minimum) \
+            or (maximum is not None and value > maximum):
+        raise RowError(f"{field} is out of range")
+    return value
+
+
+def _datetime(row, field):
+    value = _text(row, field)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise RowError(f"{field} must be an ISO date")
+
+
+def _read_rows(path, required_columns):
+    """Row dicts from a .csv or .jsonl file, read lazily so the file is never loaded whole.
+
+    The file type and CSV header are checked up front, before anything is written.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in ('.csv', '.jsonl', '.ndjson'):
+        raise ImportDataError(f"Unsupported file type {extension!r} (use .csv or .jsonl)")
+
+    if extension == '.csv':
+        handle = open(path, newline='', encoding='utf-8-sig')
+        reader = csv.DictReader(handle)
+        missing = [column for column in required_columns if column not in (reader.fieldnames or [])]
+        if missing:
+            handle.close()
+            raise ImportDataError(f"Missing column(s): {', '.join(missing)}")
+
+        def csv_rows():
+            with handle:
+                yield from reader
+        return csv_rows()
+
+    def jsonl_rows():
+        with open(path, encoding='utf-8') as handle:
+            for line in handle:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = RowError(f"Invalid JSON: {e}")
+                yield row if isinstance(row, (dict, RowError)) else RowError("Each line must be a JSON object")
+    return jsonl_rows()
+
+
+class _CustomerImporter:
+    model = Customer
+    required_columns = ('name', 'mobile')
+
+    def validate(self, row, now):
+        mobile = _digits(_text(row, 'mobile', required=True))
+        if not _MOBILE.match(mobile):
+            raise RowError("mobile must have 10 to 15 digits")
+        additional_mobile = _digits(_text(row, 'additional_mobile'))
+        if additional_mobile and not _MOBILE.match(additional_mobile):
+            raise RowError("additional_mobile must have 10 to 15 digits")
+        aadhar_number = _digits(_text(row, 'aadhar_number'))
+        if aadhar_number and not _AADHAR.match(aadhar_number):
+            raise RowError("aadhar_number must have 12 digits")
+        pan_number = _text(row, 'pan_number')
+        if pan_number:
+            pan_number = pan_number.upper()
+            if not _PAN.match(pan_number):
+                raise RowError("pan_number must look like ABCDE1234F")
+
+        return {
+            'id': uuid.uuid4(),
+            'name': _text(row, 'name', 100, required=True),
+            'mobile': mobile,
+            'additional_mobile': additional_mobile,
+            'father_name': _text(row, 'father_name', 100),
+            'mother_name': _text(row, 'mother_name', 100),
+            'email': _text(row, 'email', 100),
+            'address': _text(row, 'address'),
+            'aadhar_number': aadhar_number,
+            'pan_number': pan_number,
+            'created_at': _datetime(row, 'created_at') or now,
+            'updated_at': now,
+        }
+
+    def resolve(self, records):
+        return records
+
+    def after_insert(self, records):
+        pass
+
+    def contribution(self, record):
+        return record['created_at'].date(), '', {'new_customers': 1}
+
+
+class _LoanImporter:
+    model = Loan
+    required_columns = ('loan_number', 'principal_amount', 'interest_rate', 'tenure_months')
+
+    def validate(self, row, now):
+        customer_id = _text(row, 'customer_id')
+        customer_mobile = _digits(_text(row, 'customer_mobile'))
+        if customer_id:
+            try:
+                customer_id = uuid.UUID(customer_id)
+            except ValueError:
+                raise RowError("customer_id is not a valid UUID")
+        elif not customer_mobile:
+            raise RowError("customer_id or customer_mobile is required")
+
+        tenure = _decimal(row, 'tenure_months', minimum=1, maximum=600)
+        if tenure != tenure.to_integral_value():
+            raise RowError("tenure_months must be a whole number")
+        disbursed_date = _datetime(row, 'disbursed_date') or now
+        status = _text(row, 'status') or 'pending'
+        if status not in LOAN_STATUSES:
+            raise RowError(f"status must be one of {', '.join(LOAN_STATUSES)}")
+        loan_number = _text(row, 'loan_number', 20, required=True)
+        if issuable(loan_number, now):
+            # The sequences could hand the same number out later; earlier days are closed
+            raise RowError("loan_number must not be a generated number (XL-YYYYMMDD-N) dated today or later")
+
+        return {
+            'id': uuid.uuid4(),
+            'customer_id': customer_id,
+            '_customer_mobile': customer_mobile,
+            'loan_number': loan_number,
+            'principal_amount': _decimal(row, 'principal_amount', minimum=Decimal('0.01')),
+            'interest_rate': _decimal(row, 'interest_rate', minimum=0, maximum=100),
+            'tenure_months': int(tenure),
+            'disbursed_date': disbursed_date,
+            'maturity_date': _datetime(row, 'maturity_date') or finance.maturity_date(disbursed_date, tenure),
+            'loan_type': _text(row, 'loan_type', 50) or 'gold',
+            'status': status,
+            'created_at': now,
+            'updated_at': now,
+        }
+
+    def resolve(self, records):
+        """Look up customers and existing loan numbers for a whole batch at once.
+
+        Returns the records that can be inserted; the rest are (record, error)
+        pairs in ``self.rejected``.
+        """
+        self.rejected = []
+        mobiles = {r['_customer_mobile'] for r in records if r['customer_id'] is None}
+        ids = {r['customer_id'] for r in records if r['customer_id'] is not None}
+        loan_numbers = [r['loan_number'] for r in records]
+
+        by_mobile = defaultdict(list)
+        if mobiles:
+            for customer_id, mobile in db.session.execute(
+                    select(Customer.id, Customer.mobile).where(Customer.mobile.in_(mobiles))):
+                by_mobile[mobile].append(customer_id)
+        known_ids = set(db.session.scalars(select(Customer.id).where(Customer.id.in_(ids)))) if ids else set()
+        taken = set(db.session.scalars(select(Loan.loan_number).where(Loan.loan_number.in_(loan_numbers))))
+
+        accepted = []
+        for record in records:
+            mobile = record.pop('_customer_mobile')
+            if record['customer_id'] is None:
+                matches = by_mobile.get(mobile, [])
+                if len(matches) != 1:
+                    self.rejected.append((record, f"{'No' if not matches else 'More than one'} customer with mobile {mobile}"))
+                    continue
+                record['customer_id'] = matches[0]
+            elif record['customer_id'] not in known_ids:
+                self.rejected.append((record, f"Customer {record['customer_id']} does not exist"))
+                continue
+
+            if record['loan_number'] in taken:
+                self.rejected.append((record, f"Loan number {record['loan_number']} already exists"))
+                continue
+            taken.add(record['loan_number'])
+            accepted.append(record)
+        return accepted
+
+    def after_insert(self, records):
+        """Open the ledger accounts of the inserted loans, as loan creation does."""
+        balances, entries = PaymentService.account_rows(records)
+        # render_nulls keeps settled and open accounts (next_due_date None or not) in one executemany
+        db.session.execute(insert(LoanBalance).execution_options(render_nulls=True), balances)
+        db.session.execute(insert(LedgerEntry).execution_options(render_nulls=True), entries)
+
+    def contribution(self, record):
+        principal = record['principal_amount']
+        return record['disbursed_date'].date(), record['loan_type'], {
+            'loans_disbursed': 1,
+            'disbursed_amount': principal,
+            'interest_amount': principal * record['interest_rate'] / 100,
+        }
+
+
+IMPORTERS = {
+    'customers': _CustomerImporter,
+    'loans': _LoanImporter,
+}
+
+
+class ImportService:
+    @staticmethod
+    def run(path, kind, batch_size=DEFAULT_BATCH_SIZE, restart=False, progress=None):
+        """Import ``path`` as ``kind`` ('customers' or 'loans') and return a summary.
+
+        Resumes from the file's checkpoint unless ``restart`` is set.
+        ``progress`` is called with the number of rows processed so far.
+        """
+        if kind not in IMPORTERS:
+            raise ImportDataError(f"Unknown import kind: {kind} (use {' or '.join(IMPORTERS)})")
+        importer = IMPORTERS[kind]()
+        source = os.path.abspath(path)
+        rows = _read_rows(path, importer.required_columns)
+
+        checkpoint = db.session.get(ImportCheckpoint, source)
+        if checkpoint is None or restart:
+            if checkpoint is not None:
+                db.session.delete(checkpoint)
+                db.session.flush()
+            checkpoint = ImportCheckpoint(source=source, kind=kind, rows_done=0, inserted=0, failed=0, completed=False)
+            db.session.add(checkpoint)
+            db.session.commit()
+            if os.path.exists(path + '.errors.jsonl'):
+                os.remove(path + '.errors.jsonl')
+        elif checkpoint.kind != kind:
+            raise ImportDataError(f"{path} was already imported as {checkpoint.kind}")
+
+        errors = []
+        skip = checkpoint.rows_done
+        row_number = 0
+        batch = []
+
+        with open(path + '.errors.jsonl', 'a', encoding='utf-8') as error_file:
+            def reject(number, row, message):
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'row': number, 'error': message})
+                error_file.write(json.dumps({'row': number, 'error': message, 'data': row}, default=str) + '\n')
+
+            def flush():
+                ImportService._insert_batch(importer, checkpoint, batch, row_number, reject)
+                batch.clear()
+                if progress:
+                    progress(checkpoint.rows_done)
+
+            now = datetime.utcnow()
+            for row in rows:
+                row_number += 1
+                if row_number <= skip:
+                    continue
+                try:
+                    if isinstance(row, RowError):
+                        raise row
+                    batch.append((row_number, row, importer.validate(row, now)))
+                except RowError as e:
+                    batch.append((row_number, row, e))
+
+                if len(batch) >= batch_size:
+                    flush()
+                    now = datetime.utcnow()
+
+            if batch or row_number > checkpoint.rows_done:
+                flush()
+
+        checkpoint.completed = True
+        db.session.commit()
+
+        return {
+            'kind': kind,
+            'rows': checkpoint.rows_done,
+            'inserted': checkpoint.inserted,
+            'failed': checkpoint.failed,
+            'resumed_from': skip,
+            'errors': errors,
+            'errors_file': os.path.basename(path + '.errors.jsonl') if checkpoint.failed else None,
+        }
+
+    @staticmethod
+    def _insert_batch(importer, checkpoint, batch, last_row, reject):
+        """Insert one batch and advance the checkpoint in a single transaction."""
+        valid = [(number, row, record) for number, row, record in batch if not isinstance(record, RowError)]
+        failed = [(number, row, str(record)) for number, row, record in batch if isinstance(record, RowError)]
+
+        try:
+            numbers = {id(record): (number, row) for number, row, record in valid}
+            records = importer.resolve([record for _, _, record in valid])
+            for record, message in getattr(importer, 'rejected', []):
+                failed.append((*numbers[id(record)], message))
+
+            if records:
+                db.session.execute(insert(importer.model), records)
+                importer.after_insert(records)
+
+                # executemany bypasses the ORM flush hooks that keep the
+                # dashboard rollups current, so apply the batch's deltas here
+                deltas = defaultdict(lambda: defaultdict(Decimal))
+                for record in records:
+                    RollupService.add_contribution(deltas, importer.contribution(record))
+                RollupService.apply(db.session.connection(), deltas)
+
+            checkpoint.rows_done = last_row
+            checkpoint.inserted += len(records)
+            checkpoint.failed += len(failed)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        for number, row, message in sorted(failed, key=lambda item: item[0]):
+            reject(number, row, message)
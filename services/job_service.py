@@ -0,0 +1,352 @@
+"""
+Background jobs for work that must not hold a request worker.
+
+Every job is a row in the ``jobs`` table, which is what status polling reads.
+Two backends execute them:
+
+* ``thread`` (default) - named thread pools inside the web process, each
+  with its own priority queue and size, so a slow report can only ever
+  occupy the ``heavy`` pool.
+* ``database`` - the web process only inserts rows; one or more
+  ``flask job-worker`` processes poll the table and run the same pools.
+
+Jobs are claimed with a conditional UPDATE, so a job re-queued by several
+processes still runs exactly once. A claim is a lease: the process renews
+``heartbeat_at`` on its running jobs, and a job whose heartbeat is older
+than JOB_LEASE_SECONDS (its worker was killed or recycled) goes back to
+the queue the next time a worker claims work, until JOB_MAX_ATTEMPTS.
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, select, update
+
+from database import statement_timeout
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOLS = {'default': 2, 'heavy': 1, 'media': 2}
+
+# Minimum seconds between progress writes for one job
+PROGRESS_INTERVAL = 1.0
+
+# Seconds between polls of the jobs table in the database backend
+POLL_INTERVAL = 2.0
+
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class JobQueue:
+    def __init__(self):
+        self.backend = 'thread'
+        self.pools = dict(DEFAULT_POOLS)
+        self.priorities = {}
+        self.lease_seconds = DEFAULT_LEASE_SECONDS
+        self.max_attempts = DEFAULT_MAX_ATTEMPTS
+        self._app = None
+        self._handlers = {}
+        self._queues = {}
+        self._pending = set()
+        self._running = {}
+        self._last_recovery = 0.0
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def init_app(self, app):
+        """Read JOB_BACKEND, JOB_POOLS ({pool: threads}), JOB_PRIORITIES ({kind: priority}) and the lease settings."""
+        self._app = app
+        self.backend = app.config.get('JOB_BACKEND', 'thread')
+        self.pools = dict(DEFAULT_POOLS, **app.config.get('JOB_POOLS', {}))
+        self.priorities = dict(app.config.get('JOB_PRIORITIES', {}))
+        self.lease_seconds = app.config.get('JOB_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+
+    def handler(self, kind, pool='default', priority=5):
+        """Register ``func(params, progress)`` to run jobs of ``kind`` in ``pool``."""
+        def decorator(func):
+            self._handlers[kind] = (func, pool, priority)
+            return func
+        return decorator
+
+    def kinds(self):
+        return set(self._handlers)
+
+    def submit(self, kind, params=None, priority=None, created_by=None):
+        """Persist a new job and queue it; returns the Job row."""
+        if kind not in self._handlers:
+            raise KeyError(f"No handler registered for job kind {kind!r}")
+        _, pool, default_priority = self._handlers[kind]
+        if priority is None:
+            priority = self.priorities.get(kind, default_priority)
+
+        job = Job(kind=kind, params=params or {}, priority=priority, status='queued', created_by=created_by)
+        db.session.add(job)
+        db.session.commit()
+
+        if self.backend == 'thread':
+            self._start()
+            self._enqueue(job.id, kind, priority)
+        return job
+
+    # --- EXECUTION ---
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            for pool, size in self.pools.items():
+                self._queues[pool] = queue.PriorityQueue()
+                for number in range(size):
+                    threading.Thread(
+                        target=self._worker, args=(self._queues[pool],),
+                        name=f'job-{pool}-{number}', daemon=True
+                    ).start()
+            threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True).start()
+            self._started = True
+
+        # Pick up jobs that were queued before this process started, or orphaned since
+        self._recover(force=True)
+
+    def _enqueue(self, job_id, kind, priority):
+        pool = self._handlers[kind][1]
+        with self._lock:
+            if job_id in self._pending:
+                return
+            self._pending.add(job_id)
+        self._queues.get(pool, self._queues['default']).put((priority, next(self._sequence), job_id))
+
+    def _enqueue_waiting(self, limit=100):
+        with self._app.app_context():
+            waiting = db.session.query(Job.id, Job.kind, Job.priority) \
+                .filter(Job.status == 'queued', Job.kind.in_(self.kinds())) \
+                .order_by(Job.priority, Job.created_at).limit(limit).all()
+        for job_id, kind, priority in waiting:
+            self._enqueue(job_id, kind, priority)
+
+    def _recover(self, force=False):
+        """Re-queue jobs whose lease expired and queue them here; checks at most once per lease/4."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_recovery < self.lease_seconds / 4:
+                return
+            self._last_recovery = now
+        with self._app.app_context():
+            requeued = self._requeue_stale()
+        if requeued or force:
+            self._enqueue_waiting()
+
+    def _requeue_stale(self):
+        """Put running jobs whose heartbeat is older than the lease back in the queue; returns how many.
+
+        A job that has used up its attempts fails instead, so a job that
+        kills its worker cannot take the pool down forever.
+        """
+        now = datetime.utcnow()
+        stale = and_(
+            Job.status == 'running',
+            db.func.coalesce(Job.heartbeat_at, Job.started_at) < now - timedelta(seconds=self.lease_seconds),
+        )
+        requeued = db.session.execute(
+            update(Job).where(stale, Job.attempts < self.max_attempts)
+            .values(status='queued', heartbeat_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        abandoned = db.session.execute(
+            update(Job).where(stale)
+            .values(status='failed', finished_at=now,
+                    error=f"Worker stopped responding; gave up after {self.max_attempts} attempt(s)")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if requeued or abandoned:
+            logger.warning("Re-queued %d job(s) and failed %d whose worker stopped responding", requeued, abandoned)
+        return requeued
+
+    def _heartbeat(self):
+        """Renew the lease on the jobs this process is running."""
+        while True:
+            time.sleep(self.lease_seconds / 4)
+            with self._lock:
+                running = dict(self._running)
+            if not running:
+                continue
+            try:
+                with self._app.app_context(), db.engine.begin() as connection:
+                    for job_id, attempt in running.items():
+                        connection.execute(
+                            update(Job.__table__)
+                            .where(Job.__table__.c.id == job_id, Job.__table__.c.attempts == attempt)
+                            .values(heartbeat_at=datetime.utcnow())
+                        )
+            except Exception:
+                logger.exception("Could not renew job leases")
+
+    def _worker(self, jobs):
+        while True:
+            _, _, job_id = jobs.get()
+            try:
+                self._recover()
+            except Exception:
+                logger.exception("Could not re-queue stale jobs")
+            try:
+                with self._app.app_context():
+                    self._run(job_id)
+            except Exception:
+                logger.exception("Job %s could not be run", job_id)
+            finally:
+                with self._lock:
+                    self._pending.discard(job_id)
+                jobs.task_done()
+
+    def _claim(self, job_id):
+        """Take the job if it is still queued; returns its attempt number, or None."""
+        now = datetime.utcnow()
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', started_at=now, heartbeat_at=now, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if result.rowcount != 1:
+            return None
+        return db.session.scalar(select(Job.attempts).where(Job.id == job_id))
+
+    def _finish(self, job_id, attempt, **values):
+        # Only while this attempt still holds the job: a lapsed lease may have handed it on
+        db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == 'running', Job.attempts == attempt)
+            .values(finished_at=datetime.utcnow(), **values)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _run(self, job_id):
+        attempt = self._claim(job_id)
+        if attempt is None:
+            return
+        with self._lock:
+            self._running[job_id] = attempt
+        try:
+            self._execute(job_id, attempt)
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+
+    def _execute(self, job_id, attempt):
+        job = db.session.get(Job, job_id)
+        func = self._handlers[job.kind][0]
+        progress = _ProgressReporter(job_id)
+
+        try:
+            # Jobs exist to run long queries the web statement timeout would cut off
+            with statement_timeout(current_app.config.get('JOB_STATEMENT_TIMEOUT_MS', 0)):
+                result = func(dict(job.params or {}), progress)
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Job %s (%s) failed", job_id, job.kind)
+            self._finish(job_id, attempt, status='failed', error=str(e))
+            return
+
+        values = {'status': 'succeeded', 'result': result}
+        if progress.done is not None:
+            values['progress'] = progress.done
+        self._finish(job_id, attempt, **values)
+
+    def work_forever(self):
+        """Run the pools and poll the jobs table; the body of ``flask job-worker``."""
+        self._start()
+        while True:
+            try:
+                self._recover()
+                self._enqueue_waiting()
+            except Exception as e:
+                logger.exception("Job poll failed")
+            time.sleep(POLL_INTERVAL)
+
+
+class _ProgressReporter:
+    """Callable handed to job handlers to report ``done`` out of ``total`` units."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.done = None
+        self._last_write = 0.0
+
+    def __call__(self, done, total=None):
+        self.done = done
+        now = time.monotonic()
+        if now - self._last_write < PROGRESS_INTERVAL:
+            return
+        self._last_write = now
+
+        values = {'progress': done}
+        if total is not None:
+            values['total'] = total
+        try:
+            # Separate connection: the handler's own transaction may hold an
+            # open streaming cursor that a commit would invalidate
+            with db.engine.begin() as connection:
+                connection.execute(update(Job.__table__).where(Job.__table__.c.id == self.job_id).values(**values))
+        except Exception as e:
+            # Progress is informational; never fail the job over it
+            logger.warning("Could not record progress for job %s: %s", self.job_id, e)
+
+
+job_queue = JobQueue()
+
+
+# --- HANDLERS ---
+
+@job_queue.handler('report', pool='heavy', priority=5)
+def _generate_report(params, progress):
+    from services.report_service import ReportService
+
+    report = ReportService.generate(
+        current_app.config['REPORTS_FOLDER'],
+        params.get('report_type'),
+        params.get('format', 'csv'),
+        date_range=params.get('date_range', 'month'),
+        start_date=params.get('start_date'),
+        end_date=params.get('end_date'),
+        progress=progress,
+    )
+    report.pop('path')
+    return report
+
+
+@job_queue.handler('import', pool='heavy', priority=6)
+def _import_data(params, progress):
+    from services.import_service import ImportService
+
+    return ImportService.run(params['path'], params['kind'], restart=params.get('restart', False), progress=progress)
+
+
+@job_queue.handler('document_derivatives', pool='media', priority=4)
+def _document_derivatives(params, progress):
+    from services.document_service import DocumentService
+
+    return DocumentService.generate_derivatives(params['name'])
+
+
+@job_queue.handler('refresh_loan_statuses', pool='default', priority=3)
+def _refresh_loan_statuses(params, progress):
+    from services.loan_status_service import LoanStatusService
+
+    return {'moved': LoanStatusService.refresh_statuses()}
+
+
+@job_queue.handler('rebuild_rollups', pool='heavy', priority=7)
+def _rebuild_rollups(params, progress):
+    from services.rollup_service import RollupService
+
+    RollupService.rebuild()
+    return {'rebuilt': True}
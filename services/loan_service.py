@@ -0,0 +1,244 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, or_, select
+
+from models import db, Customer, Loan, LOAN_STATUSES
+from services.document_service import DocumentService
+from services.serialization import dumps, stream_array
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Rows pulled from the database cursor per round trip while streaming
+STREAM_BATCH_SIZE = 200
+
+# Columns the loans list renders; selected as plain rows, never as ORM objects
+LIST_COLUMNS = (
+    Loan.id,
+    Loan.loan_number,
+    Loan.customer_id,
+    Loan.principal_amount,
+    Loan.interest_rate,
+    Loan.tenure_months,
+    Loan.disbursed_date,
+    Loan.maturity_date,
+    Loan.loan_type,
+    Loan.status,
+    Loan.collateral_details,
+    Loan.document_urls,
+    Customer.name.label('customer_name'),
+    Customer.mobile.label('customer_mobile'),
+    Customer.father_name.label('customer_father_name'),
+    Customer.address.label('customer_address'),
+)
+
+# Columns the loans list may be ordered by. Every ordering is made total by
+# falling back to Loan.id so it can be used as a keyset cursor.
+SORT_COLUMNS = {
+    'disbursed_date': Loan.disbursed_date,
+    'principal_amount': Loan.principal_amount,
+    'loan_number': Loan.loan_number,
+}
+
+
+class LoanQueryError(ValueError):
+    """Raised when /api/loans is called with invalid filter or cursor values."""
+
+
+def _parse_date(value, field):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise LoanQueryError(f"Invalid {field}: expected an ISO date")
+
+
+def _encode_cursor(sort_value, loan_id):
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    elif isinstance(sort_value, Decimal):
+        sort_value = str(sort_value)
+    raw = json.dumps([sort_value, str(loan_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor, sort):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, loan_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise LoanQueryError("Invalid cursor")
+
+    if sort_value is not None:
+        if sort == 'disbursed_date':
+            sort_value = _parse_date(sort_value, 'cursor')
+        elif sort == 'principal_amount':
+            sort_value = Decimal(sort_value)
+
+    try:
+        return sort_value, uuid.UUID(loan_id)
+    except ValueError:
+        raise LoanQueryError("Invalid cursor")
+
+
+class LoanService:
+    @staticmethod
+    def parse_args(args):
+        """Validate the /api/loans query string into keyword arguments."""
+        sort = args.get('sort', 'disbursed_date')
+        if sort not in SORT_COLUMNS:
+            raise LoanQueryError(f"Invalid sort field: {sort}")
+
+        order = args.get('order', 'desc').lower()
+        if order not in ('asc', 'desc'):
+            raise LoanQueryError("order must be 'asc' or 'desc'")
+
+        status = args.get('status') or None
+        if status and status not in LOAN_STATUSES:
+            raise LoanQueryError(f"Invalid status: {status}")
+
+        try:
+            limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise LoanQueryError("limit must be an integer")
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        customer_id = args.get('customer_id') or None
+        if customer_id:
+            try:
+                customer_id = uuid.UUID(customer_id)
+            except ValueError:
+                raise LoanQueryError("Invalid customer_id")
+
+        date_from = args.get('date_from')
+        date_to = args.get('date_to')
+
+        return {
+            'status': status,
+            'loan_type': args.get('loan_type') or None,
+            'customer_id': customer_id,
+            'search': (args.get('q') or '').strip() or None,
+            'date_from': _parse_date(date_from, 'date_from') if date_from else None,
+            'date_to': _parse_date(date_to, 'date_to') if date_to else None,
+            'sort': sort,
+            'order': order,
+            'cursor': args.get('cursor') or None,
+            'limit': limit,
+        }
+
+    @staticmethod
+    def build_query(status=None, loan_type=None, customer_id=None, search=None,
+                    date_from=None, date_to=None, sort='disbursed_date', order='desc',
+                    cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Return a filtered, keyset-paginated select of LIST_COLUMNS rows.
+
+        The query selects ``limit + 1`` rows so callers can tell whether another
+        page exists without issuing a COUNT over the whole book.
+        """
+        query = select(*LIST_COLUMNS).join(Customer, Loan.customer_id == Customer.id)
+
+        if status:
+            query = query.where(Loan.status == status)
+        if loan_type:
+            query = query.where(Loan.loan_type == loan_type)
+        if customer_id:
+            query = query.where(Loan.customer_id == customer_id)
+        if date_from:
+            query = query.where(Loan.disbursed_date >= date_from)
+        if date_to:
+            query = query.where(Loan.disbursed_date <= date_to)
+        if search:
+            # Prefix matches only, so the loan_number/name indexes stay usable
+            query = query.where(or_(
+                Loan.loan_number.ilike(f"{search}%"),
+                Customer.name.ilike(f"{search}%"),
+            ))
+
+        sort_column = SORT_COLUMNS[sort]
+        descending = order == 'desc'
+
+        if cursor:
+            sort_value, last_id = _decode_cursor(cursor, sort)
+            if descending:
+                query = query.where(or_(
+                    sort_column < sort_value,
+                    and_(sort_column == sort_value, Loan.id < last_id),
+                ))
+            else:
+                query = query.where(or_(
+                    sort_column > sort_value,
+                    and_(sort_column == sort_value, Loan.id > last_id),
+                ))
+
+        if descending:
+            query = query.order_by(sort_column.desc(), Loan.id.desc())
+        else:
+            query = query.order_by(sort_column.asc(), Loan.id.asc())
+
+        return query.limit(limit + 1)
+
+    @staticmethod
+    def serialize(row):
+        """Convert a LIST_COLUMNS row into the JSON shape used by the loans page.
+
+        Ids, dates and amounts are left to the encoder (see services/serialization.py).
+        """
+        surety = (row.collateral_details or {}).get('surety') or {}
+        document_urls = row.document_urls or {}
+
+        return {
+            "id": row.id,
+            "loan_number": row.loan_number,
+            "customer_id": row.customer_id,
+            "customer_name": row.customer_name,
+            "customer_mobile": row.customer_mobile,
+            "customer_father_name": row.customer_father_name,
+            "customer_address": row.customer_address,
+            "principal_amount": row.principal_amount,
+            "interest_rate": row.interest_rate,
+            "tenure_months": row.tenure_months,
+            "disbursed_date": row.disbursed_date,
+            "maturity_date": row.maturity_date,
+            "loan_type": row.loan_type,
+            "status": row.status,
+            "surety_name": surety.get('name'),
+            "surety_mobile": surety.get('mobile'),
+            "surety_aadhar": surety.get('aadhar'),
+            "surety_photo_url": DocumentService.url(surety.get('photo_url')),
+            "surety_photo_thumb_url": DocumentService.thumbnail_url(surety.get('photo_url')),
+            "bond_paper_url": DocumentService.url(document_urls.get('bond_paper')),
+            "bond_paper_thumb_url": DocumentService.thumbnail_url(document_urls.get('bond_paper')),
+        }
+
+    @staticmethod
+    def stream_page(params, session=None):
+        """Yield the JSON document for one page of loans, as bytes, chunk by chunk.
+
+        Rows are fetched from the database in batches and written out as they
+        arrive, so memory use is bounded by the batch size rather than the page.
+        """
+        limit = params['limit']
+        sort = params['sort']
+        # Executed before the first chunk so errors surface before any output
+        rows = iter((session or db.session).execute(
+            LoanService.build_query(**params).execution_options(yield_per=STREAM_BATCH_SIZE)
+        ))
+        last = None
+
+        def page():
+            nonlocal last
+            # The extra row beyond the limit only tells us there is a next page
+            for _, row in zip(range(limit), rows):
+                last = row
+                yield row
+
+        yield b'{"loans":'
+        yield from stream_array(page(), LoanService.serialize)
+        if next(rows, None) is not None:
+            next_cursor = _encode_cursor(getattr(last, sort), last.id)
+            yield b',"next_cursor":' + dumps(next_cursor) + b',"has_more":true}'
+        else:
+            yield b',"next_cursor":null,"has_more":false}'
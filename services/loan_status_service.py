@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import update, exists, and_
+
+from models import db, Loan, LoanBalance, Payment, OPEN_LOAN_STATUSES
+
+# A newly disbursed loan stays "pending" for its first month
+PENDING_PERIOD = relativedelta(months=1)
+
+# An open loan with no completed payment in this window is overdue
+OVERDUE_AFTER = timedelta(days=45)
+
+
+class LoanStatusService:
+    @staticmethod
+    def _recent_payment(now):
+        """Correlated EXISTS for a completed payment inside the overdue window."""
+        return exists().where(and_(
+            Payment.loan_id == Loan.id,
+            Payment.payment_status == 'completed',
+            Payment.payment_date >= now - OVERDUE_AFTER,
+        ))
+
+    @staticmethod
+    def _settled():
+        """Correlated EXISTS for a ledger account with nothing left to pay."""
+        return exists().where(and_(
+            LoanBalance.loan_id == Loan.id,
+            LoanBalance.next_due_date.is_(None),
+        ))
+
+    @staticmethod
+    def refresh_statuses(now=None):
+        """Apply every time- and payment-driven status transition in bulk.
+
+        Each transition is a single set-based UPDATE guarded by the current
+        status, so the job is safe to re-run and never touches loans that are
+        already in the right state. Returns the number of loans moved per step.
+        """
+        now = now or datetime.utcnow()
+        recent_payment = LoanStatusService._recent_payment(now)
+        matured = and_(Loan.maturity_date.isnot(None), Loan.maturity_date < now)
+
+        steps = [
+            # Only a repaid loan is closed; posting the last payment normally does this already
+            ('completed', and_(
+                Loan.status.in_(OPEN_LOAN_STATUSES),
+                LoanStatusService._settled(),
+            )),
+            ('active', and_(
+                Loan.status == 'pending',
+                Loan.disbursed_date <= now - PENDING_PERIOD,
+                ~matured,
+            )),
+            # Past maturity with a balance left: overdue whatever the payment history
+            ('overdue', and_(
+                Loan.status.in_(('pending', 'active')),
+                matured,
+            )),
+            ('overdue', and_(
+                Loan.status == 'active',
+                Loan.disbursed_date <= now - OVERDUE_AFTER,
+                ~recent_payment,
+            )),
+            ('active', and_(
+                Loan.status == 'overdue',
+                recent_payment,
+                ~matured,
+            )),
+        ]
+
+        moved = {}
+        try:
+            for new_status, condition in steps:
+                result = db.session.execute(
+                    update(Loan)
+                    .where(condition)
+                    .values(status=new_status, updated_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+                moved[new_status] = moved.get(new_status, 0) + result.rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return moved
@@ -0,0 +1,452 @@
+"""
+Payment posting against the loan ledger.
+
+Each completed payment is split into interest and principal by walking the
+loan's repayment schedule (finance.repayment_schedule): instalments are
+settled in order, each one's interest before its principal. The split is
+written in one transaction to the Payment row, to an append-only
+LedgerEntry and to the loan's LoanBalance, whose running totals answer
+outstanding, overdue and due-today questions without reading payments.
+
+A loan's account opens with a disbursement entry when the loan is created
+or bulk imported. Loans from before the ledger are opened on their first
+posting, which also replays their earlier completed payments, or all at
+once with ``flask open-loan-accounts``.
+"""
+import bisect
+import itertools
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from sqlalchemy import event, func, select
+
+from models import db, Loan, Payment, LedgerEntry, LoanBalance, StatsRollup, PAYMENT_METHODS
+from sequences import sequences
+from services import finance
+
+# Receipts accepted by one bulk posting request
+MAX_BULK_PAYMENTS = 5000
+
+ZERO = Decimal('0.00')
+
+
+class PaymentError(ValueError):
+    """A payment that cannot be posted as given."""
+
+
+@event.listens_for(LedgerEntry, 'before_update')
+@event.listens_for(LedgerEntry, 'before_delete')
+def _ledger_is_append_only(mapper, connection, target):
+    raise PaymentError("Ledger entries cannot be changed or deleted")
+
+
+@lru_cache(maxsize=4096)
+def _schedule(principal, annual_rate, tenure_months):
+    instalments = finance.repayment_schedule(principal, annual_rate, tenure_months)
+    totals = tuple(itertools.accumulate(interest + principal_part for interest, principal_part in instalments))
+    return instalments, totals
+
+
+def loan_schedule(loan):
+    """(instalments, totals): (interest, principal) per instalment and the cumulative amount due after each."""
+    return _schedule(Decimal(str(loan.principal_amount)), Decimal(str(loan.interest_rate)), int(loan.tenure_months))
+
+
+def allocate(instalments, totals, amount_paid, amount):
+    """Split ``amount`` into (interest, principal, first instalment) after ``amount_paid`` already paid.
+
+    The first instalment is 1-based: the one the payment starts settling.
+    """
+    left = totals[-1] - amount_paid
+    if amount > left:
+        raise PaymentError(f"Payment of {amount} is more than the {left} left to pay")
+
+    index = bisect.bisect_right(totals, amount_paid)
+    first = index + 1
+    paid = amount_paid
+    remaining = amount
+    interest = ZERO
+    while remaining > 0:
+        due_interest, _ = instalments[index]
+        credit = paid - (totals[index - 1] if index else ZERO)
+        if credit < due_interest:
+            take = min(remaining, due_interest - credit)
+            interest += take
+            remaining -= take
+            paid += take
+        take = min(remaining, totals[index] - paid)
+        remaining -= take
+        paid += take
+        index += 1
+    return interest, amount - interest, first
+
+
+def _instalments_due(loan, before, count):
+    """How many of a loan's ``count`` instalments fall due before ``before``."""
+    disbursed = loan.disbursed_date
+    months = (before.year - disbursed.year) * 12 + before.month - disbursed.month
+    if months > 0 and finance.maturity_date(disbursed, months) >= before:
+        months -= 1
+    return max(0, min(count, months))
+
+
+def _parse_receipt(item):
+    """Validate one receipt from the API into keyword arguments for a Payment."""
+    if not isinstance(item, dict):
+        raise PaymentError("Each payment must be an object")
+
+    loan_key = item.get('loan_id') or item.get('loan_number')
+    if not loan_key:
+        raise PaymentError("loan_id or loan_number is required")
+
+    try:
+        amount = Decimal(str(item.get('amount')))
+    except InvalidOperation:
+        raise PaymentError("amount must be a number")
+    if not amount.is_finite() or amount <= 0 or amount != amount.quantize(finance.CENT):
+        raise PaymentError("amount must be positive with at most two decimal places")
+
+    payment_date = item.get('payment_date')
+    if payment_date:
+        try:
+            payment_date = datetime.fromisoformat(payment_date)
+        except (TypeError, ValueError):
+            raise PaymentError("Invalid payment_date: expected an ISO date")
+    else:
+        payment_date = datetime.utcnow()
+
+    method = item.get('payment_method') or 'cash'
+    if method not in PAYMENT_METHODS:
+        raise PaymentError(f"Invalid payment_method: {method}")
+
+    return {
+        'loan_key': str(loan_key),
+        'payment_amount': amount.quantize(finance.CENT),
+        'payment_date': payment_date,
+        'payment_method': method,
+        'reference_number': (item.get('reference_number') or '').strip() or None,
+        'notes': item.get('notes'),
+    }
+
+
+class PaymentService:
+    @staticmethod
+    def open_accounts(loans):
+        """Open ledger accounts for ``loans`` that have none; returns {loan_id: LoanBalance}.
+
+        Completed payments recorded before the account existed are replayed
+        in date order. The caller commits.
+        """
+        loans = list(loans)
+        if any(loan.id is None for loan in loans):
+            db.session.flush()
+        balances = {
+            balance.loan_id: balance for balance in db.session.execute(
+                select(LoanBalance).where(LoanBalance.loan_id.in_([loan.id for loan in loans]))
+                .order_by(LoanBalance.loan_id).with_for_update()
+            ).scalars()
+        }
+        unopened = [loan for loan in loans if loan.id not in balances]
+        if not unopened:
+            return balances
+
+        earlier = db.session.execute(
+            select(Payment)
+            .where(Payment.loan_id.in_([loan.id for loan in unopened]), Payment.payment_status == 'completed')
+            .order_by(Payment.payment_date, Payment.created_at)
+        ).scalars().all()
+
+        payments_by_loan = {}
+        for payment in earlier:
+            payments_by_loan.setdefault(payment.loan_id, []).append(payment)
+
+        for loan in unopened:
+            instalments, totals = loan_schedule(loan)
+            principal = Decimal(str(loan.principal_amount))
+            balance = LoanBalance(
+                loan_id=loan.id,
+                principal_outstanding=principal,
+                principal_paid=ZERO,
+                interest_paid=ZERO,
+                amount_paid=ZERO,
+                instalments_paid=0,
+                instalment_amount=sum(instalments[0]),
+                amount_payable=totals[-1],
+                next_due_date=finance.maturity_date(loan.disbursed_date, 1),
+            )
+            db.session.add(balance)
+            db.session.add(LedgerEntry(
+                loan_id=loan.id, entry_type='disbursement', principal=principal, interest=ZERO,
+                principal_balance=principal, effective_date=loan.disbursed_date,
+            ))
+            for payment in payments_by_loan.get(loan.id, []):
+                PaymentService._apply(loan, balance, payment, cap=True)
+            balances[loan.id] = balance
+        return balances
+
+    @staticmethod
+    def account_rows(loans):
+        """(balances, ledger entries) opening the accounts of new loans, as rows for bulk inserts.
+
+        ``loans`` are mappings of Loan columns, such as the rows of a bulk
+        import; new loans have no payments to replay. A loan that is already
+        'completed' opens settled, its disbursement followed by a repayment
+        of the whole schedule at maturity.
+        """
+        balances, entries = [], []
+        for loan in loans:
+            principal = Decimal(str(loan['principal_amount']))
+            instalments, totals = _schedule(principal, Decimal(str(loan['interest_rate'])), int(loan['tenure_months']))
+            settled = loan['status'] == 'completed'
+            balances.append({
+                'loan_id': loan['id'],
+                'principal_outstanding': ZERO if settled else principal,
+                'principal_paid': principal if settled else ZERO,
+                'interest_paid': totals[-1] - principal if settled else ZERO,
+                'amount_paid': totals[-1] if settled else ZERO,
+                'instalments_paid': len(instalments) if settled else 0,
+                'instalment_amount': sum(instalments[0]),
+                'amount_payable': totals[-1],
+                'next_due_date': None if settled else finance.maturity_date(loan['disbursed_date'], 1),
+                'last_payment_date': None,
+            })
+            entries.append({
+                'loan_id': loan['id'], 'payment_id': None, 'entry_type': 'disbursement', 'principal': principal,
+                'interest': ZERO, 'principal_balance': principal, 'effective_date': loan['disbursed_date'],
+            })
+            if settled:
+                entries.append({
+                    'loan_id': loan['id'], 'payment_id': None, 'entry_type': 'payment', 'principal': -principal,
+                    'interest': totals[-1] - principal, 'principal_balance': ZERO,
+                    'effective_date': loan['maturity_date'],
+                })
+        return balances, entries
+
+    @staticmethod
+    def loans_without_account(limit):
+        """Up to ``limit`` loans whose ledger account has not been opened."""
+        opened = select(LoanBalance.loan_id).where(LoanBalance.loan_id == Loan.id).exists()
+        return db.session.execute(select(Loan).where(~opened).limit(limit)).scalars().all()
+
+    @staticmethod
+    def _apply(loan, balance, payment, cap=False):
+        """Allocate one payment and record it in the ledger and the loan's balance.
+
+        With ``cap``, a replayed payment larger than what was left is
+        recorded for the part that fits instead of being refused.
+        """
+        instalments, totals = loan_schedule(loan)
+        amount_paid = Decimal(balance.amount_paid)
+        amount = Decimal(str(payment.payment_amount))
+        if cap:
+            amount = min(amount, totals[-1] - amount_paid)
+            if amount <= 0:
+                return None
+        interest, principal, first = allocate(instalments, totals, amount_paid, amount)
+
+        payment.interest_amount = interest
+        payment.principal_amount = principal
+        payment.emi_month = first
+
+        balance.amount_paid = amount_paid + amount
+        balance.interest_paid = Decimal(balance.interest_paid) + interest
+        balance.principal_paid = Decimal(balance.principal_paid) + principal
+        balance.principal_outstanding = Decimal(balance.principal_outstanding) - principal
+        balance.instalments_paid = bisect.bisect_right(totals, balance.amount_paid)
+        balance.next_due_date = (
+            finance.maturity_date(loan.disbursed_date, balance.instalments_paid + 1)
+            if balance.instalments_paid < len(instalments) else None
+        )
+        if balance.last_payment_date is None or payment.payment_date > balance.last_payment_date:
+            balance.last_payment_date = payment.payment_date
+
+        db.session.add(LedgerEntry(
+            loan_id=loan.id, payment=payment, entry_type='payment', principal=-principal,
+            interest=interest, principal_balance=balance.principal_outstanding,
+            effective_date=payment.payment_date,
+        ))
+
+        if balance.next_due_date is None and loan.status != 'completed':
+            loan.transition_to('completed')
+        return interest, principal, first
+
+    @staticmethod
+    def post_many(items):
+        """Post a batch of receipts; returns (posted, rejected). The caller commits.
+
+        Receipts are checked one by one: a bad or duplicate receipt is
+        rejected with its index and reason while the rest are posted. A
+        receipt is a duplicate when its loan already has a completed
+        payment with the same reference_number. Receipts are allocated in
+        payment_date order.
+        """
+        if len(items) > MAX_BULK_PAYMENTS:
+            raise PaymentError(f"At most {MAX_BULK_PAYMENTS} payments can be posted at once")
+
+        receipts, rejected = [], []
+        for index, item in enumerate(items):
+            try:
+                receipts.append((index, _parse_receipt(item)))
+            except PaymentError as e:
+                rejected.append({'index': index, 'error': str(e)})
+
+        # Resolve loans by id or number in two queries
+        keys = {receipt['loan_key'] for _, receipt in receipts}
+        ids = set()
+        for key in keys:
+            try:
+                ids.add(uuid.UUID(key))
+            except ValueError:
+                pass
+        loans = db.session.execute(
+            select(Loan).where(Loan.id.in_(ids) | Loan.loan_number.in_(keys))
+        ).scalars().all() if keys else []
+        by_key = {}
+        for loan in loans:
+            by_key[str(loan.id)] = by_key[loan.id.hex] = by_key[loan.loan_number] = loan
+
+        found = []
+        for index, receipt in receipts:
+            loan = by_key.get(receipt['loan_key'])
+            if loan is None:
+                rejected.append({'index': index, 'error': f"Loan not found: {receipt['loan_key']}"})
+            else:
+                found.append((index, receipt, loan))
+
+        references = {receipt['reference_number'] for _, receipt, _ in found if receipt['reference_number']}
+        seen = set(db.session.execute(
+            select(Payment.loan_id, Payment.reference_number)
+            .where(Payment.reference_number.in_(references), Payment.payment_status == 'completed')
+        ).tuples()) if references else set()
+
+        # Numbered by posting date, reserved before this transaction writes anything
+        numbers = iter(sequences.payment_numbers(datetime.utcnow(), len(found)))
+        balances = PaymentService.open_accounts({loan.id: loan for _, _, loan in found}.values())
+
+        posted = []
+        for index, receipt, loan in sorted(found, key=lambda entry: entry[1]['payment_date']):
+            reference = receipt.pop('reference_number')
+            receipt.pop('loan_key')
+            if reference and (loan.id, reference) in seen:
+                rejected.append({'index': index, 'error': f"Duplicate of an earlier payment with reference {reference}"})
+                continue
+
+            payment = Payment(
+                id=uuid.uuid4(), loan_id=loan.id, payment_status='completed', reference_number=reference,
+                payment_number=next(numbers), **receipt,
+            )
+            try:
+                interest, principal, first = PaymentService._apply(loan, balances[loan.id], payment)
+            except PaymentError as e:
+                rejected.append({'index': index, 'error': str(e)})
+                continue
+            db.session.add(payment)
+            if reference:
+                seen.add((loan.id, reference))
+
+            balance = balances[loan.id]
+            posted.append({
+                'index': index,
+                'payment_id': payment.id,
+                'payment_number': payment.payment_number,
+                'loan_number': loan.loan_number,
+                'amount': payment.payment_amount,
+                'interest': interest,
+                'principal': principal,
+                'instalment': first,
+                'principal_outstanding': balance.principal_outstanding,
+                'next_due_date': balance.next_due_date,
+            })
+
+        rejected.sort(key=lambda entry: entry['index'])
+        return posted, rejected
+
+    @staticmethod
+    def position(loan, today=None):
+        """Where a loan stands: paid so far, outstanding, next due date and arrears."""
+        balance = PaymentService.open_accounts([loan])[loan.id]
+        instalments, totals = loan_schedule(loan)
+        today = today or datetime.utcnow()
+
+        due = _instalments_due(loan, today, len(totals))
+        due_amount = totals[due - 1] if due else ZERO
+
+        return {
+            'loan_id': loan.id,
+            'loan_number': loan.loan_number,
+            'principal': Decimal(str(loan.principal_amount)),
+            'principal_outstanding': balance.principal_outstanding,
+            'principal_paid': balance.principal_paid,
+            'interest_paid': balance.interest_paid,
+            'amount_paid': balance.amount_paid,
+            'instalment_amount': balance.instalment_amount,
+            'instalments_paid': balance.instalments_paid,
+            'instalments': len(instalments),
+            'next_due_date': balance.next_due_date,
+            'arrears': max(ZERO, due_amount - Decimal(balance.amount_paid)),
+            'last_payment_date': balance.last_payment_date,
+            'interest_accrued': balance.interest_accrued,
+            'penal_interest_accrued': balance.penal_interest_accrued,
+            'accrued_through': balance.accrued_through,
+        }
+
+    @staticmethod
+    def ledger(loan_id, limit=200):
+        """A loan's ledger entries in posting order."""
+        return db.session.execute(
+            select(LedgerEntry).where(LedgerEntry.loan_id == loan_id).order_by(LedgerEntry.id).limit(limit)
+        ).scalars().all()
+
+    @staticmethod
+    def summary(today=None):
+        """Portfolio outstanding, overdue, due-today and collection figures.
+
+        Outstanding and due-today are single aggregates over the balances;
+        arrears are computed for the overdue loans only.
+        """
+        now = today or datetime.utcnow()
+        start = datetime(now.year, now.month, now.day)
+        tomorrow = start + timedelta(days=1)
+
+        outstanding, accounts = db.session.execute(
+            select(func.coalesce(func.sum(LoanBalance.principal_outstanding), 0), func.count())
+        ).one()
+        due_today = db.session.execute(
+            select(func.count()).select_from(LoanBalance)
+            .where(LoanBalance.next_due_date >= start, LoanBalance.next_due_date < tomorrow)
+        ).scalar()
+
+        overdue_loans = 0
+        arrears = ZERO
+        overdue = db.session.execute(
+            select(Loan.principal_amount, Loan.interest_rate, Loan.tenure_months, Loan.disbursed_date,
+                   LoanBalance.amount_paid)
+            .join(LoanBalance, LoanBalance.loan_id == Loan.id)
+            .where(LoanBalance.next_due_date < start)
+        )
+        for loan in overdue:
+            _, totals = loan_schedule(loan)
+            due = _instalments_due(loan, start, len(totals))
+            owed = totals[due - 1] - Decimal(loan.amount_paid) if due else ZERO
+            if owed > 0:
+                overdue_loans += 1
+                arrears += owed
+
+        collected = {}
+        for granularity, period_start in (('day', start.date()), ('month', start.date().replace(day=1))):
+            collected[granularity] = db.session.execute(
+                select(func.coalesce(func.sum(StatsRollup.payments_amount), 0))
+                .where(StatsRollup.granularity == granularity, StatsRollup.period_start == period_start)
+            ).scalar()
+
+        return {
+            'accounts': accounts,
+            'principal_outstanding': float(outstanding),
+            'overdue_loans': overdue_loans,
+            'overdue_amount': float(arrears),
+            'due_today': due_today,
+            'collected_today': float(collected['day']),
+            'collected_this_month': float(collected['month']),
+        }
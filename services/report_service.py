@@ -0,0 +1,224 @@
+import os
+import re
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from models import db, Customer, Loan, Payment, StatsRollup
+from services import finance
+from services.report_writers import WRITERS
+
+# Rows fetched per round trip; with yield_per the driver streams the result
+# (a server-side cursor on Postgres) instead of loading it all at once
+FETCH_BATCH_SIZE = 1000
+
+FORMAT_ALIASES = {'excel': 'xlsx'}
+REPORT_ALIASES = {'loans': 'portfolio', 'payments': 'collection', 'customers': 'customer'}
+
+_REPORT_ID = re.compile(r'^[a-z]+_\d{8}_\d{6}_[0-9a-f]{8}$')
+
+
+class ReportError(ValueError):
+    """Raised for unknown report types, formats or date ranges."""
+
+
+def date_bounds(date_range, start_date=None, end_date=None, now=None):
+    """(start, end) datetimes for a named range; None means unbounded."""
+    now = now or datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if date_range in (None, '', 'all'):
+        return None, None
+    if date_range == 'today':
+        return today, None
+    if date_range == 'week':
+        return today - timedelta(days=today.weekday()), None
+    if date_range == 'month':
+        return today.replace(day=1), None
+    if date_range == 'quarter':
+        return today.replace(month=(today.month - 1) // 3 * 3 + 1, day=1), None
+    if date_range == 'year':
+        return today.replace(month=1, day=1), None
+    if date_range == 'custom':
+        try:
+            start = datetime.fromisoformat(start_date) if start_date else None
+            end = datetime.fromisoformat(end_date) + timedelta(days=1) if end_date else None
+        except ValueError:
+            raise ReportError("start_date and end_date must be ISO dates")
+        return start, end
+    raise ReportError(f"Unknown date range: {date_range}")
+
+
+def _between(statement, column, start, end):
+    if start:
+        statement = statement.where(column >= start)
+    if end:
+        statement = statement.where(column < end)
+    return statement
+
+
+# --- REPORT DEFINITIONS ---
+# Each report selects plain columns (no ORM objects) and may post-process
+# every row into the tuple that is written out.
+
+def _portfolio(start, end):
+    statement = select(
+        Loan.loan_number, Customer.name, Customer.mobile, Loan.loan_type, Loan.status,
+        Loan.principal_amount, Loan.interest_rate, Loan.tenure_months,
+        Loan.disbursed_date, Loan.maturity_date,
+    ).join(Customer, Loan.customer_id == Customer.id).order_by(Loan.disbursed_date, Loan.id)
+
+    def row(values):
+        principal, rate, tenure = values[5], values[6], values[7]
+        instalment = finance.emi(float(principal), float(rate), tenure) if tenure else None
+        return (*values, round(instalment, 2) if instalment is not None else None)
+
+    return _between(statement, Loan.disbursed_date, start, end), row
+
+
+def _collection(start, end):
+    statement = select(
+        Payment.payment_number, Payment.payment_date, Loan.loan_number, Customer.name,
+        Payment.payment_amount, Payment.principal_amount, Payment.interest_amount,
+        Payment.payment_method, Payment.payment_status, Payment.reference_number,
+    ).join(Loan, Payment.loan_id == Loan.id) \
+        .join(Customer, Loan.customer_id == Customer.id) \
+        .order_by(Payment.payment_date, Payment.id)
+    return _between(statement, Payment.payment_date, start, end), None
+
+
+def _overdue(start, end):
+    # Always the current overdue book; the date range does not apply
+    last_payment = select(func.max(Payment.payment_date)) \
+        .where(Payment.loan_id == Loan.id, Payment.payment_status == 'completed') \
+        .correlate(Loan).scalar_subquery()
+    statement = select(
+        Loan.loan_number, Customer.name, Customer.mobile, Loan.loan_type,
+        Loan.principal_amount, Loan.disbursed_date, Loan.maturity_date, last_payment,
+    ).join(Customer, Loan.customer_id == Customer.id) \
+        .where(Loan.status == 'overdue') \
+        .order_by(Loan.disbursed_date, Loan.id)
+    now = datetime.utcnow()
+
+    def row(values):
+        since = values[7] or values[5]
+        return (*values, (now - since).days if since else None)
+
+    return statement, row
+
+
+def _customer(start, end):
+    loan_count = select(func.count(Loan.id)).where(Loan.customer_id == Customer.id) \
+        .correlate(Customer).scalar_subquery()
+    statement = select(
+        Customer.name, Customer.father_name, Customer.mobile, Customer.aadhar_number,
+        Customer.pan_number, Customer.created_at, loan_count,
+    ).order_by(Customer.created_at, Customer.id)
+    return _between(statement, Customer.created_at, start, end), None
+
+
+def _financial(start, end):
+    statement = select(
+        StatsRollup.period_start, StatsRollup.loan_type, StatsRollup.loans_disbursed,
+        StatsRollup.disbursed_amount, StatsRollup.interest_amount,
+        StatsRollup.payments_count, StatsRollup.payments_amount, StatsRollup.interest_collected,
+    ).where(StatsRollup.granularity == 'month', StatsRollup.loan_type != '') \
+        .order_by(StatsRollup.period_start, StatsRollup.loan_type)
+    if start:
+        statement = statement.where(StatsRollup.period_start >= start.date().replace(day=1))
+    if end:
+        statement = statement.where(StatsRollup.period_start < end.date())
+    return statement, None
+
+
+REPORTS = {
+    'portfolio': ('Loan Portfolio', [
+        'Loan Number', 'Customer', 'Mobile', 'Loan Type', 'Status', 'Principal',
+        'Interest Rate', 'Tenure (months)', 'Disbursed', 'Maturity', 'EMI',
+    ], _portfolio),
+    'collection': ('Collections', [
+        'Payment Number', 'Payment Date', 'Loan Number', 'Customer', 'Amount',
+        'Principal', 'Interest', 'Method', 'Status', 'Reference',
+    ], _collection),
+    'overdue': ('Overdue Loans', [
+        'Loan Number', 'Customer', 'Mobile', 'Loan Type', 'Principal', 'Disbursed',
+        'Maturity', 'Last Payment', 'Days Since Payment',
+    ], _overdue),
+    'customer': ('Customers', [
+        'Name', 'Father Name', 'Mobile', 'Aadhar Number', 'PAN Number', 'Created', 'Loans',
+    ], _customer),
+    'financial': ('Monthly Financials', [
+        'Month', 'Loan Type', 'Loans Disbursed', 'Disbursed Amount', 'Expected Interest',
+        'Payments', 'Amount Collected', 'Interest Collected',
+    ], _financial),
+}
+
+
+class ReportService:
+    @staticmethod
+    def normalize(report_type, format_type):
+        """Resolve UI aliases ('loans', 'excel', ...) and reject unsupported values."""
+        report_type = REPORT_ALIASES.get(report_type, report_type)
+        format_type = FORMAT_ALIASES.get(format_type, format_type)
+        if report_type not in REPORTS:
+            raise ReportError(f"Unknown report type: {report_type}")
+        if format_type not in WRITERS:
+            raise ReportError(f"Unsupported format: {format_type} (use csv or xlsx)")
+        return report_type, format_type
+
+    @staticmethod
+    def generate(folder, report_type, format_type, date_range='all',
+                 start_date=None, end_date=None, report_id=None, progress=None):
+        """Write a report file into ``folder`` and return its metadata.
+
+        Rows are streamed from the database in batches and handed to the
+        writer one at a time. ``progress`` is called with the running row
+        count after every batch.
+        """
+        report_type, format_type = ReportService.normalize(report_type, format_type)
+        start, end = date_bounds(date_range, start_date, end_date)
+        title, columns, build = REPORTS[report_type]
+        statement, transform = build(start, end)
+
+        now = datetime.utcnow()
+        report_id = report_id or f"{report_type}_{now.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        writer_class = WRITERS[format_type]
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{report_id}.{writer_class.extension}")
+
+        writer = writer_class(path, columns, title)
+        rows = 0
+        try:
+            result = db.session.execute(statement.execution_options(yield_per=FETCH_BATCH_SIZE))
+            for batch in result.partitions():
+                for values in batch:
+                    writer.write_row(transform(values) if transform else values)
+                rows += len(batch)
+                if progress:
+                    progress(rows)
+        except Exception:
+            writer.close()
+            os.remove(path)
+            raise
+        writer.close()
+
+        return {
+            'report_id': report_id,
+            'type': report_type,
+            'format': format_type,
+            'rows': rows,
+            'path': path,
+            'generated_at': now.isoformat(),
+        }
+
+    @staticmethod
+    def find(folder, report_id):
+        """Path and mimetype of a generated report, or None if it does not exist."""
+        if not _REPORT_ID.match(report_id or ''):
+            return None
+        for writer_class in WRITERS.values():
+            path = os.path.join(folder, f"{report_id}.{writer_class.extension}")
+            if os.path.exists(path):
+                return path, writer_class.mimetype
+        return None
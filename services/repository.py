@@ -0,0 +1,102 @@
+"""
+Read queries for the customer and loan list views.
+
+List views select only the columns they render, as plain rows rather than
+entities, so a template or serializer cannot trigger a lazy relationship
+load per row. Code that needs related objects for many rows loads them
+here in one query (a join, or load_for below) instead of
+walking relationships row by row.
+
+tests/test_query_budgets.py requests the list endpoints and fails when
+one issues more statements than its budget, which is how an N+1
+regression shows up.
+"""
+from sqlalchemy import func, select
+
+from models import db, Customer, Loan, Payment, OPEN_LOAN_STATUSES
+
+# Columns the customer lists and pickers render
+CUSTOMER_LIST_COLUMNS = (
+    Customer.id,
+    Customer.name,
+    Customer.father_name,
+    Customer.mobile,
+    Customer.additional_mobile,
+    Customer.aadhar_number,
+    Customer.pan_number,
+    Customer.address,
+    Customer.created_at,
+)
+
+
+class CustomerRepository:
+    @staticmethod
+    def list_rows(limit=None):
+        """Customers for the management page, newest first, as column rows."""
+        statement = select(*CUSTOMER_LIST_COLUMNS).order_by(Customer.created_at.desc(), Customer.id.desc())
+        if limit is not None:
+            statement = statement.limit(limit)
+        return db.session.execute(statement).all()
+
+    @staticmethod
+    def page(page, per_page, session=None):
+        """One page of customers, newest first, as (rows, total)."""
+        session = session or db.session
+        page = max(page, 1)
+        per_page = max(per_page, 1)
+        total = session.execute(select(func.count()).select_from(Customer)).scalar()
+        rows = session.execute(
+            select(*CUSTOMER_LIST_COLUMNS)
+            .order_by(Customer.created_at.desc(), Customer.id.desc())
+            .limit(per_page)
+            .offset((page - 1) * per_page)
+        ).all()
+        return rows, total
+
+
+class LoanRepository:
+    @staticmethod
+    def open_count(session=None):
+        """Loans that are not completed, counted through the status index."""
+        return (session or db.session).execute(
+            select(func.count()).select_from(Loan).where(Loan.status.in_(OPEN_LOAN_STATUSES))
+        ).scalar()
+
+    @staticmethod
+    def recent(limit=5, session=None):
+        """Latest disbursed loans with their customer's name."""
+        return (session or db.session).execute(
+            select(Loan.loan_number, Loan.principal_amount, Loan.loan_type, Loan.disbursed_date,
+                   Customer.name.label('customer_name'))
+            .join(Customer, Loan.customer_id == Customer.id)
+            .order_by(Loan.disbursed_date.desc(), Loan.id.desc())
+            .limit(limit)
+        ).all()
+
+    @staticmethod
+    def recent_payments(limit=5, session=None):
+        """Latest completed payments with their loan number and customer's name."""
+        return (session or db.session).execute(
+            select(Payment.payment_number, Payment.payment_amount, Payment.payment_date,
+                   Loan.loan_number, Customer.name.label('customer_name'))
+            .join(Loan, Payment.loan_id == Loan.id)
+            .join(Customer, Loan.customer_id == Customer.id)
+            .where(Payment.payment_status == 'completed')
+            .order_by(Payment.payment_date.desc())
+            .limit(limit)
+        ).all()
+
+    @staticmethod
+    def load_for(objects, session=None):
+        """Load the loans ``objects`` (payments, say) refer to in one query.
+
+        While the caller holds on to the returned list, ``obj.loan`` is
+        answered from the session's identity map instead of a query per
+        object (the identity map only keeps weak references).
+        """
+        session = session or db.session
+        loan_ids = {obj.loan_id for obj in objects if obj.loan_id is not None}
+        loan_ids -= {key[1][0] for key in session.identity_map.keys() if key[0] is Loan}
+        if not loan_ids:
+            return []
+        return session.execute(select(Loan).where(Loan.id.in_(loan_ids))).scalars().all()
@@ -0,0 +1,346 @@
+import itertools
+from collections import defaultdict
+from datetime import datetime, date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import event, func, inspect, select, update, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history, PASSIVE_NO_INITIALIZE
+
+from models import db, Customer, Loan, Payment, StatsRollup
+from services.repository import LoanRepository
+
+# period_start used by the running-total ('all') rows
+ALL_TIME = date(1970, 1, 1)
+
+COUNTERS = (
+    'new_customers', 'loans_disbursed', 'disbursed_amount', 'interest_amount',
+    'payments_count', 'payments_amount', 'interest_collected',
+)
+
+_INTEGER_COUNTERS = ('new_customers', 'loans_disbursed', 'payments_count')
+
+# Attributes each tracked model contributes to the rollups
+_TRACKED = {
+    Customer: ('created_at',),
+    Loan: ('disbursed_date', 'loan_type', 'principal_amount', 'interest_rate'),
+    Payment: ('payment_date', 'payment_status', 'payment_amount', 'interest_amount'),
+}
+
+
+def _to_date(value):
+    if value is None:
+        # Column defaults are only applied at INSERT time
+        return datetime.utcnow().date()
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _to_decimal(value):
+    return Decimal(str(value)) if value is not None else Decimal(0)
+
+
+def _snapshot(obj, attrs, previous=False, stored=None):
+    """Current attribute values of ``obj``, or the values it was loaded with.
+
+    Attributes expired since the object was loaded (after a commit, say)
+    come from ``stored``, the row as the database still holds it.
+    """
+    values = {}
+    for attr in attrs:
+        history = get_history(obj, attr, passive=PASSIVE_NO_INITIALIZE)
+        changed = history.deleted if previous else history.added
+        if changed:
+            values[attr] = changed[0]
+        elif history.unchanged:
+            values[attr] = history.unchanged[0]
+        elif stored is not None:
+            values[attr] = stored[attr]
+        else:
+            values[attr] = None if previous else getattr(obj, attr)
+    return values
+
+
+def _stored_values(session, objects):
+    """{obj: {attr: value}} as the database holds the rows of ``objects`` whose loaded values are missing.
+
+    One query per model.
+    """
+    missing = defaultdict(list)
+    for obj in objects:
+        for attr in _TRACKED[type(obj)]:
+            history = get_history(obj, attr, passive=PASSIVE_NO_INITIALIZE)
+            if not (history.deleted or history.unchanged):
+                missing[type(obj)].append(obj)
+                break
+
+    stored = {}
+    for model, stale in missing.items():
+        attrs = _TRACKED[model]
+        # From the identity: reading obj.id would refresh each expired object on its own
+        by_id = {inspect(obj).identity[0]: obj for obj in stale}
+        rows = session.execute(
+            select(model.id, *(getattr(model, attr) for attr in attrs)).where(model.id.in_(by_id))
+        )
+        for row_id, *values in rows:
+            stored[by_id[row_id]] = dict(zip(attrs, values))
+    return stored
+
+
+def _contribution(obj, values):
+    """(day, loan_type, counter deltas) that one row adds to the rollups, or None."""
+    if isinstance(obj, Customer):
+        return _to_date(values['created_at']), '', {'new_customers': 1}
+
+    if isinstance(obj, Loan):
+        principal = _to_decimal(values['principal_amount'])
+        rate = _to_decimal(values['interest_rate'])
+        return _to_date(values['disbursed_date']), values['loan_type'] or 'gold', {
+            'loans_disbursed': 1,
+            'disbursed_amount': principal,
+            'interest_amount': principal * rate / 100,
+        }
+
+    if isinstance(obj, Payment):
+        if (values['payment_status'] or 'completed') != 'completed':
+            return None
+        loan = obj.loan
+        loan_type = (loan.loan_type if loan is not None else None) or 'gold'
+        return _to_date(values['payment_date']), loan_type, {
+            'payments_count': 1,
+            'payments_amount': _to_decimal(values['payment_amount']),
+            'interest_collected': _to_decimal(values['interest_amount']),
+        }
+
+    return None
+
+
+def _add(deltas, contribution, sign):
+    if contribution is None:
+        return
+    day, loan_type, counters = contribution
+    periods = (('day', day), ('month', day.replace(day=1)), ('all', ALL_TIME))
+    for granularity, period_start in periods:
+        bucket = deltas[(granularity, period_start, loan_type)]
+        for name, value in counters.items():
+            bucket[name] += sign * value
+
+
+def _percent_change(current, previous):
+    if not previous:
+        return 100.0 if current else 0.0
+    return round(float((current - previous) / previous * 100), 1)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_rollup_deltas(session, flush_context, instances):
+    """Record how pending customer, loan and payment writes change the rollups."""
+    deltas = session.info.setdefault('rollup_deltas', defaultdict(lambda: defaultdict(Decimal)))
+
+    with session.no_autoflush:
+        # Each payment's contribution needs its loan's type; fetch them all at
+        # once and keep them referenced until the loop below is done
+        loans = LoanRepository.load_for(
+            [obj for obj in itertools.chain(session.new, session.dirty, session.deleted) if isinstance(obj, Payment)],
+            session,
+        )
+
+        for obj in session.new:
+            attrs = _TRACKED.get(type(obj))
+            if attrs:
+                _add(deltas, _contribution(obj, _snapshot(obj, attrs)), 1)
+
+        dirty = [obj for obj in session.dirty if type(obj) in _TRACKED and session.is_modified(obj)]
+        deleted = [obj for obj in session.deleted if type(obj) in _TRACKED]
+        # The flush has not run yet, so the database still holds the previous values
+        stored = _stored_values(session, dirty + deleted)
+
+        for obj in dirty:
+            attrs = _TRACKED[type(obj)]
+            _add(deltas, _contribution(obj, _snapshot(obj, attrs, previous=True, stored=stored.get(obj))), -1)
+            _add(deltas, _contribution(obj, _snapshot(obj, attrs, stored=stored.get(obj))), 1)
+
+        for obj in deleted:
+            attrs = _TRACKED[type(obj)]
+            _add(deltas, _contribution(obj, _snapshot(obj, attrs, previous=True, stored=stored.get(obj))), -1)
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_rollup_deltas(session, flush_context):
+    """Write the collected deltas inside the same transaction as the flush."""
+    deltas = session.info.pop('rollup_deltas', None)
+    if deltas:
+        RollupService.apply(session.connection(), deltas)
+
+
+class RollupService:
+    @staticmethod
+    def apply(connection, deltas):
+        """Add counter deltas to their rollup rows, creating rows as needed."""
+        table = StatsRollup.__table__
+        dialect = connection.dialect.name
+
+        for (granularity, period_start, loan_type), counters in deltas.items():
+            counters = {
+                name: int(value) if name in _INTEGER_COUNTERS else value
+                for name, value in counters.items() if value
+            }
+            if not counters:
+                continue
+
+            key = {'granularity': granularity, 'period_start': period_start, 'loan_type': loan_type}
+            row = {name: counters.get(name, 0) for name in COUNTERS}
+
+            if dialect in ('sqlite', 'postgresql'):
+                if dialect == 'sqlite':
+                    from sqlalchemy.dialects.sqlite import insert as upsert
+                else:
+                    from sqlalchemy.dialects.postgresql import insert as upsert
+                statement = upsert(table).values(**key, **row)
+                statement = statement.on_conflict_do_update(
+                    index_elements=['granularity', 'period_start', 'loan_type'],
+                    set_={name: table.c[name] + statement.excluded[name] for name in counters},
+                )
+                connection.execute(statement)
+            else:
+                result = connection.execute(
+                    update(table)
+                    .where(table.c.granularity == granularity)
+                    .where(table.c.period_start == period_start)
+                    .where(table.c.loan_type == loan_type)
+                    .values({name: table.c[name] + value for name, value in counters.items()})
+                )
+                if result.rowcount == 0:
+                    connection.execute(insert(table).values(**key, **row))
+
+    @staticmethod
+    def add_contribution(deltas, contribution):
+        """Accumulate one row's (day, loan_type, counters) into ``deltas`` for apply().
+
+        For writes that bypass the ORM flush, such as bulk imports.
+        """
+        _add(deltas, contribution, 1)
+
+    @staticmethod
+    def rebuild():
+        """Recompute every rollup row from the base tables.
+
+        Use after bulk loads that bypass the ORM, or to repair drift, e.g.
+        when a loan's type changes after payments were posted against it.
+        """
+        deltas = defaultdict(lambda: defaultdict(Decimal))
+
+        def add(day, loan_type, counters):
+            _add(deltas, (_to_date(day), loan_type, counters), 1)
+
+        customer_rows = db.session.query(
+            func.date(Customer.created_at), func.count(Customer.id)
+        ).group_by(func.date(Customer.created_at))
+        for day, count in customer_rows:
+            add(day, '', {'new_customers': count})
+
+        loan_rows = db.session.query(
+            func.date(Loan.disbursed_date),
+            Loan.loan_type,
+            func.count(Loan.id),
+            func.sum(Loan.principal_amount),
+            func.sum(Loan.principal_amount * Loan.interest_rate / 100),
+        ).group_by(func.date(Loan.disbursed_date), Loan.loan_type)
+        for day, loan_type, count, disbursed, interest in loan_rows:
+            add(day, loan_type or 'gold', {
+                'loans_disbursed': count,
+                'disbursed_amount': _to_decimal(disbursed),
+                'interest_amount': _to_decimal(interest),
+            })
+
+        payment_rows = db.session.query(
+            func.date(Payment.payment_date),
+            Loan.loan_type,
+            func.count(Payment.id),
+            func.sum(Payment.payment_amount),
+            func.sum(func.coalesce(Payment.interest_amount, 0)),
+        ).join(Loan, Payment.loan_id == Loan.id) \
+            .filter(Payment.payment_status == 'completed') \
+            .group_by(func.date(Payment.payment_date), Loan.loan_type)
+        for day, loan_type, count, amount, interest in payment_rows:
+            add(day, loan_type or 'gold', {
+                'payments_count': count,
+                'payments_amount': _to_decimal(amount),
+                'interest_collected': _to_decimal(interest),
+            })
+
+        try:
+            db.session.query(StatsRollup).delete()
+            RollupService.apply(db.session.connection(), deltas)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    @staticmethod
+    def dashboard_figures(months=6, today=None, session=None):
+        """Totals, month-over-month changes, monthly trend and loan type mix.
+
+        Reads only the running-total rows and the last ``months`` monthly rows,
+        so the cost does not depend on the size of the book.
+        """
+        today = today or datetime.utcnow().date()
+        session = session or db.session
+        this_month = today.replace(day=1)
+        first_month = this_month - relativedelta(months=months - 1)
+
+        totals = defaultdict(Decimal)
+        loan_types = []
+        for row in session.query(StatsRollup).filter_by(granularity='all'):
+            for name in COUNTERS:
+                totals[name] += _to_decimal(getattr(row, name))
+            if row.loan_type and row.loans_disbursed:
+                loan_types.append((row.loan_type, row.loans_disbursed))
+
+        monthly = defaultdict(lambda: defaultdict(Decimal))
+        month_rows = session.query(StatsRollup).filter(
+            StatsRollup.granularity == 'month',
+            StatsRollup.period_start >= first_month - relativedelta(months=1),
+        )
+        for row in month_rows:
+            for name in COUNTERS:
+                monthly[row.period_start][name] += _to_decimal(getattr(row, name))
+
+        current = monthly[this_month]
+        previous = monthly[this_month - relativedelta(months=1)]
+
+        total_loans = sum(count for _, count in loan_types)
+        trend = []
+        for offset in range(months):
+            month = first_month + relativedelta(months=offset)
+            trend.append({
+                'month': month.month,
+                'year': month.year,
+                'amount': float(monthly[month]['disbursed_amount']),
+                'payments': float(monthly[month]['payments_amount']),
+            })
+
+        return {
+            'total_customers': int(totals['new_customers']),
+            'total_loans': int(totals['loans_disbursed']),
+            'total_disbursed': float(totals['disbursed_amount']),
+            'total_interest': float(totals['interest_amount']),
+            'total_collected': float(totals['payments_amount']),
+            'customers_change': _percent_change(current['new_customers'], previous['new_customers']),
+            'disbursed_change': _percent_change(current['disbursed_amount'], previous['disbursed_amount']),
+            'interest_change': _percent_change(current['interest_amount'], previous['interest_amount']),
+            'loans_change': _percent_change(current['loans_disbursed'], previous['loans_disbursed']),
+            'monthlyData': trend,
+            'loanTypes': [
+                {
+                    'type': f"{loan_type.title()} Loans",
+                    'count': count,
+                    'percentage': round(count * 100 / total_loans, 1),
+                }
+                for loan_type, count in sorted(loan_types, key=lambda item: -item[1])
+            ],
+        }
@@ -0,0 +1,218 @@
+import re
+
+from sqlalchemy import func, or_, select, text
+
+from models import db, Customer
+from services.repository import CUSTOMER_LIST_COLUMNS
+
+# bm25 column weights, in the order the FTS5 columns are declared below
+_FTS_WEIGHTS = '10.0, 3.0, 5.0, 5.0, 5.0'
+
+_SQLITE_DDL = [
+    # customers has a UUID primary key, so its implicit rowid is not stable
+    # (VACUUM or a table rebuild may renumber it). Search rows get rowids of
+    # their own instead, mapped to customers here
+    """CREATE TABLE IF NOT EXISTS customer_search_keys (
+        rowid INTEGER PRIMARY KEY,
+        customer_id CHAR(32) NOT NULL UNIQUE
+    )""",
+    # Self-contained FTS5 table with short-prefix indexes so as-you-type
+    # lookups on 2-4 characters do not scan the term list
+    """CREATE VIRTUAL TABLE IF NOT EXISTS customer_search USING fts5(
+        name, father_name, mobile, aadhar_number, pan_number,
+        tokenize='unicode61', prefix='2 3 4'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS customers_search_ai AFTER INSERT ON customers BEGIN
+        INSERT INTO customer_search_keys(customer_id) VALUES (new.id);
+        INSERT INTO customer_search(rowid, name, father_name, mobile, aadhar_number, pan_number)
+        VALUES ((SELECT rowid FROM customer_search_keys WHERE customer_id = new.id),
+                new.name, new.father_name, new.mobile, new.aadhar_number, new.pan_number);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS customers_search_ad AFTER DELETE ON customers BEGIN
+        DELETE FROM customer_search
+        WHERE rowid = (SELECT rowid FROM customer_search_keys WHERE customer_id = old.id);
+        DELETE FROM customer_search_keys WHERE customer_id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS customers_search_au
+    AFTER UPDATE OF name, father_name, mobile, aadhar_number, pan_number ON customers BEGIN
+        UPDATE customer_search
+        SET name = new.name, father_name = new.father_name, mobile = new.mobile,
+            aadhar_number = new.aadhar_number, pan_number = new.pan_number
+        WHERE rowid = (SELECT rowid FROM customer_search_keys WHERE customer_id = new.id);
+    END""",
+]
+
+# Fills an empty index from the customers table
+_SQLITE_BACKFILL = [
+    "INSERT INTO customer_search_keys(customer_id) SELECT id FROM customers",
+    """INSERT INTO customer_search(rowid, name, father_name, mobile, aadhar_number, pan_number)
+    SELECT customer_search_keys.rowid, name, father_name, mobile, aadhar_number, pan_number
+    FROM customers JOIN customer_search_keys ON customer_search_keys.customer_id = customers.id""",
+]
+
+# The earlier external-content index, keyed on customers.rowid
+_SQLITE_LEGACY = [
+    "DROP TRIGGER IF EXISTS customers_search_ai",
+    "DROP TRIGGER IF EXISTS customers_search_ad",
+    "DROP TRIGGER IF EXISTS customers_search_au",
+    "DROP TABLE IF EXISTS customer_search",
+]
+
+_POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # Trigram GIN indexes serve ILIKE '%term%' and similarity() on names
+    "CREATE INDEX IF NOT EXISTS ix_customers_name_trgm ON customers USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_customers_father_name_trgm ON customers USING gin (father_name gin_trgm_ops)",
+    # Pattern-ops btrees serve LIKE 'prefix%' on the identifier columns
+    "CREATE INDEX IF NOT EXISTS ix_customers_mobile_prefix ON customers (mobile text_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_customers_aadhar_prefix ON customers (aadhar_number text_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_customers_pan_prefix ON customers (pan_number text_pattern_ops)",
+]
+
+# Engines whose search index has been verified in this process
+_ready_engines = set()
+
+
+def _fts_query(term):
+    """Turn free text into an FTS5 expression where every word is a prefix match."""
+    tokens = re.findall(r'\w+', term)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+class CustomerSearchService:
+    @staticmethod
+    def create_index():
+        """Create the dialect-specific customer search index if it is missing.
+
+        On SQLite a freshly created FTS5 table is backfilled from the existing
+        customers; afterwards triggers keep it in sync on every write. An
+        index in the earlier rowid-keyed layout is replaced.
+        """
+        engine = db.engine
+        dialect = engine.dialect.name
+
+        with engine.begin() as conn:
+            if dialect == 'sqlite':
+                existing = conn.execute(text(
+                    "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'customer_search'"
+                )).scalar()
+                if existing is not None and "content='customers'" in existing:
+                    for statement in _SQLITE_LEGACY:
+                        conn.execute(text(statement))
+                    existing = None
+                for statement in _SQLITE_DDL:
+                    conn.execute(text(statement))
+                if existing is None:
+                    conn.execute(text("DELETE FROM customer_search_keys"))
+                    for statement in _SQLITE_BACKFILL:
+                        conn.execute(text(statement))
+            elif dialect == 'postgresql':
+                for statement in _POSTGRES_DDL:
+                    conn.execute(text(statement))
+
+        _ready_engines.add(engine)
+
+    @staticmethod
+    def rebuild_index():
+        """Repopulate the SQLite search index from the customers table."""
+        CustomerSearchService.create_index()
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.begin() as conn:
+                conn.execute(text("DELETE FROM customer_search"))
+                conn.execute(text("DELETE FROM customer_search_keys"))
+                for statement in _SQLITE_BACKFILL:
+                    conn.execute(text(statement))
+
+    @staticmethod
+    def search(term, limit=20, offset=0, with_total=False, session=None):
+        """Return customers matching ``term`` best match first, and optionally the match count.
+
+        Customers come back as rows of CUSTOMER_LIST_COLUMNS, not ORM objects.
+
+        Names match on word prefixes anywhere in the name; mobile, Aadhaar and
+        PAN numbers match on their leading digits/characters. A caller passing
+        its own ``session`` must have created the index first.
+        """
+        term = (term or '').strip()
+        if session is None:
+            session = db.session
+            if db.engine not in _ready_engines:
+                CustomerSearchService.create_index()
+
+        dialect = session.get_bind().dialect.name
+        if dialect == 'sqlite':
+            return CustomerSearchService._search_sqlite(session, term, limit, offset, with_total)
+        if dialect == 'postgresql':
+            return CustomerSearchService._search_postgres(session, term, limit, offset, with_total)
+        return CustomerSearchService._search_prefix(session, term, limit, offset, with_total)
+
+    @staticmethod
+    def _search_sqlite(session, term, limit, offset, with_total):
+        match = _fts_query(term)
+        if not match:
+            return [], 0
+
+        columns = ', '.join(f'customers.{column.key}' for column in CUSTOMER_LIST_COLUMNS)
+        statement = text(f"""
+            SELECT {columns} FROM customer_search
+            JOIN customer_search_keys ON customer_search_keys.rowid = customer_search.rowid
+            JOIN customers ON customers.id = customer_search_keys.customer_id
+            WHERE customer_search MATCH :match
+            ORDER BY bm25(customer_search, {_FTS_WEIGHTS})
+            LIMIT :limit OFFSET :offset
+        """).columns(*CUSTOMER_LIST_COLUMNS)
+        customers = session.execute(
+            statement, {'match': match, 'limit': limit, 'offset': offset},
+        ).all()
+
+        total = None
+        if with_total:
+            total = session.execute(
+                text("SELECT count(*) FROM customer_search WHERE customer_search MATCH :match"),
+                {'match': match},
+            ).scalar()
+        return customers, total
+
+    @staticmethod
+    def _search_postgres(session, term, limit, offset, with_total):
+        prefix = f"{term}%"
+        condition = or_(
+            Customer.name.ilike(f"%{term}%"),
+            Customer.father_name.ilike(f"%{term}%"),
+            Customer.mobile.like(prefix),
+            Customer.aadhar_number.like(prefix),
+            Customer.pan_number.like(prefix.upper()),
+        )
+        rank = func.greatest(
+            func.similarity(Customer.name, term),
+            func.similarity(func.coalesce(Customer.father_name, ''), term),
+        )
+        customers = session.execute(
+            select(*CUSTOMER_LIST_COLUMNS).where(condition)
+            .order_by(rank.desc(), Customer.created_at.desc())
+            .limit(limit).offset(offset)
+        ).all()
+        total = CustomerSearchService._count(session, condition) if with_total else None
+        return customers, total
+
+    @staticmethod
+    def _search_prefix(session, term, limit, offset, with_total):
+        # Portable fallback: prefix matches only, which plain btree indexes can serve
+        prefix = f"{term}%"
+        condition = or_(
+            Customer.name.ilike(prefix),
+            Customer.father_name.ilike(prefix),
+            Customer.mobile.like(prefix),
+            Customer.aadhar_number.like(prefix),
+            Customer.pan_number.ilike(prefix),
+        )
+        customers = session.execute(
+            select(*CUSTOMER_LIST_COLUMNS).where(condition)
+            .order_by(Customer.name).limit(limit).offset(offset)
+        ).all()
+        total = CustomerSearchService._count(session, condition) if with_total else None
+        return customers, total
+
+    @staticmethod
+    def _count(session, condition):
+        return session.execute(select(func.count()).select_from(Customer).where(condition)).scalar()
@@ -0,0 +1,190 @@
+"""
+File serving for the AGV Secure application.
+
+Static assets get content-hashed URLs: ``url_for('static', filename='css/dashboard.css')``
+renders as ``/static/css/dashboard.<hash>.css``, which is cached for a year
+since its bytes can never change. Compressible assets are precompressed
+once at startup (gzip, plus brotli when the ``brotli`` package is
+installed) and the best variant the browser accepts is sent as is.
+
+Private files (documents, reports) go through send_private_file(), which
+answers Range and conditional requests itself or, when a front proxy is
+configured, hands the transfer off with X-Accel-Redirect (nginx) or
+X-Sendfile (Apache/lighttpd).
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+# A year; browsers and CDNs keep hashed assets this long
+IMMUTABLE_MAX_AGE = 31536000
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_SIZE = 1024
+
+# Never hashed or compressed: user uploads and anything hidden
+_SKIP_DIRS = ('uploads',)
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class StaticAssets:
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.originals = {}
+        self.variants = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Hash and precompress the static folder, then take over the static endpoint.
+
+        Set ASSETS_HASHED_URLS = False during development to keep plain URLs
+        while files are being edited.
+        """
+        if not app.config.get('ASSETS_HASHED_URLS', True) or not app.static_folder:
+            return
+        self.static_folder = app.static_folder
+        self.build_path = os.path.abspath(app.config.get('ASSETS_BUILD_PATH', os.path.join(app.instance_path, 'assets')))
+        self._build()
+
+        app.url_defaults(self._hashed_url)
+        app.view_functions['static'] = self.serve
+
+    def _build(self):
+        try:
+            import brotli  # Optional dependency for .br variants
+        except ImportError:
+            brotli = None
+
+        for directory, subdirectories, files in os.walk(self.static_folder):
+            relative_dir = os.path.relpath(directory, self.static_folder)
+            subdirectories[:] = [
+                name for name in subdirectories
+                if not name.startswith('.') and not (relative_dir == '.' and name in _SKIP_DIRS)
+            ]
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(directory, name)
+                filename = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                stem, extension = os.path.splitext(filename)
+                hashed = f"{stem}.{_file_digest(path)}{extension}"
+                self.manifest[filename] = hashed
+                self.originals[hashed] = filename
+
+                content_type = mimetypes.guess_type(name)[0] or ''
+                if os.path.getsize(path) >= MIN_COMPRESS_SIZE and content_type.startswith(COMPRESSIBLE_TYPES):
+                    self.variants[hashed] = self._compress(path, hashed, brotli)
+
+    def _compress(self, path, hashed, brotli):
+        """Write .gz/.br copies of one asset (once per content hash); returns {encoding: path}."""
+        with open(path, 'rb') as handle:
+            data = handle.read()
+
+        encoders = {'gzip': ('.gz', lambda raw: gzip.compress(raw, 9, mtime=0))}
+        if brotli is not None:
+            encoders['br'] = ('.br', lambda raw: brotli.compress(raw, quality=11))
+
+        variants = {}
+        for encoding, (suffix, encode) in encoders.items():
+            target = os.path.join(self.build_path, *(hashed + suffix).split('/'))
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                encoded = encode(data)
+                if len(encoded) >= len(data):
+                    continue
+                with open(target + '.tmp', 'wb') as output:
+                    output.write(encoded)
+                os.replace(target + '.tmp', target)
+            variants[encoding] = target
+        return variants
+
+    def _hashed_url(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = self.manifest[values['filename']]
+
+    def url(self, filename):
+        """Hashed path of a static file relative to the static folder."""
+        return self.manifest.get(filename, filename)
+
+    def serve(self, filename):
+        """The static endpoint: hashed names are immutable, anything else revalidates."""
+        original = self.originals.get(filename)
+        if original is None:
+            path = safe_join(self.static_folder, filename)
+            if path is None or not os.path.isfile(path):
+                raise NotFound()
+            return send_file(path, max_age=None)
+
+        path = os.path.join(self.static_folder, *original.split('/'))
+        mimetype = mimetypes.guess_type(original)[0]
+        variants = self.variants.get(filename, {})
+        accepted = request.accept_encodings
+
+        for encoding in ('br', 'gzip'):
+            if encoding in variants and accepted[encoding]:
+                response = send_file(variants[encoding], mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_file(path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+
+        response.cache_control.immutable = True
+        if variants:
+            response.vary.add('Accept-Encoding')
+        return response
+
+
+def send_private_file(app, path, mimetype=None, max_age=0, as_attachment=False, download_name=None):
+    """Send an access-controlled file, delegating the transfer to the front proxy when configured.
+
+    SENDFILE_BACKEND selects 'x-accel-redirect' (nginx) or 'x-sendfile';
+    anything else serves the file from Python with Range and conditional
+    request support. For nginx, X_ACCEL_LOCATIONS maps local directories
+    to ``internal`` locations, e.g. {'documents': '/_protected/documents/'}.
+    Responses are marked private so shared caches never keep them.
+    """
+    path = os.path.abspath(path)
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    backend = app.config.get('SENDFILE_BACKEND')
+
+    response = None
+    if backend == 'x-accel-redirect':
+        for directory, location in (app.config.get('X_ACCEL_LOCATIONS') or {}).items():
+            directory = os.path.abspath(directory)
+            if path.startswith(directory + os.sep):
+                relative = os.path.relpath(path, directory).replace(os.sep, '/')
+                response = app.response_class(mimetype=mimetype)
+                response.headers['X-Accel-Redirect'] = location.rstrip('/') + '/' + relative
+                if as_attachment:
+                    response.headers.set('Content-Disposition', 'attachment', filename=download_name or os.path.basename(path))
+                break
+
+    if response is None:
+        # With USE_X_SENDFILE set (SENDFILE_BACKEND = 'x-sendfile') Flask emits
+        # the header itself and sends no body
+        response = send_file(path, mimetype=mimetype, as_attachment=as_attachment,
+                             download_name=download_name, max_age=max_age or None, conditional=True)
+
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if max_age:
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+assets = StaticAssets()
@@ -356,12 +356,20 @@ class Dashboard {
             this.charts.loanTypes.destroy();
         }
 
+        // Loan type mix from the backend rollups, with sample data as a fallback
+        const loanTypes = (data.loanTypes && data.loanTypes.length) ? data.loanTypes : [
+            { type: 'Gold Loans', percentage: 65 },
+            { type: 'Land Loans', percentage: 20 },
+            { type: 'Bond Loans', percentage: 10 },
+            { type: 'Others', percentage: 5 }
+        ];
+
         this.charts.loanTypes = new Chart(ctx, {
             type: 'doughnut',
             data: {
-                labels: ['Gold Loans', 'Land Loans', 'Bond Loans', 'Others'],
+                labels: loanTypes.map(t => t.type),
                 datasets: [{
-                    data: [65, 20, 10, 5],
+                    data: loanTypes.map(t => t.percentage),
                     backgroundColor: [
                         '#667eea',
                         '#10b981',
@@ -0,0 +1,196 @@
+"""
+Content-addressed document store for the AGV Secure application.
+
+Every stored file is named by the SHA-256 of its contents, so uploading the
+same scan twice keeps one copy. Objects live in a two-level sharded layout
+(``ab/cd/abcd...ef.jpg``) that keeps directories small, and derivatives
+(thumbnails, previews) sit next to their source as ``<sha256>_<kind>.jpg``.
+
+Rows store document references as ``documents/<sha256><ext>``; references
+are counted in the ``stored_objects`` table (see services/document_service.py)
+and ``flask documents-gc`` removes objects nothing refers to any more.
+"""
+import os
+import re
+import shutil
+import time
+import uuid
+
+_NAME = re.compile(r'^([0-9a-f]{64})(?:_[a-z]+)?\.[a-z0-9]+$')
+
+
+def object_key(name):
+    """Sharded key for an object or derivative name, e.g. ab/cd/abcd...ef.jpg."""
+    match = _NAME.match(name or '')
+    if not match:
+        raise ValueError(f"Not a stored object name: {name!r}")
+    digest = match.group(1)
+    return f"{digest[:2]}/{digest[2:4]}/{name}"
+
+
+class LocalBackend:
+    """Objects under a directory on the local filesystem (or a mounted volume)."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put_file(self, key, source_path, content_type=None):
+        """Move a finished temp file into place; the source is consumed."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(source_path, path)
+        except OSError:
+            # Temp folder on another filesystem
+            shutil.move(source_path, path)
+
+    def put_bytes(self, key, data, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique temp name: two workers may build the same derivative at once
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as output:
+            output.write(data)
+        os.replace(temp_path, path)
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def local_path(self, key):
+        """Filesystem path the web server can send directly, or None."""
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+    def url(self, key, filename=None):
+        """Direct download URL, or None when files are served by the app."""
+        return None
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_keys(self):
+        """(key, modified timestamp) of every stored object and derivative."""
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if _NAME.match(name):
+                    path = os.path.join(directory, name)
+                    yield os.path.relpath(path, self.root).replace(os.sep, '/'), os.path.getmtime(path)
+
+
+class S3Backend:
+    """Objects in an S3-compatible bucket (AWS S3, MinIO, or a local stand-in via endpoint_url)."""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, url_expiry=300):
+        import boto3  # Optional dependency, only needed for STORAGE_BACKEND=s3
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.url_expiry = url_expiry
+        self._client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put_file(self, key, source_path, content_type=None):
+        extra = {'ContentType': content_type} if content_type else None
+        # upload_file switches to multipart uploads for large files
+        self._client.upload_file(source_path, self.bucket, self.prefix + key, ExtraArgs=extra)
+        os.remove(source_path)
+
+    def put_bytes(self, key, data, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        self._client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data, **extra)
+
+    def open(self, key):
+        return self._client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body']
+
+    def local_path(self, key):
+        return None
+
+    def url(self, key, filename=None):
+        params = {'Bucket': self.bucket, 'Key': self.prefix + key}
+        if filename:
+            params['ResponseContentDisposition'] = f'inline; filename="{filename}"'
+        return self._client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.url_expiry)
+
+    def delete(self, key):
+        self._client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def iter_keys(self):
+        paginator = self._client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                key = item['Key'][len(self.prefix):]
+                if _NAME.match(key.rsplit('/', 1)[-1]):
+                    yield key, item['LastModified'].timestamp()
+
+
+class DocumentStore:
+    def __init__(self, app=None):
+        self.backend = LocalBackend('documents')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Pick the backend from STORAGE_BACKEND (local or s3)."""
+        if app.config.get('STORAGE_BACKEND', 'local') == 's3':
+            self.backend = S3Backend(
+                app.config['STORAGE_S3_BUCKET'],
+                prefix=app.config.get('STORAGE_S3_PREFIX', ''),
+                endpoint_url=app.config.get('STORAGE_S3_ENDPOINT_URL'),
+                region=app.config.get('STORAGE_S3_REGION'),
+            )
+        else:
+            self.backend = LocalBackend(app.config.get('STORAGE_PATH', 'documents'))
+
+    def exists(self, name):
+        return self.backend.exists(object_key(name))
+
+    def put_file(self, name, source_path, content_type=None):
+        """Store a temp file under ``name`` unless an identical object is already there."""
+        key = object_key(name)
+        if self.backend.exists(key):
+            os.remove(source_path)
+            return False
+        self.backend.put_file(key, source_path, content_type)
+        return True
+
+    def put_bytes(self, name, data, content_type=None):
+        self.backend.put_bytes(object_key(name), data, content_type)
+
+    def open(self, name):
+        return self.backend.open(object_key(name))
+
+    def local_path(self, name):
+        return self.backend.local_path(object_key(name))
+
+    def url(self, name, filename=None):
+        return self.backend.url(object_key(name), filename)
+
+    def delete(self, name):
+        self.backend.delete(object_key(name))
+
+    def iter_names(self, older_than=0):
+        """Names of stored objects and derivatives last written more than ``older_than`` seconds ago."""
+        cutoff = time.time() - older_than
+        for key, modified in self.backend.iter_keys():
+            if modified < cutoff:
+                yield key.rsplit('/', 1)[-1]
+
+
+store = DocumentStore()
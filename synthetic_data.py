@@ -0,0 +1,227 @@
+"""
+Deterministic synthetic data for benchmarks and load tests.
+
+generate() fills an empty database with customers, loans and payments that
+look like a branch network's book: customers sign up over the year before
+the as-of date, take one or more gold, personal or business loans, and most
+pay their instalments on time while some miss payments or stop paying.
+The same scale, seed and as-of date always produce the same rows, ids
+included, so benchmark runs on different machines or releases measure the
+same data.
+
+Rows are bulk inserted, skipping the ORM flush hooks, so the dashboard
+rollups and the customer search index are rebuilt at the end. Ledger
+accounts are left unopened, as for loans from before the ledger; run
+``flask open-loan-accounts`` to open them.
+"""
+import bisect
+import itertools
+import random
+import uuid
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func, insert, select
+
+from extensions import db
+from models import Customer, Loan, Payment, NumberSequence
+from services import finance
+from services.loan_status_service import OVERDUE_AFTER, PENDING_PERIOD
+from services.rollup_service import RollupService
+from services.search_service import CustomerSearchService
+
+# Loans generated at each scale; there is one customer for every two loans
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# Fixed default so that a scale and seed describe one dataset
+AS_OF = date(2026, 1, 1)
+
+HISTORY_DAYS = 365
+CHUNK_ROWS = 10_000
+
+FIRST_NAMES = (
+    'Aarav', 'Aditi', 'Amit', 'Ananya', 'Anil', 'Anjali', 'Arjun', 'Deepa', 'Divya', 'Ganesh',
+    'Geeta', 'Hari', 'Kavya', 'Kiran', 'Krishna', 'Lakshmi', 'Manoj', 'Meena', 'Mohan', 'Nandini',
+    'Neha', 'Pooja', 'Prakash', 'Priya', 'Rahul', 'Rajesh', 'Ramesh', 'Ravi', 'Rekha', 'Sanjay',
+    'Saraswati', 'Shankar', 'Sita', 'Sneha', 'Sunil', 'Suresh', 'Swati', 'Uma', 'Vijay', 'Vikram',
+)
+SURNAMES = (
+    'Agarwal', 'Bhat', 'Chowdhury', 'Das', 'Desai', 'Gowda', 'Gupta', 'Iyer', 'Jain', 'Joshi',
+    'Kulkarni', 'Kumar', 'Menon', 'Mishra', 'Nair', 'Naidu', 'Patel', 'Pillai', 'Rao', 'Reddy',
+    'Shah', 'Sharma', 'Shetty', 'Singh', 'Sinha', 'Srinivasan', 'Varma', 'Verma', 'Yadav',
+)
+CITIES = ('Bengaluru', 'Chennai', 'Coimbatore', 'Hyderabad', 'Madurai', 'Mysuru', 'Pune', 'Vijayawada')
+STREETS = ('MG Road', 'Gandhi Nagar', 'Temple Street', 'Market Road', 'Station Road', 'Nehru Colony')
+
+# (loan type, share of loans, principal range, (tenure months, annual rate %) options)
+LOAN_PRODUCTS = (
+    ('gold', 0.7, (10_000, 300_000), finance.GOLD_TENURE_OPTIONS),
+    ('personal', 0.2, (25_000, 500_000), ((12, 14.0), (24, 15.0), (36, 16.0))),
+    ('business', 0.1, (100_000, 2_000_000), ((12, 13.0), (24, 13.5), (36, 14.0))),
+)
+PAYMENT_METHODS = (('cash', 0.45), ('online', 0.35), ('cheque', 0.1), ('card', 0.1))
+
+_NAMESPACE = uuid.UUID('6f0f6a4e-5b7e-4f61-9d53-2a8c1c7e9b10')
+
+
+def _id(kind, seed, number):
+    # Random-looking but reproducible, so index locality matches real uuid4 keys
+    return uuid.uuid5(_NAMESPACE, f'{seed}:{kind}:{number}')
+
+
+def _choose(rng, weighted):
+    return rng.choices([value for value, _ in weighted], [weight for _, weight in weighted])[0]
+
+
+def _customer(rng, seed, number, created_at):
+    first, surname = rng.choice(FIRST_NAMES), rng.choice(SURNAMES)
+    return {
+        'id': _id('customer', seed, number),
+        'name': f'{first} {surname}',
+        'mobile': f"{rng.choice('6789')}{rng.randrange(10 ** 9):09d}",
+        'father_name': f'{rng.choice(FIRST_NAMES)} {surname}',
+        'email': f'{first}.{surname}{number}@example.com'.lower() if rng.random() < 0.5 else None,
+        'address': f'{rng.randint(1, 400)}, {rng.choice(STREETS)}, {rng.choice(CITIES)}',
+        'aadhar_number': f'{rng.randint(2, 9)}{rng.randrange(10 ** 11):011d}',
+        'pan_number': ''.join(rng.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ', k=5))
+                      + f'{rng.randrange(10 ** 4):04d}' + rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ'),
+        'created_at': created_at,
+        'updated_at': created_at,
+    }
+
+
+def _payments(rng, loan, emi, as_of, numbers):
+    """Instalment payments for one loan up to ``as_of``, following a random repayment habit."""
+    habit = rng.random()
+    stop_after = rng.randint(0, loan['tenure_months']) if habit >= 0.9 else None
+    balance = float(loan['principal_amount'])
+    rate = finance.monthly_rate(float(loan['interest_rate']))
+    payments = []
+    for month in range(1, loan['tenure_months'] + 1):
+        due = finance.maturity_date(loan['disbursed_date'], month)
+        paid_at = due + timedelta(days=rng.randint(-3, 10), minutes=rng.randrange(600))
+        if paid_at.date() >= as_of or (stop_after is not None and month > stop_after):
+            break
+        if habit >= 0.75 and rng.random() < 0.3:
+            continue
+        interest = round(balance * rate, 2)
+        principal = round(min(emi - interest, balance), 2)
+        balance -= principal
+        prefix = f"PY-{paid_at.strftime('%Y%m%d')}"
+        numbers[prefix] = numbers.get(prefix, 0) + 1
+        payments.append({
+            'id': _id('payment', loan['id'], month),
+            'loan_id': loan['id'],
+            'payment_number': f'{prefix}-{numbers[prefix]:06d}',
+            'payment_amount': round(interest + principal, 2),
+            'payment_date': paid_at,
+            'payment_method': _choose(rng, PAYMENT_METHODS),
+            'payment_status': 'failed' if rng.random() < 0.01 else 'completed',
+            'interest_amount': interest,
+            'principal_amount': principal,
+            'emi_month': month,
+            'created_at': paid_at,
+            'updated_at': paid_at,
+        })
+    return payments
+
+
+def _status(loan, payments, as_of):
+    """The status LoanStatusService would give the loan on ``as_of``."""
+    now = datetime.combine(as_of, time())
+    completed = [payment for payment in payments if payment['payment_status'] == 'completed']
+    # Only a repaid loan is completed; one past maturity with instalments missed is overdue
+    if len(completed) == loan['tenure_months']:
+        return 'completed'
+    if loan['maturity_date'] < now:
+        return 'overdue'
+    if loan['disbursed_date'] > now - PENDING_PERIOD:
+        return 'pending'
+    if loan['disbursed_date'] <= now - OVERDUE_AFTER and not any(
+            payment['payment_date'] >= now - OVERDUE_AFTER for payment in completed):
+        return 'overdue'
+    return 'active'
+
+
+def _insert(model, rows):
+    if rows:
+        db.session.execute(insert(model), rows)
+
+
+def generate(scale='10k', seed=42, as_of=AS_OF, progress=None):
+    """Fill an empty database with the ``scale`` dataset; returns the number of rows per table.
+
+    ``progress`` is called with (table, rows written so far).
+    """
+    if db.session.execute(select(func.count()).select_from(Loan)).scalar():
+        raise ValueError("The database already has loans; generate synthetic data into an empty one")
+
+    loan_count = SCALES[scale]
+    customer_count = max(1, loan_count // 2)
+    rng = random.Random(f'{seed}:{scale}:{as_of}')
+    start = datetime.combine(as_of, time()) - timedelta(days=HISTORY_DAYS)
+
+    # Customers sign up in order over the year; created_at is needed again for their loans
+    signups = sorted(rng.uniform(0, HISTORY_DAYS * 86400) for _ in range(customer_count))
+    created = [start + timedelta(seconds=offset) for offset in signups]
+    rows = []
+    for number, created_at in enumerate(created):
+        rows.append(_customer(rng, seed, number, created_at))
+        if len(rows) == CHUNK_ROWS or number == customer_count - 1:
+            _insert(Customer, rows)
+            db.session.commit()
+            rows = []
+            if progress is not None:
+                progress('customers', number + 1)
+
+    loan_numbers, payment_numbers = {}, {}
+    end = datetime.combine(as_of, time())
+    loans, payments, payment_total = [], [], 0
+    products = [(product, product[1]) for product in LOAN_PRODUCTS]
+    for number in range(loan_count):
+        loan_type, _, (low, high), options = _choose(rng, products)
+        # Disbursements spread evenly over the year, each to a customer who had signed up by then
+        disbursed = start + (end - start) * rng.random()
+        customer = rng.randrange(max(1, bisect.bisect_right(created, disbursed)))
+        disbursed = max(disbursed, created[customer])
+        tenure, rate = rng.choice(options)
+        principal = round(rng.uniform(low, high), -2)
+        prefix = f"{loan_type[0].upper()}L-{disbursed.strftime('%Y%m%d')}"
+        loan_numbers[prefix] = loan_numbers.get(prefix, 0) + 1
+        loan = {
+            'id': _id('loan', seed, number),
+            'customer_id': _id('customer', seed, customer),
+            'loan_number': f'{prefix}-{loan_numbers[prefix]:04d}',
+            'principal_amount': principal,
+            'interest_rate': rate,
+            'tenure_months': tenure,
+            'disbursed_date': disbursed,
+            'maturity_date': finance.maturity_date(disbursed, tenure),
+            'loan_type': loan_type,
+            'created_at': disbursed,
+            'updated_at': disbursed,
+        }
+        emi = round(finance.emi(principal, rate, tenure), 2)
+        loan_payments = _payments(rng, loan, emi, as_of, payment_numbers)
+        loan['status'] = _status(loan, loan_payments, as_of)
+        loans.append(loan)
+        payments.extend(loan_payments)
+
+        if len(loans) == CHUNK_ROWS or number == loan_count - 1:
+            _insert(Loan, loans)
+            _insert(Payment, payments)
+            db.session.commit()
+            payment_total += len(payments)
+            loans, payments = [], []
+            if progress is not None:
+                progress('loans', number + 1)
+
+    # Numbering continues after the generated numbers if the app is used on the data
+    _insert(NumberSequence, [
+        {'name': prefix, 'next_value': used + 1}
+        for prefix, used in itertools.chain(loan_numbers.items(), payment_numbers.items())
+    ])
+    db.session.commit()
+
+    RollupService.rebuild()
+    CustomerSearchService.rebuild_index()
+    return {'customers': customer_count, 'loans': loan_count, 'payments': payment_total}
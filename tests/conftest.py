@@ -0,0 +1,49 @@
+"""
+Shared fixtures: the app on a throwaway SQLite database and document
+store, created per test session, and a signed-in test client with the
+response cache off.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads these when config is first imported
+_data_dir = tempfile.mkdtemp(prefix='agv-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_data_dir, 'test.db')
+os.environ['STORAGE_PATH'] = os.path.join(_data_dir, 'documents')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app  # noqa: E402
+from cache import cache, NullBackend  # noqa: E402
+from extensions import db as _db  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        _db.create_all()
+    yield flask_app
+
+
+@pytest.fixture
+def db(app):
+    """A database emptied after the test."""
+    with app.app_context():
+        yield _db
+        _db.session.remove()
+        _db.drop_all()
+        _db.create_all()
+
+
+@pytest.fixture
+def client(app):
+    """A signed-in client; responses are never served from the cache."""
+    backend, cache.backend = cache.backend, NullBackend()
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['profile'] = {'name': 'Test user'}
+    yield client
+    cache.backend = backend
@@ -0,0 +1,122 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from models import AccrualRun, Customer, InterestAccrual, Loan, LoanBalance
+from services.accrual_service import AccrualService, daily_accruals
+from services.payment_service import PaymentService, loan_schedule
+
+# 12000 at 12% over 12 months: EMI 1066.19, first instalment due 2025-02-10
+DISBURSED = datetime(2025, 1, 10)
+
+
+def _columns(**overrides):
+    columns = {
+        'principal_outstanding': [12000], 'interest_rate': [12], 'amount_paid': [0],
+        'instalment_amount': [1066.19], 'amount_payable': [12794.28], 'tenure_months': [12],
+        'disbursed_date': [DISBURSED], 'next_due_date': [datetime(2025, 2, 10)],
+    }
+    columns.update({name: [value] for name, value in overrides.items()})
+    return columns
+
+
+@pytest.fixture
+def loans(db):
+    customer = Customer(name="Ravi", mobile="9876500000")
+    loans = [
+        Loan(customer=customer, loan_number=f'TL-{number:05d}', principal_amount=12000, interest_rate=12,
+             tenure_months=12, loan_type='gold', status='active',
+             disbursed_date=DISBURSED, maturity_date=datetime(2026, 1, 10))
+        for number in range(3)
+    ]
+    db.session.add_all(loans)
+    db.session.flush()
+    PaymentService.open_accounts(loans)
+    db.session.commit()
+    return loans
+
+
+def test_an_instalment_is_past_due_from_the_day_after_its_due_date():
+    on_due_date = daily_accruals(date(2025, 2, 10), _columns(), penal_rate=24)
+    day_after = daily_accruals(date(2025, 2, 11), _columns(), penal_rate=24)
+
+    assert on_due_date['days_past_due'][0] == 0
+    assert on_due_date['overdue_amount'][0] == 0
+    assert day_after['days_past_due'][0] == 1
+    assert day_after['overdue_amount'][0] == pytest.approx(1066.19)
+    assert day_after['interest'][0] == pytest.approx(round(12000 * 12 / 100 / 365, 4))
+
+
+def test_penal_interest_starts_once_the_grace_days_have_passed():
+    penal = [daily_accruals(date(2025, 2, day), _columns(), penal_rate=24, grace_days=3)['penal_interest'][0]
+             for day in (13, 14)]
+
+    assert penal == [0, pytest.approx(round(1066.19 * 24 / 100 / 365, 4))]
+
+
+def test_paid_up_and_repaid_loans_are_not_penalised():
+    # The first instalment paid on time: nothing overdue, the next one not yet due
+    paid_up = daily_accruals(date(2025, 2, 20), _columns(amount_paid=1066.19, next_due_date=datetime(2025, 3, 10)),
+                             penal_rate=24)
+    repaid = daily_accruals(date(2025, 6, 1), _columns(principal_outstanding=0, amount_paid=12794.28,
+                                                       next_due_date=None), penal_rate=24)
+
+    for accruals in (paid_up, repaid):
+        assert accruals['days_past_due'][0] == 0
+        assert accruals['penal_interest'][0] == 0
+    assert repaid['interest'][0] == 0
+
+
+def test_an_interrupted_run_resumes_after_its_checkpoint(db, loans):
+    business_date = date(2025, 2, 20)
+
+    def stop_after_first_chunk(accrued):
+        raise RuntimeError("stopped")
+
+    with pytest.raises(RuntimeError):
+        AccrualService.accrue(business_date, penal_rate=24, grace_days=3, chunk_size=1,
+                              progress=stop_after_first_chunk)
+    db.session.expire_all()
+    run = db.session.get(AccrualRun, business_date)
+    assert run.status == 'running'
+    assert run.loans_accrued == 1
+    assert run.last_loan_id == min(loan.id for loan in loans)
+
+    # Resumed with other penal terms: the run keeps the ones it started with
+    run = AccrualService.accrue(business_date, penal_rate=36, grace_days=0, chunk_size=1)
+
+    assert run.status == 'completed'
+    assert run.loans_accrued == 3
+    assert (float(run.penal_interest_rate), run.penal_grace_days) == (24, 3)
+    rows = db.session.scalars(select(InterestAccrual).where(InterestAccrual.business_date == business_date)).all()
+    assert sorted(row.loan_id for row in rows) == sorted(loan.id for loan in loans)
+    assert {row.days_past_due for row in rows} == {10}
+    assert {float(row.penal_interest) for row in rows} == {round(1066.19 * 24 / 100 / 365, 4)}
+
+
+def test_a_completed_date_is_not_accrued_twice(db, loans):
+    business_date = date(2025, 2, 20)
+    first = AccrualService.accrue(business_date, penal_rate=24)
+    totals = (first.loans_accrued, float(first.interest_total))
+
+    again = AccrualService.accrue(business_date, penal_rate=24)
+
+    assert (again.loans_accrued, float(again.interest_total)) == totals
+    assert db.session.execute(select(func.count()).select_from(InterestAccrual)).scalar() == 3
+    balance = db.session.get(LoanBalance, loans[0].id)
+    assert balance.accrued_through == business_date
+    assert float(balance.interest_accrued) == pytest.approx(round(12000 * 12 / 100 / 365, 4))
+
+
+def test_settled_accounts_accrue_nothing(db, loans):
+    _, totals = loan_schedule(loans[0])
+    PaymentService.post_many([dict(loan_id=str(loans[0].id), amount=str(totals[-1]),
+                                   payment_date=datetime(2025, 2, 1).isoformat())])
+    db.session.commit()
+
+    AccrualService.accrue(date(2025, 2, 20), penal_rate=24)
+
+    accrued = db.session.scalars(select(InterestAccrual.loan_id)).all()
+    assert loans[0].id not in accrued
+    assert len(accrued) == 2
@@ -0,0 +1,50 @@
+import asyncio
+import json
+
+import pytest
+
+from cache import cache, MemoryBackend, NullBackend
+
+
+@pytest.fixture
+def async_app(app, db):
+    async_api = pytest.importorskip('async_api')
+    backend, cache.backend = cache.backend, MemoryBackend()
+    api = async_api.AsyncApi(app)
+    api._start()
+    yield api
+    asyncio.run(api._stop())
+    cache.backend = backend
+
+
+def _get(api, path, query=b''):
+    """GET ``path`` as a signed-in user; returns (status, body)."""
+    with api.app.test_client() as client:
+        with client.session_transaction() as flask_session:
+            flask_session['profile'] = {'name': 'Test user'}
+        cookie = client.get_cookie(api.app.config.get('SESSION_COOKIE_NAME', 'session'))
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': query, 'scheme': 'http',
+        'headers': [(b'host', b'testserver'), (b'cookie', f'{cookie.key}={cookie.value}'.encode())],
+    }
+    asyncio.run(api(scope, receive, send))
+    return sent[0]['status'], sent[1]['body']
+
+
+def test_bad_cursor_is_a_400_as_on_the_flask_view(async_app, client):
+    status, body = _get(async_app, '/api/loans', b'cursor=bm90LWEtY3Vyc29y')
+
+    assert status == 400
+    assert json.loads(body) == client.get('/api/loans?cursor=bm90LWEtY3Vyc29y').get_json()
+
+
+def test_cache_is_off_without_a_shared_backend(async_app):
+    assert isinstance(cache.backend, NullBackend)
@@ -0,0 +1,35 @@
+import numpy as np
+
+from models import Customer, FingerprintTemplate
+from services.biometric_service import BiometricService, TEMPLATE_DIM, fingerprint_index
+
+
+def _template(seed):
+    return np.random.default_rng(seed).integers(-127, 128, TEMPLATE_DIM, dtype=np.int8).tobytes()
+
+
+def _enroll(db, template_id, customer):
+    db.session.add(FingerprintTemplate(id=template_id, customer_id=customer.id, finger='right_thumb',
+                                       template=_template(template_id)))
+    db.session.commit()
+
+
+def test_refresh_picks_up_a_lower_id_committed_late(app, db):
+    customers = [Customer(name=f"Ravi {number}", father_name="Suresh", mobile=f"98765{number:05d}",
+                          aadhar_number=f"1234{number:08d}", pan_number=f"ABCDE{number:04d}F")
+                 for number in range(3)]
+    db.session.add_all(customers)
+    db.session.commit()
+
+    _enroll(db, 1, customers[0])
+    # Id 3 commits while the transaction holding id 2 is still open
+    _enroll(db, 3, customers[2])
+    BiometricService.refresh_index(force=True)
+    assert len(fingerprint_index) == 2
+
+    _enroll(db, 2, customers[1])
+    BiometricService.refresh_index()
+    BiometricService.refresh_index()
+
+    assert len(fingerprint_index) == 3
+    assert fingerprint_index.search(_template(2), limit=1)[0][0] == 2
@@ -0,0 +1,66 @@
+"""Response cache: streamed responses pass through unbuffered, validated by ETag."""
+import pytest
+from flask import Response
+
+from cache import MemoryBackend, ResponseCache, cache
+from models import Customer
+
+
+def test_streamed_response_is_not_buffered_or_stored(app):
+    response_cache = ResponseCache()
+    response_cache.backend = MemoryBackend()
+    produced = []
+
+    def chunks():
+        for chunk in ('[1,', '2]'):
+            produced.append(chunk)
+            yield chunk
+
+    with app.test_request_context('/api/example'):
+        key, _ = response_cache.lookup(('loans',))
+        response = response_cache.store(key, Response(chunks(), mimetype='application/json'))
+
+        assert response.is_streamed
+        assert response.headers['ETag']
+        assert produced == []
+        assert response_cache.backend.size() == 0
+        assert response.get_data() == b'[1,2]'
+
+
+def test_plain_response_is_stored(app):
+    response_cache = ResponseCache()
+    response_cache.backend = MemoryBackend()
+
+    with app.test_request_context('/api/example'):
+        key, _ = response_cache.lookup(('loans',))
+        response_cache.store(key, Response('[1,2]', mimetype='application/json'))
+        _, cached = response_cache.lookup(('loans',))
+
+        assert cached.get_data() == b'[1,2]'
+        assert cached.mimetype == 'application/json'
+
+
+@pytest.fixture
+def cached_client(client):
+    backend, cache.backend = cache.backend, MemoryBackend()
+    yield client
+    cache.backend = backend
+
+
+def test_streamed_view_answers_a_repeat_get_with_304(db, cached_client):
+    first = cached_client.get('/api/customers/search')
+    assert first.status_code == 200
+    assert first.is_streamed
+    etag = first.headers['ETag']
+
+    repeat = cached_client.get('/api/customers/search', headers={'If-None-Match': etag})
+    assert repeat.status_code == 304
+    assert repeat.headers['ETag'] == etag
+
+    db.session.add(Customer(name="Ravi", mobile="9876500000"))
+    db.session.commit()
+
+    changed = cached_client.get('/api/customers/search', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['customers'][0]['name'] == "Ravi"
@@ -0,0 +1,54 @@
+from sqlalchemy import text
+
+from models import Customer
+from services.search_service import CustomerSearchService
+
+
+def _names(term):
+    customers, _ = CustomerSearchService.search(term)
+    return [customer.name for customer in customers]
+
+
+def test_search_survives_renumbered_customer_rowids(db):
+    CustomerSearchService.create_index()
+    db.session.add_all([Customer(name="Ravi Kumar", mobile="9876500000"),
+                        Customer(name="Sita Rao", mobile="9876500001")])
+    db.session.commit()
+
+    # What VACUUM or a table rebuild may do to a table without an INTEGER PRIMARY KEY
+    db.session.execute(text("UPDATE customers SET rowid = 1000 - rowid"))
+    db.session.commit()
+
+    assert _names("ravi") == ["Ravi Kumar"]
+    assert _names("sita") == ["Sita Rao"]
+
+
+def test_index_follows_updates_and_deletes(db):
+    CustomerSearchService.create_index()
+    ravi = Customer(name="Ravi Kumar", mobile="9876500000")
+    sita = Customer(name="Sita Rao", mobile="9876500001")
+    db.session.add_all([ravi, sita])
+    db.session.commit()
+
+    ravi.name = "Ravindra Kumar"
+    db.session.delete(sita)
+    db.session.commit()
+
+    assert _names("ravindra") == ["Ravindra Kumar"]
+    assert _names("sita") == []
+
+
+def test_rowid_keyed_index_is_replaced(db):
+    db.session.add(Customer(name="Ravi Kumar", mobile="9876500000"))
+    db.session.commit()
+    with db.engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS customer_search"))
+        connection.execute(text("DROP TABLE IF EXISTS customer_search_keys"))
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE customer_search USING fts5("
+            "name, father_name, mobile, aadhar_number, pan_number, content='customers', content_rowid='rowid')"
+        ))
+
+    CustomerSearchService.create_index()
+
+    assert _names("ravi") == ["Ravi Kumar"]
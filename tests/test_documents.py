@@ -0,0 +1,76 @@
+import io
+import os
+import time
+
+import pytest
+
+from models import Customer, StoredObject
+from services.document_service import DocumentService, _staging_dir
+from storage import store as object_store
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+def _document(content):
+    return DocumentService.store(io.BytesIO(content), 'pan', 'scan.png')
+
+
+def _refcount(db, document):
+    stored = db.session.get(StoredObject, document['sha256'])
+    return stored.refcount if stored else 0
+
+
+@pytest.fixture
+def customer(db):
+    def make(reference):
+        customer = Customer(name="Ravi", father_name="Suresh", mobile="9876500000",
+                            aadhar_number="123400000000", pan_number="ABCDE0000F", pan_photo_url=reference)
+        db.session.add(customer)
+        db.session.commit()
+        return customer
+    return make
+
+
+def test_replacing_a_document_releases_the_old_one(db, customer):
+    old, new = _document(PNG + b'old'), _document(PNG + b'new')
+    DocumentService.attach(old)
+    person = customer(old['url'])
+    assert _refcount(db, old) == 1
+
+    DocumentService.attach(new)
+    person.pan_photo_url = new['url']
+    db.session.commit()
+
+    assert _refcount(db, old) == 0
+    assert _refcount(db, new) == 1
+    DocumentService.collect_garbage(grace_seconds=0)
+    assert not object_store.exists(old['name'])
+    assert object_store.exists(new['name'])
+
+
+def test_deleting_a_customer_releases_its_documents(db, customer):
+    document = _document(PNG + b'deleted')
+    DocumentService.attach(document)
+    person = customer(document['url'])
+
+    db.session.delete(person)
+    db.session.commit()
+
+    assert _refcount(db, document) == 0
+
+
+def test_completed_upload_waiting_to_be_claimed_is_kept(db):
+    content = PNG + b'chunked'
+    upload_id = DocumentService.begin_upload('pan', 'scan.png', len(content))
+    _, document = DocumentService.append_chunk(upload_id, 0, io.BytesIO(content))
+
+    DocumentService.collect_garbage(grace_seconds=0)
+    assert object_store.exists(document['name'])
+
+    # Abandoned: collected once the claim window has passed
+    state_path = os.path.join(_staging_dir(), f"{upload_id}.json")
+    stale = time.time() - 7200
+    os.utime(state_path, (stale, stale))
+    DocumentService.collect_garbage(grace_seconds=0, unclaimed_seconds=3600)
+    assert not os.path.exists(state_path)
+    assert not object_store.exists(document['name'])
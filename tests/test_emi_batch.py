@@ -0,0 +1,72 @@
+import time
+import tracemalloc
+
+import pytest
+
+from services.batch_emi import BatchTooLarge, MAX_BATCH_SCENARIOS, prepare_inputs
+
+SCENARIOS = {
+    'principal': [1000, 25000, 99999.99, 150000, 333333.33],
+    'interest_rate': [0.5, 7.25, 12, 18.5, 36],
+    'tenure_months': [1, 6, 13, 60, 240],
+}
+
+
+def test_grid_over_the_limit_is_rejected_before_broadcasting(client):
+    values = list(range(1, 3001))
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        response = client.post('/api/calculators/emi/batch', json={
+            'principal': values, 'interest_rate': values, 'tenure_months': values, 'grid': True,
+        })
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": f"At most {MAX_BATCH_SCENARIOS} scenarios per request"}
+    # The 27 billion cell grid was never built
+    assert peak < 50 * 1024 * 1024
+    assert time.perf_counter() - started < 5
+
+
+def test_limit_counts_broadcast_scenarios():
+    with pytest.raises(BatchTooLarge):
+        prepare_inputs([1000] * 11, [12] * 10, [12], grid=True, max_scenarios=100)
+
+    principal, _, _ = prepare_inputs([1000] * 10, [12] * 10, [12], grid=True, max_scenarios=100)
+    assert principal.size == 100
+    principal, _, _ = prepare_inputs([1000] * 100, 12, 12, max_scenarios=100)
+    assert principal.size == 100
+
+
+def test_batch_matches_single_calculator_to_the_paisa(client):
+    batch = client.post('/api/calculators/emi/batch', json=dict(SCENARIOS, grid=True, include_schedule=True)).get_json()
+    offsets = batch['schedule']['offsets']
+
+    for index in range(batch['count']):
+        single = client.post('/api/calculators/emi', json={
+            'principal': batch['principal'][index],
+            'interest_rate': batch['interest_rate'][index],
+            'tenure_months': batch['tenure_months'][index],
+        }).get_json()
+
+        for field in ('emi', 'total_amount', 'total_interest'):
+            assert batch[field][index] == single[field], (field, index)
+        rows = slice(offsets[index], offsets[index + 1])
+        for field in ('principal', 'interest', 'balance'):
+            assert batch['schedule'][field][rows] == [row[field] for row in single['amortization']], (field, index)
+
+
+@pytest.mark.parametrize('field, value', [
+    ('principal', 'nan'), ('principal', 'inf'), ('interest_rate', 'nan'), ('interest_rate', '-inf'),
+])
+def test_non_finite_inputs_are_rejected(client, field, value):
+    scenarios = {'principal': [100000, 200000], 'interest_rate': [12, 12], 'tenure_months': [12, 12]}
+    scenarios[field] = [scenarios[field][0], value]
+
+    response = client.post('/api/calculators/emi/batch', json=scenarios)
+
+    assert response.status_code == 400
+    assert response.get_json()['invalid_indices'] == [1]
@@ -0,0 +1,83 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from models import Customer, LedgerEntry, Loan, LoanBalance
+from query_plans import QueryCounter
+from services.import_service import ImportService
+from services.payment_service import PaymentService
+
+
+@pytest.fixture
+def customer(db):
+    customer = Customer(name="Ravi", father_name="Suresh", mobile="9876500000",
+                        aadhar_number="123400000000", pan_number="ABCDE0000F")
+    db.session.add(customer)
+    db.session.commit()
+    return customer
+
+
+def _import_loans(tmp_path, *loan_numbers, status='active'):
+    path = tmp_path / 'loans.csv'
+    lines = ['loan_number,customer_mobile,principal_amount,interest_rate,tenure_months,disbursed_date,status']
+    lines += [f'{number},9876500000,12000,12,12,2024-01-15,{status}' for number in loan_numbers]
+    path.write_text('\n'.join(lines) + '\n')
+    return ImportService.run(str(path), 'loans')
+
+
+def test_imported_loans_get_ledger_accounts(db, customer, tmp_path):
+    summary = _import_loans(tmp_path, 'OLD-0001', 'OLD-0002')
+
+    assert summary['inserted'] == 2
+    loans = db.session.scalars(select(Loan)).all()
+    for loan in loans:
+        balance = db.session.get(LoanBalance, loan.id)
+        assert balance.principal_outstanding == Decimal('12000')
+        assert balance.next_due_date is not None
+        entry = db.session.scalars(select(LedgerEntry).where(LedgerEntry.loan_id == loan.id)).one()
+        assert entry.entry_type == 'disbursement'
+
+
+def test_completed_loans_are_imported_as_settled(db, customer, tmp_path):
+    _import_loans(tmp_path, 'OLD-0001', status='completed')
+
+    loan = db.session.scalars(select(Loan)).one()
+    balance = db.session.get(LoanBalance, loan.id)
+    assert balance.principal_outstanding == 0
+    assert balance.amount_paid == balance.amount_payable
+    assert balance.instalments_paid == 12
+    assert balance.next_due_date is None
+    entries = db.session.scalars(select(LedgerEntry).where(LedgerEntry.loan_id == loan.id)
+                                 .order_by(LedgerEntry.id)).all()
+    assert [entry.principal_balance for entry in entries] == [12000, 0]
+
+    summary = PaymentService.summary()
+    assert summary['principal_outstanding'] == 0
+    assert summary['overdue_loans'] == 0
+
+
+def test_generated_loan_numbers_the_sequences_can_still_issue_are_rejected(db, customer, tmp_path):
+    today = datetime.utcnow().strftime('%Y%m%d')
+    summary = _import_loans(tmp_path, f'GL-{today}-0001', 'GL-20200115-0001', 'OLD-0003')
+
+    assert summary['inserted'] == 2
+    assert summary['errors'][0]['row'] == 1
+    assert 'generated number' in summary['errors'][0]['error']
+    assert sorted(db.session.scalars(select(Loan.loan_number))) == ['GL-20200115-0001', 'OLD-0003']
+
+
+def test_accounts_are_opened_with_one_insert_per_batch(db, customer, tmp_path):
+    path = tmp_path / 'loans.csv'
+    path.write_text('loan_number,customer_mobile,principal_amount,interest_rate,tenure_months,status\n' + ''.join(
+        f'OLD-{number:04d},9876500000,12000,12,12,{"completed" if number % 2 else "active"}\n'
+        for number in range(100)
+    ))
+
+    with QueryCounter() as counter:
+        ImportService.run(str(path), 'loans')
+
+    statements = [str(statement) for statement in counter.statements]
+    assert sum('INSERT INTO loan_balances' in statement for statement in statements) == 1
+    assert sum('INSERT INTO loan_ledger' in statement for statement in statements) == 1
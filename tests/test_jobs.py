@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from models import Job
+from services.job_service import job_queue
+
+
+def _running_job(db, heartbeat_age, attempts=1):
+    seen = datetime.utcnow() - timedelta(seconds=heartbeat_age)
+    job = Job(kind='rebuild_rollups', status='running', attempts=attempts, started_at=seen, heartbeat_at=seen)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_jobs_of_a_dead_worker_are_requeued(db):
+    stale = _running_job(db, heartbeat_age=job_queue.lease_seconds + 60)
+    alive = _running_job(db, heartbeat_age=5)
+    exhausted = _running_job(db, heartbeat_age=job_queue.lease_seconds + 60, attempts=job_queue.max_attempts)
+
+    assert job_queue._requeue_stale() == 1
+
+    db.session.expire_all()
+    assert db.session.get(Job, stale).status == 'queued'
+    assert db.session.get(Job, alive).status == 'running'
+    assert db.session.get(Job, exhausted).status == 'failed'
+
+
+def test_a_lapsed_attempt_cannot_overwrite_its_successor(db):
+    job_id = _running_job(db, heartbeat_age=0, attempts=2)
+
+    job_queue._finish(job_id, 1, status='succeeded', result={'late': True})
+    db.session.expire_all()
+    assert db.session.get(Job, job_id).status == 'running'
+
+    job_queue._finish(job_id, 2, status='succeeded', result={})
+    db.session.expire_all()
+    assert db.session.get(Job, job_id).status == 'succeeded'
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+
+from models import Customer, Loan
+
+
+@pytest.fixture
+def loans(db):
+    customer = Customer(name="Ravi", mobile="9876500000")
+    # Only two distinct values per sort column, so most pages end inside a run of ties
+    loans = [
+        Loan(customer=customer, loan_number=f'TL-{number % 2:05d}-{number}',
+             principal_amount=12000 if number % 3 else 5000, interest_rate=12, tenure_months=12,
+             loan_type='gold', status='active',
+             disbursed_date=datetime(2026, 1, 10 if number < 4 else 20), maturity_date=datetime(2027, 1, 10))
+        for number in range(9)
+    ]
+    db.session.add_all(loans)
+    db.session.commit()
+    return loans
+
+
+def _all_pages(client, **query):
+    ids, cursor, pages = [], None, 0
+    while True:
+        params = dict(query, limit=2, **({'cursor': cursor} if cursor else {}))
+        body = client.get('/api/loans', query_string=params).get_json()
+        ids += [loan['id'] for loan in body['loans']]
+        pages += 1
+        if not body['has_more']:
+            return ids, pages
+        cursor = body['next_cursor']
+
+
+@pytest.mark.parametrize('sort', ['disbursed_date', 'principal_amount', 'loan_number'])
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_pages_follow_the_sort_with_ties_broken_by_id(client, loans, sort, order):
+    ids, pages = _all_pages(client, sort=sort, order=order)
+
+    expected = sorted(loans, key=lambda loan: (getattr(loan, sort), loan.id), reverse=order == 'desc')
+    assert ids == [str(loan.id) for loan in expected]
+    assert pages == 5
+
+
+def test_filters_apply_on_every_page(client, loans):
+    ids, _ = _all_pages(client, sort='principal_amount', q='TL-00001')
+
+    assert sorted(ids) == sorted(str(loan.id) for loan in loans if loan.loan_number.startswith('TL-00001'))
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Customer, Loan, Payment
+from services.loan_status_service import LoanStatusService
+from services.payment_service import PaymentService, loan_schedule
+
+
+@pytest.fixture
+def customer(db):
+    customer = Customer(name="Ravi", father_name="Suresh", mobile="9876500000",
+                        aadhar_number="123400000000", pan_number="ABCDE0000F")
+    db.session.add(customer)
+    db.session.commit()
+    return customer
+
+
+def _matured_loan(db, customer, number, status='active'):
+    now = datetime.utcnow()
+    loan = Loan(customer_id=customer.id, loan_number=number, principal_amount=12000, interest_rate=12,
+                tenure_months=12, loan_type='gold', status=status,
+                disbursed_date=now - timedelta(days=400), maturity_date=now - timedelta(days=35))
+    db.session.add(loan)
+    db.session.flush()
+    PaymentService.open_accounts([loan])
+    return loan
+
+
+def test_matured_loan_with_a_balance_is_overdue(db, customer):
+    loan = _matured_loan(db, customer, 'TL-00001')
+    # Paid recently, but not in full
+    db.session.add(Payment(loan_id=loan.id, payment_number='TP-00001', payment_amount=500,
+                           payment_date=datetime.utcnow() - timedelta(days=3)))
+    db.session.commit()
+
+    LoanStatusService.refresh_statuses()
+
+    db.session.refresh(loan)
+    assert loan.status == 'overdue'
+
+
+def test_repaid_loan_is_completed(db, customer):
+    loan = _matured_loan(db, customer, 'TL-00002', status='overdue')
+    _, totals = loan_schedule(loan)
+    balance = PaymentService.open_accounts([loan])[loan.id]
+    PaymentService._apply(loan, balance, Payment(loan_id=loan.id, payment_number='TP-00002',
+                                                 payment_amount=totals[-1], payment_date=datetime.utcnow()))
+    # Put the loan back as open, as if the last posting had not closed it
+    loan.status = 'overdue'
+    db.session.commit()
+
+    moved = LoanStatusService.refresh_statuses()
+
+    db.session.refresh(loan)
+    assert loan.status == 'completed'
+    assert moved['completed'] == 1
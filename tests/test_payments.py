@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from models import Customer, LedgerEntry, Loan, LoanBalance, Payment
+from services.payment_service import PaymentService, allocate, loan_schedule
+
+# 12000 at 12% over 12 months: EMI 1066.19; instalment 1 is 120.00 interest + 946.19 principal
+DISBURSED = datetime(2026, 1, 10)
+
+
+@pytest.fixture
+def loan(db):
+    customer = Customer(name="Ravi", mobile="9876500000")
+    loan = Loan(customer=customer, loan_number='TL-00001', principal_amount=12000, interest_rate=12,
+                tenure_months=12, loan_type='gold', status='active',
+                disbursed_date=DISBURSED, maturity_date=datetime(2027, 1, 10))
+    db.session.add(loan)
+    db.session.flush()
+    PaymentService.open_accounts([loan])
+    db.session.commit()
+    return loan
+
+
+def _receipt(loan, amount, days, **extra):
+    return dict(loan_id=str(loan.id), amount=str(amount),
+                payment_date=(DISBURSED + timedelta(days=days)).isoformat(), **extra)
+
+
+def test_each_instalments_interest_is_settled_before_its_principal(loan):
+    instalments, totals = loan_schedule(loan)
+
+    # Part of the first instalment's interest only
+    assert allocate(instalments, totals, Decimal('0'), Decimal('100.00')) == (Decimal('100.00'), Decimal('0'), 1)
+    # The rest of that interest, then its principal
+    assert allocate(instalments, totals, Decimal('100.00'), Decimal('966.19')) == \
+        (Decimal('20.00'), Decimal('946.19'), 1)
+    # Crossing into instalment 2 settles its interest (110.54) before any of its principal
+    assert allocate(instalments, totals, Decimal('100.00'), Decimal('1000.00')) == \
+        (Decimal('53.81'), Decimal('946.19'), 1)
+    assert allocate(instalments, totals, Decimal('1066.19'), Decimal('200.00')) == \
+        (Decimal('110.54'), Decimal('89.46'), 2)
+
+
+def test_bulk_receipts_are_allocated_in_payment_date_order(db, loan):
+    posted, rejected = PaymentService.post_many([
+        _receipt(loan, '1066.19', 60, reference_number='R-2'),
+        _receipt(loan, '1066.19', 30, reference_number='R-1'),
+    ])
+    db.session.commit()
+
+    assert rejected == []
+    by_index = {entry['index']: entry for entry in posted}
+    assert (by_index[1]['instalment'], by_index[1]['interest'], by_index[1]['principal']) == \
+        (1, Decimal('120.00'), Decimal('946.19'))
+    assert (by_index[0]['instalment'], by_index[0]['interest'], by_index[0]['principal']) == \
+        (2, Decimal('110.54'), Decimal('955.65'))
+
+    balance = db.session.get(LoanBalance, loan.id)
+    assert balance.instalments_paid == 2
+    assert balance.principal_outstanding == Decimal('12000') - Decimal('946.19') - Decimal('955.65')
+    assert balance.next_due_date == datetime(2026, 4, 10)
+
+
+def test_overpayments_and_duplicate_references_are_rejected(db, loan):
+    posted, rejected = PaymentService.post_many([
+        _receipt(loan, '500.00', 30, reference_number='R-1'),
+        _receipt(loan, '500.00', 31, reference_number='R-1'),
+        _receipt(loan, '20000.00', 32),
+    ])
+
+    assert [entry['index'] for entry in posted] == [0]
+    assert [entry['index'] for entry in rejected] == [1, 2]
+    assert 'Duplicate' in rejected[0]['error']
+    assert 'more than' in rejected[1]['error']
+
+
+def test_final_payment_settles_the_account_and_completes_the_loan(db, loan):
+    _, totals = loan_schedule(loan)
+    posted, rejected = PaymentService.post_many([_receipt(loan, totals[-1], 365)])
+    db.session.commit()
+
+    assert rejected == []
+    balance = db.session.get(LoanBalance, loan.id)
+    assert balance.principal_outstanding == 0
+    assert balance.principal_paid == Decimal('12000')
+    assert balance.next_due_date is None
+    assert db.session.get(Loan, loan.id).status == 'completed'
+    entries = db.session.scalars(select(LedgerEntry).where(LedgerEntry.loan_id == loan.id)
+                                 .order_by(LedgerEntry.id)).all()
+    assert [entry.entry_type for entry in entries] == ['disbursement', 'payment']
+    assert entries[-1].principal_balance == 0
+
+
+def test_opening_an_account_replays_earlier_payments_in_date_order(db):
+    customer = Customer(name="Sita", mobile="9876500001")
+    loan = Loan(customer=customer, loan_number='TL-00002', principal_amount=12000, interest_rate=12,
+                tenure_months=12, loan_type='gold', status='active',
+                disbursed_date=DISBURSED, maturity_date=datetime(2027, 1, 10))
+    db.session.add(loan)
+    db.session.flush()
+    # Recorded before the ledger existed, out of order
+    db.session.add_all([
+        Payment(loan_id=loan.id, payment_number='TP-2', payment_amount=Decimal('1066.19'),
+                payment_date=DISBURSED + timedelta(days=60), payment_status='completed'),
+        Payment(loan_id=loan.id, payment_number='TP-1', payment_amount=Decimal('100.00'),
+                payment_date=DISBURSED + timedelta(days=30), payment_status='completed'),
+        Payment(loan_id=loan.id, payment_number='TP-X', payment_amount=Decimal('5000.00'),
+                payment_date=DISBURSED + timedelta(days=45), payment_status='failed'),
+    ])
+    db.session.commit()
+
+    balance = PaymentService.open_accounts([loan])[loan.id]
+    db.session.commit()
+
+    assert balance.amount_paid == Decimal('1166.19')
+    first, second = sorted(db.session.scalars(select(Payment).where(Payment.payment_status == 'completed')),
+                           key=lambda payment: payment.payment_date)
+    assert (first.interest_amount, first.principal_amount, first.emi_month) == (Decimal('100.00'), 0, 1)
+    # The rest of instalment 1 (20.00 + 946.19), then 100.00 of instalment 2's interest
+    assert (second.interest_amount, second.principal_amount, second.emi_month) == \
+        (Decimal('120.00'), Decimal('946.19'), 1)
+    assert balance.instalments_paid == 1
+    assert balance.principal_outstanding == Decimal('12000') - Decimal('946.19')
@@ -0,0 +1,66 @@
+"""
+Statements each list endpoint may run per request, whatever the page size.
+An endpoint over its budget loads something row by row (an N+1 query).
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Customer, Loan, Payment
+from query_plans import QueryCounter
+
+# {term} is a customer name prefix that matches the fixtures
+QUERY_BUDGETS = {
+    '/customers': 1,
+    '/test-api/customers?per_page=100': 2,
+    '/test-api/customers?q={term}&per_page=100': 2,
+    '/test-loans/search-customer?q={term}': 1,
+    '/api/customers/search?per_page=100': 2,
+    '/api/customers/search?q={term}&per_page=100': 2,
+    '/api/loans?limit=100': 1,
+    '/api/dashboard/stats': 6,
+}
+
+
+@pytest.fixture
+def loan_book(db):
+    """Enough customers, loans and payments that a per-row query would show."""
+    now = datetime.utcnow()
+    customers = [
+        Customer(name=f"Ravi {number}", father_name="Suresh", mobile=f"98765{number:05d}",
+                 aadhar_number=f"1234{number:08d}", pan_number=f"ABCDE{number:04d}F")
+        for number in range(30)
+    ]
+    db.session.add_all(customers)
+    db.session.flush()
+    loans = [
+        Loan(customer_id=customers[number % 30].id, loan_number=f"TL-{number:05d}",
+             principal_amount=10000 + number, interest_rate=12, tenure_months=12,
+             loan_type=('gold', 'personal')[number % 2], status='active',
+             disbursed_date=now - timedelta(days=number * 10),
+             maturity_date=now - timedelta(days=number * 10) + timedelta(days=365))
+        for number in range(60)
+    ]
+    db.session.add_all(loans)
+    db.session.flush()
+    db.session.add_all(
+        Payment(loan_id=loan.id, payment_number=f"TP-{number:05d}", payment_amount=500,
+                interest_amount=100, payment_date=now)
+        for number, loan in enumerate(loans[:20])
+    )
+    db.session.commit()
+    return customers
+
+
+@pytest.mark.parametrize('url, budget', QUERY_BUDGETS.items())
+def test_query_budget(client, loan_book, url, budget):
+    url = url.format(term='Rav')
+    # Warm up first so one-time work (e.g. creating the search index) is not counted
+    client.get(url, buffered=True)
+
+    with QueryCounter() as counter:
+        # Buffered, so streamed bodies run their queries inside the block
+        response = client.get(url, buffered=True)
+
+    assert response.status_code == 200
+    assert counter.count <= budget, "\n".join([f"{counter.count} statements, budget {budget}:"] + counter.statements)
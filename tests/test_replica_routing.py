@@ -0,0 +1,33 @@
+from flask import g, session as flask_session
+from sqlalchemy import select
+
+from database import LAST_WRITE_KEY
+from models import Customer
+
+
+def _reads_from_replica(db):
+    g.db_use_replica = True
+    return db.session()._reads_from_replica(select(Customer))
+
+
+def test_writes_pin_only_the_writers_reads_to_the_primary(app, db):
+    # Each request gets an app context (and so a g) of its own, as in the server
+    with app.app_context(), app.test_request_context('/customers', method='POST'):
+        db.session.add(Customer(name="Ravi", mobile="9876500000"))
+        db.session.commit()
+        last_write = flask_session[LAST_WRITE_KEY]
+        # The rest of the writing request reads from the primary too
+        assert not _reads_from_replica(db)
+
+    with app.app_context(), app.test_request_context('/api/customers/search'):
+        # Another user's request
+        assert _reads_from_replica(db)
+
+    with app.app_context(), app.test_request_context('/api/customers/search'):
+        # The writer's next request, carrying their session cookie
+        flask_session[LAST_WRITE_KEY] = last_write
+        assert not _reads_from_replica(db)
+
+    with app.app_context(), app.test_request_context('/api/customers/search'):
+        flask_session[LAST_WRITE_KEY] = last_write - app.config['DATABASE_REPLICA_LAG'] - 1
+        assert _reads_from_replica(db)
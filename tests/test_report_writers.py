@@ -0,0 +1,20 @@
+import csv
+
+from services.report_writers import CsvReportWriter
+
+
+def test_csv_cells_that_would_run_as_formulas_are_quoted(tmp_path):
+    path = tmp_path / 'report.csv'
+    writer = CsvReportWriter(str(path), ['name', 'address', 'amount'])
+    writer.write_row(['=HYPERLINK("http://x")', '@SUM(A1)', -1500.5])
+    writer.write_row(['+91 98765', '-2+3', 0])
+    writer.write_row(['Ravi Kumar', 'MG Road', 1500])
+    writer.close()
+
+    with open(path, newline='', encoding='utf-8') as handle:
+        rows = list(csv.reader(handle))
+    assert rows[1:] == [
+        ["'=HYPERLINK(\"http://x\")", "'@SUM(A1)", '-1500.5'],
+        ["'+91 98765", "'-2+3", '0'],
+        ['Ravi Kumar', 'MG Road', '1500'],
+    ]
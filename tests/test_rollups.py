@@ -0,0 +1,93 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from models import Customer, Loan, Payment, StatsRollup
+from services.rollup_service import ALL_TIME, COUNTERS, RollupService
+
+
+@pytest.fixture
+def book(db):
+    customer = Customer(name="Ravi", mobile="9876500000", created_at=datetime(2026, 8, 3))
+    gold = Loan(customer=customer, loan_number='TL-00001', principal_amount=12000, interest_rate=12,
+                tenure_months=12, loan_type='gold', status='active',
+                disbursed_date=datetime(2026, 8, 5), maturity_date=datetime(2027, 8, 5))
+    personal = Loan(customer=customer, loan_number='TL-00002', principal_amount=5000, interest_rate=18,
+                    tenure_months=6, loan_type='personal', status='active',
+                    disbursed_date=datetime(2026, 8, 20), maturity_date=datetime(2027, 2, 20))
+    payments = [
+        Payment(loan=gold, payment_number=f'TP-{number}', payment_amount=Decimal('1066.19'),
+                interest_amount=Decimal('120.00'), payment_date=datetime(2026, 9, day))
+        for number, day in ((1, 5), (2, 10))
+    ]
+    db.session.add_all([gold, personal, *payments])
+    db.session.commit()
+    return gold, personal, payments
+
+
+def _rollups(db):
+    """{(granularity, period_start, loan_type): counters} for every row with a non-zero counter."""
+    rows = {}
+    for row in db.session.scalars(select(StatsRollup)):
+        counters = {name: Decimal(str(getattr(row, name))) for name in COUNTERS}
+        if any(counters.values()):
+            rows[(row.granularity, row.period_start, row.loan_type)] = counters
+    return rows
+
+
+def _assert_matches_rebuild(db):
+    incremental = _rollups(db)
+    RollupService.rebuild()
+    assert incremental == _rollups(db)
+
+
+def test_inserts_add_to_day_month_and_running_totals(db, book):
+    rows = _rollups(db)
+
+    assert rows[('day', date(2026, 8, 5), 'gold')]['disbursed_amount'] == 12000
+    assert rows[('month', date(2026, 9, 1), 'gold')]['payments_count'] == 2
+    assert rows[('all', ALL_TIME, 'gold')]['interest_collected'] == Decimal('240.00')
+    assert rows[('all', ALL_TIME, '')]['new_customers'] == 1
+    _assert_matches_rebuild(db)
+
+
+def test_updates_move_amounts_between_periods(db, book):
+    gold, personal, payments = book
+    personal.disbursed_date = datetime(2026, 9, 1)
+    personal.principal_amount = 8000
+    payments[0].payment_amount = Decimal('500.00')
+    payments[1].payment_status = 'failed'
+    db.session.commit()
+
+    rows = _rollups(db)
+    assert ('month', date(2026, 8, 1), 'personal') not in rows
+    assert rows[('month', date(2026, 9, 1), 'personal')]['disbursed_amount'] == 8000
+    assert rows[('all', ALL_TIME, 'gold')]['payments_amount'] == Decimal('500.00')
+    assert rows[('all', ALL_TIME, 'gold')]['payments_count'] == 1
+    _assert_matches_rebuild(db)
+
+
+def test_a_loan_type_change_moves_the_loan(db, book):
+    gold, _, _ = book
+    gold.loan_type = 'business'
+    db.session.commit()
+
+    rows = _rollups(db)
+    assert rows[('all', ALL_TIME, 'business')]['loans_disbursed'] == 1
+    assert rows[('all', ALL_TIME, 'gold')]['loans_disbursed'] == 0
+    # Its payments stay under the type they were posted with until rebuild()
+    assert rows[('all', ALL_TIME, 'gold')]['payments_count'] == 2
+
+
+def test_deletes_take_their_contribution_back_out(db, book):
+    gold, personal, payments = book
+    db.session.delete(payments[0])
+    db.session.delete(personal)
+    db.session.commit()
+
+    rows = _rollups(db)
+    assert rows[('all', ALL_TIME, 'gold')]['payments_amount'] == Decimal('1066.19')
+    assert not any(loan_type == 'personal' for _, _, loan_type in rows)
+    _assert_matches_rebuild(db)
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import select
+
+from models import NumberSequence
+from sequences import NumberSequences, issuable
+
+
+def _workers(count, block_size):
+    workers = [NumberSequences() for _ in range(count)]
+    for worker in workers:
+        worker.block_size = block_size
+    return workers
+
+
+def test_workers_reserve_disjoint_blocks(db):
+    first, second = _workers(2, block_size=5)
+
+    taken = first.take('GL-20261017', 3) + second.take('GL-20261017', 3) + first.take('GL-20261017', 4)
+
+    # The first worker finishes its block before reserving a new one
+    assert taken == [1, 2, 3, 6, 7, 8, 4, 5, 11, 12]
+    assert db.session.scalar(select(NumberSequence.next_value).where(NumberSequence.name == 'GL-20261017')) == 16
+
+
+def test_a_request_larger_than_a_block_reserves_it_whole(db):
+    worker, = _workers(1, block_size=5)
+
+    assert worker.take('PY-20261017', 12) == list(range(1, 13))
+    assert worker.take('PY-20261017') == [13]
+
+
+def test_concurrent_workers_never_hand_out_a_value_twice(app, db):
+    workers = _workers(4, block_size=3)
+
+    def take_many(worker):
+        with app.app_context():
+            return [value for _ in range(10) for value in worker.take('GL-20261017', 2)]
+
+    with ThreadPoolExecutor(max_workers=len(workers)) as pool:
+        taken = [value for values in pool.map(take_many, workers) for value in values]
+
+    assert len(taken) == len(set(taken)) == 80
+
+
+def test_sequences_are_kept_per_prefix(db):
+    worker, = _workers(1, block_size=5)
+
+    assert worker.loan_number('gold', datetime(2026, 10, 17)) == 'GL-20261017-0001'
+    assert worker.loan_number('gold', datetime(2026, 10, 18)) == 'GL-20261018-0001'
+    assert worker.payment_numbers(datetime(2026, 10, 17), 2) == ['PY-20261017-000001', 'PY-20261017-000002']
+
+
+def test_only_numbers_of_today_or_later_are_issuable():
+    today = datetime(2026, 10, 17)
+
+    assert issuable('GL-20261017-0001', today)
+    assert issuable('PL-20261120-0001', today)
+    assert not issuable('GL-20261016-0001', today)
+    assert not issuable('OLD-0001', today)
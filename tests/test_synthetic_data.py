@@ -0,0 +1,28 @@
+from datetime import date, datetime, timedelta
+
+from synthetic_data import _status
+
+AS_OF = date(2026, 1, 1)
+
+
+def _loan(disbursed, tenure_months=6):
+    return {'disbursed_date': disbursed, 'maturity_date': disbursed + timedelta(days=31 * tenure_months),
+            'tenure_months': tenure_months}
+
+
+def _paid(count, last_paid):
+    return [{'payment_status': 'completed', 'payment_date': last_paid - timedelta(days=30 * n)}
+            for n in range(count)]
+
+
+def test_matured_loan_with_missed_instalments_is_overdue():
+    loan = _loan(datetime(2025, 3, 1))
+
+    assert _status(loan, _paid(5, datetime(2025, 12, 20)), AS_OF) == 'overdue'
+
+
+def test_only_a_fully_paid_loan_is_completed():
+    loan = _loan(datetime(2025, 3, 1))
+
+    assert _status(loan, _paid(6, datetime(2025, 9, 1)), AS_OF) == 'completed'
+    assert _status(_loan(datetime(2025, 9, 1)), _paid(3, datetime(2025, 12, 1)), AS_OF) == 'active'